@@ -0,0 +1,59 @@
+from typing import Any, Optional, Sequence
+
+from fastapi import HTTPException, Query, Response
+
+from app.core.database import unit_of_work
+from app.utils.pagination import (
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    next_after_id,
+)
+
+MAX_PAGE_SIZE = 10000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """Параметры keyset-страницы: after_id или cursor, и limit.
+
+    Без параметров эндпоинт отдаёт все строки, как раньше. Токен следующей
+    страницы возвращается в заголовке X-Next-Cursor.
+    """
+
+    def __init__(
+        self,
+        after_id: Optional[int] = Query(None, ge=0),
+        cursor: Optional[str] = None,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        if cursor is not None:
+            try:
+                after_id = decode_cursor(cursor)
+            except InvalidCursor:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        self.after_id = after_id
+        self.limit = limit
+
+    def paginate(
+        self,
+        response: Response,
+        rows: Sequence[Any],
+        key: str = "user_id",
+        tiebreak: Optional[str] = None,
+    ) -> Sequence[Any]:
+        after_id = next_after_id(rows, key, self.limit, tiebreak)
+        if after_id is not None:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(after_id)
+        return rows
+
+
+async def request_unit_of_work():
+    """Зависимость приложения: один connection и один commit на запрос.
+
+    Объявлена async, чтобы контекст с единицей работы видели и async-, и
+    синхронные эндпоинты. Выход из зависимости (commit или откат)
+    происходит до отправки ответа.
+    """
+    with unit_of_work():
+        yield
@@ -1,11 +1,13 @@
-from typing import Dict, List
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
 
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from app.crud import db_broadcasts as broadcasts_crud
+from app.core.config import LoggingRoute
+from app.crud.aio import db_broadcasts as broadcasts_crud
 
-router = APIRouter()
+router = APIRouter(route_class=LoggingRoute)
 
 
 class BroadcastCreate(BaseModel):
@@ -17,6 +19,17 @@ class BroadcastMark(BaseModel):
     broadcast_name: str
 
 
+class BroadcastEvent(BaseModel):
+    user_id: int
+    broadcast_name: str
+    status: Literal["delivered", "failed"]
+    timestamp: Optional[datetime] = None
+
+
+class BroadcastEventsBatch(BaseModel):
+    events: List[BroadcastEvent] = Field(..., max_length=10000)
+
+
 class BroadcastStatistics(BaseModel):
     date: str
     delivered: int
@@ -31,7 +44,7 @@ class AllBroadcastsStatistics(BaseModel):
 @router.post("/create", response_model=dict)
 async def create_broadcast(broadcast: BroadcastCreate):
     try:
-        broadcasts_crud.create_broadcast(broadcast.broadcast_name)
+        await broadcasts_crud.create_broadcast(broadcast.broadcast_name)
         return {
             "message": f"Рассылка {broadcast.broadcast_name} успешно создана"
         }
@@ -44,7 +57,7 @@ async def create_broadcast(broadcast: BroadcastCreate):
 @router.post("/mark_delivered", response_model=dict)
 async def mark_broadcast_delivered(broadcast_mark: BroadcastMark):
     try:
-        broadcasts_crud.mark_broadcast_delivered(
+        await broadcasts_crud.mark_broadcast_delivered(
             broadcast_mark.user_id, broadcast_mark.broadcast_name
         )
         return {
@@ -60,7 +73,7 @@ async def mark_broadcast_delivered(broadcast_mark: BroadcastMark):
 @router.post("/mark_failed", response_model=dict)
 async def mark_broadcast_failed(broadcast_mark: BroadcastMark):
     try:
-        broadcasts_crud.mark_broadcast_failed(
+        await broadcasts_crud.mark_broadcast_failed(
             broadcast_mark.user_id, broadcast_mark.broadcast_name
         )
         return {
@@ -73,12 +86,30 @@ async def mark_broadcast_failed(broadcast_mark: BroadcastMark):
         )
 
 
+@router.post("/events", response_model=dict)
+async def record_broadcast_events(batch: BroadcastEventsBatch):
+    recorded = await broadcasts_crud.record_broadcast_events(
+        [
+            (
+                event.user_id,
+                event.broadcast_name,
+                event.status,
+                event.timestamp,
+            )
+            for event in batch.events
+        ]
+    )
+    return {"recorded": recorded}
+
+
 @router.get(
     "/statistics/{broadcast_name}", response_model=List[BroadcastStatistics]
 )
 async def get_broadcast_statistics(broadcast_name: str):
     try:
-        statistics = broadcasts_crud.get_broadcast_statistics(broadcast_name)
+        statistics = await broadcasts_crud.get_broadcast_statistics(
+            broadcast_name
+        )
         return [
             BroadcastStatistics(
                 date=str(date), delivered=delivered, failed=failed
@@ -95,17 +126,17 @@ async def get_broadcast_statistics(broadcast_name: str):
 @router.get("/statistics", response_model=List[AllBroadcastsStatistics])
 async def get_all_broadcasts_statistics():
     try:
-        statistics, columns = broadcasts_crud.get_all_broadcasts_statistics()
-        result = []
-        for row in statistics:
-            date = str(row[0])
-            stats = {}
-            for i, col in enumerate(columns):
-                delivered = row[i * 2 + 1]
-                failed = row[i * 2 + 2]
-                stats[col] = {"delivered": delivered, "failed": failed}
-            result.append(AllBroadcastsStatistics(date=date, statistics=stats))
-        return result
+        statistics = await broadcasts_crud.get_all_broadcasts_statistics()
+        by_date = {}
+        for date, broadcast_name, delivered, failed in statistics:
+            by_date.setdefault(str(date), {})[broadcast_name] = {
+                "delivered": delivered,
+                "failed": failed,
+            }
+        return [
+            AllBroadcastsStatistics(date=date, statistics=stats)
+            for date, stats in by_date.items()
+        ]
     except Exception as e:
         raise HTTPException(
             status_code=400,
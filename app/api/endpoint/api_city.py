@@ -1,19 +1,20 @@
 from typing import Any, List
 
-from fastapi import APIRouter, Body, HTTPException
+from fastapi import APIRouter, Body, Depends, HTTPException, Response
 
+from app.api.dependencies import PageParams
+from app.core.config import LoggingRoute
+from app.crud import aio
 from app.crud import db_city as cities_crud
-from app.crud import db_loyalty as loyalty_crud
-from app.crud import db_user as user_crud
 from app.schemas.sh_city import CityTransaction
 
-router = APIRouter()
+router = APIRouter(route_class=LoggingRoute)
 
 
 @router.post("/users", response_model=dict)
 async def add_user_to_city(user_id: int = Body(..., embed=True)):
-    if cities_crud.is_first_time_in_city(user_id):
-        cities_crud.add_user_to_city_table(user_id)
+    if await aio.db_city.is_first_time_in_city(user_id):
+        await aio.db_city.add_user_to_city_table(user_id)
         return {"message": "User added to city table successfully"}
     else:
         raise HTTPException(
@@ -23,67 +24,69 @@ async def add_user_to_city(user_id: int = Body(..., embed=True)):
 
 @router.put("/free_try/{user_id}", response_model=dict)
 async def use_free_try(user_id: int):
-    cities_crud.set_free_try_used(user_id)
+    await aio.db_city.set_free_try_used(user_id)
     return {"message": "Free try used successfully"}
 
 
 @router.get("/all-users-free-try", response_model=dict)
-async def get_all_users_free_try(all: bool = False):
-    users = user_crud.get_all_users()
-    for user in users:
-        if cities_crud.is_first_time_in_city(user["user_id"]):
-            cities_crud.add_user_to_city_table(user["user_id"])
-
-    users = cities_crud.get_all_city_users_and_free_tries(all)
+async def get_all_users_free_try(
+    response: Response, all: bool = False, page: PageParams = Depends()
+):
+    if page.after_id is None:
+        await aio.db_city.add_all_users_to_city_table()
+    users = await aio.db_city.get_all_city_users_and_free_tries(
+        all, page.after_id, page.limit
+    )
+    page.paginate(response, users)
     return {"users": [dict(user) for user in users]}
     # return {"message": "Free try used successfully"}
 
 
 @router.put("/request-recived/{user_id}", response_model=dict)
 async def set_request_recived(user_id: int):
-    cities_crud.set_recive_request(user_id)
+    await aio.db_city.set_recive_request(user_id)
     return {"message": "Successfully"}
 
 
 @router.put("/set-user-answer/{user_id}", response_model=dict)
 async def set_user_answer(user_id: int, answer: dict[str, Any] = Body(...)):
-    cities_crud.set_answer(user_id, answer["answer"])
+    await aio.db_city.set_answer(user_id, answer["answer"])
     return {"message": "Successfully"}
 
 
 @router.get("/all-answers", response_model=dict)
 async def get_all_answers():
-    return cities_crud.get_all_answers()
+    return await aio.db_city.get_all_answers()
     # return {"message": "Free try used successfully"}
 
 
 @router.get("/has_free_try/{user_id}", response_model=bool)
 async def check_free_try(user_id: int):
-    return cities_crud.has_free_try(user_id)
+    return await aio.db_city.has_free_try(user_id)
 
 
 @router.put("/unlimited_compatibility/{user_id}", response_model=dict)
 async def set_unlimited_compatibility(user_id: int):
-    cities_crud.set_unlimited_city_compatibility(user_id)
+    await aio.db_city.set_unlimited_city_compatibility(user_id)
     return {"message": "Unlimited city compatibility set successfully"}
 
 
 @router.get("/has_unlimited_compatibility/{user_id}", response_model=bool)
 async def check_unlimited_compatibility(user_id: int):
-    return cities_crud.has_unlimited_city_compatibility(user_id)
+    return await aio.db_city.has_unlimited_city_compatibility(user_id)
 
 
 @router.post("/checked_cities", response_model=dict)
 async def add_checked_city(
     user_id: int = Body(...), city_name: str = Body(...)
 ):
-    cities_crud.add_checked_city(user_id, city_name)
+    await aio.db_city.add_checked_city(user_id, city_name)
     return {"message": "Checked city added successfully"}
 
 
 @router.get("/checked_cities/{user_id}", response_model=List[str])
 async def get_checked_cities(user_id: int):
-    return cities_crud.get_checked_cities(user_id)
+    return await aio.db_city.get_checked_cities(user_id)
 
 
 @router.post("/transactions", response_model=int)
@@ -95,9 +98,9 @@ async def create_city_transaction(
     service: str = Body(embed=True, default=""),
 ):
     if type == "city":
-        return cities_crud.record_city_transaction(user_id, amount)
+        return await aio.db_city.record_city_transaction(user_id, amount)
     else:
-        return loyalty_crud.record_pre_transaction(
+        return await aio.db_loyalty.record_pre_transaction(
             user_id, amount, bonus, service
         )
 
@@ -114,7 +117,7 @@ async def create_city_transaction(
 @router.get("/transactions/last")
 async def get_last_transaction_id():
     try:
-        last_id = await cities_crud.get_last_transaction_id_from_db()
+        last_id = await aio.db_city.get_last_transaction_id_from_db()
         return {"last_transaction_id": last_id}
     except Exception as e:
         raise HTTPException(
@@ -124,12 +127,12 @@ async def get_last_transaction_id():
 
 @router.get("/transactions/{user_id}", response_model=List[CityTransaction])
 async def get_user_transactions(user_id: int, limit: int = 5):
-    return cities_crud.get_user_city_transactions(user_id, limit)
+    return await aio.db_city.get_user_city_transactions(user_id, limit)
 
 
 @router.get("/free_tries_left/{user_id}", response_model=int)
 async def get_free_tries_left(user_id: int):
-    return cities_crud.get_free_tries_left(user_id)
+    return await aio.db_city.get_free_tries_left(user_id)
 
 
 @router.get("/first_time/{user_id}", response_model=bool)
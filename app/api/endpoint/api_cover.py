@@ -2,9 +2,10 @@ from datetime import datetime
 
 from fastapi import APIRouter, Body, Query
 
+from app.core.config import LoggingRoute
 from app.crud import db_cover as covers_crud
 
-router = APIRouter()
+router = APIRouter(route_class=LoggingRoute)
 
 
 @router.post("/init_db")
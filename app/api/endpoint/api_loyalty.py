@@ -2,10 +2,12 @@ from typing import List, Optional
 
 from fastapi import APIRouter, Body, HTTPException, Query
 
+from app.core.config import LoggingRoute
 from app.crud import db_loyalty as loyalty_crud
+from app.crud import db_points as points_crud
 from app.schemas.sh_loyalty import LoyaltyCreate, LoyaltyStats, Transaction
 
-router = APIRouter()
+router = APIRouter(route_class=LoggingRoute)
 
 
 @router.post("/users/", response_model=dict)
@@ -82,7 +84,10 @@ def use_promo_code(
 
 @router.put("/users/{user_id}/deduct_points", response_model=dict)
 def deduct_points(user_id: int, points: int):
-    success, new_balance = loyalty_crud.deduct_points(user_id, points)
+    try:
+        success, new_balance = loyalty_crud.deduct_points(user_id, points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if success:
         return {
             "message": "Points deducted successfully",
@@ -98,6 +103,36 @@ def check_balance(user_id: int, points: int):
     return {"sufficient": sufficient, "current_balance": current_balance}
 
 
+@router.post("/users/{user_id}/holds", response_model=dict)
+def hold_points(
+    user_id: int, points: int, ttl_seconds: Optional[float] = None
+):
+    try:
+        hold_id, balance = points_crud.hold_points(
+            user_id, points, ttl_seconds
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if hold_id is None:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+    return {"hold_id": hold_id, "new_balance": balance}
+
+
+@router.post("/holds/{hold_id}/confirm", response_model=dict)
+def confirm_hold(hold_id: int):
+    if not points_crud.confirm_hold(hold_id):
+        raise HTTPException(status_code=409, detail="Hold is not active")
+    return {"message": "Hold confirmed"}
+
+
+@router.post("/holds/{hold_id}/release", response_model=dict)
+def release_hold(hold_id: int):
+    balance = points_crud.release_hold(hold_id)
+    if balance is None:
+        raise HTTPException(status_code=409, detail="Hold is not active")
+    return {"message": "Hold released", "new_balance": balance}
+
+
 @router.get("/users/{user_id}/referrer", response_model=Optional[int])
 def get_referrer_id(user_id: int):
     return loyalty_crud.get_referrer_id(user_id)
@@ -1,69 +1,153 @@
 from datetime import datetime
+from typing import List
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Body, Depends, HTTPException, Response
 
-from app.crud import db_scheduler
+from app.api.dependencies import PageParams
+from app.core.config import LoggingRoute
+from app.crud.aio import db_scheduler
+from app.scheduler import job_scheduler
 
-router = APIRouter()
+router = APIRouter(route_class=LoggingRoute)
 
 
 @router.get("/forecast_users/{current_month}")
-async def get_forecast_users(current_month: str):
-    return db_scheduler.get_forecast_users(current_month)
+async def get_forecast_users(
+    current_month: str, response: Response, page: PageParams = Depends()
+):
+    try:
+        users = await db_scheduler.get_forecast_users(
+            current_month, page.after_id, page.limit
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Unknown month")
+    return page.paginate(response, users)
 
 
 @router.put("/update_forecast_status/{user_id}/{column_name}")
 async def update_forecast_status(user_id: int, column_name: str):
-    db_scheduler.update_forecast_status(user_id, column_name)
+    try:
+        await db_scheduler.update_forecast_status(user_id, column_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"status": "success"}
 
 
+@router.put("/update_forecast_status_batch/{column_name}")
+async def update_forecast_status_batch(
+    column_name: str, user_ids: List[int] = Body(..., embed=True)
+):
+    try:
+        results = await db_scheduler.update_forecast_status_batch(
+            user_ids, column_name
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "results": results}
+
+
 @router.put("/reset_forecast_reminder")
 async def reset_forecast_reminder():
-    db_scheduler.reset_forecast_reminder()
+    await db_scheduler.reset_forecast_reminder()
     return {"status": "success"}
 
 
 @router.get("/gift_users")
-async def get_gift_users():
-    return db_scheduler.get_gift_users()
+async def get_gift_users(response: Response, page: PageParams = Depends()):
+    users = await db_scheduler.get_gift_users(page.after_id, page.limit)
+    return page.paginate(response, users, tiebreak="id")
 
 
 @router.put("/update_gift_status/{user_id}")
 async def update_gift_status(user_id: int):
-    db_scheduler.update_gift_status(user_id)
+    await db_scheduler.update_gift_status(user_id)
     return {"status": "success"}
 
 
+@router.put("/update_gift_status_batch")
+async def update_gift_status_batch(
+    user_ids: List[int] = Body(..., embed=True)
+):
+    results = await db_scheduler.update_gift_status_batch(user_ids)
+    return {"status": "success", "results": results}
+
+
 @router.get("/expired_bonuses")
 async def get_expired_bonuses():
-    return db_scheduler.get_expired_bonuses()
+    return await db_scheduler.get_expired_bonuses()
 
 
 @router.get("/spent_bonus/{user_id}")
 async def get_spent_bonus(user_id: int, add_date: str, expire_date: str):
     add_date = datetime.strptime(add_date, "%Y-%m-%d %H:%M:%S")
     expire_date = datetime.strptime(expire_date, "%Y-%m-%d %H:%M:%S")
-    return db_scheduler.get_spent_bonus(user_id, add_date, expire_date)
+    return await db_scheduler.get_spent_bonus(user_id, add_date, expire_date)
 
 
 @router.put("/update_bonus_burned_status/{bonus_id}")
 async def update_bonus_burned_status(bonus_id: int):
-    db_scheduler.update_bonus_burned_status(bonus_id)
+    await db_scheduler.update_bonus_burned_status(bonus_id)
     return {"status": "success"}
 
 
+@router.put("/update_bonus_burned_status_batch")
+async def update_bonus_burned_status_batch(
+    bonus_ids: List[int] = Body(..., embed=True)
+):
+    results = await db_scheduler.update_bonus_burned_status_batch(bonus_ids)
+    return {"status": "success", "results": results}
+
+
+@router.post("/burn_expired_bonuses")
+async def burn_expired_bonuses():
+    summary = await db_scheduler.burn_expired_bonuses()
+    return {"status": "success", **summary}
+
+
+@router.get("/jobs")
+async def get_jobs():
+    return {
+        "leader": job_scheduler.is_leader,
+        "jobs": await job_scheduler.get_jobs(),
+    }
+
+
+@router.post("/jobs/{name}/run")
+async def run_job(name: str):
+    if name not in job_scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    status = await job_scheduler.run_job(name)
+    if status is None:
+        raise HTTPException(
+            status_code=409, detail="Scheduler lock is held by another worker"
+        )
+    return {"status": status}
+
+
 @router.get("/users_for_useful_message")
 async def get_users_for_useful_message():
-    return db_scheduler.get_users_for_useful_message()
+    return await db_scheduler.get_users_for_useful_message()
 
 
 @router.put("/update_useful_sent_status/{user_id}")
 async def update_useful_sent_status(user_id: int):
-    db_scheduler.update_useful_sent_status(user_id)
+    await db_scheduler.update_useful_sent_status(user_id)
     return {"status": "success"}
 
 
+@router.put("/update_useful_sent_status_batch")
+async def update_useful_sent_status_batch(
+    user_ids: List[int] = Body(..., embed=True)
+):
+    results = await db_scheduler.update_useful_sent_status_batch(user_ids)
+    return {"status": "success", "results": results}
+
+
 @router.get("/not-in-forecast")
-async def get_users_not_in_forecast():
-    return db_scheduler.get_users_not_in_forecasts()
+async def get_users_not_in_forecast(
+    response: Response, page: PageParams = Depends()
+):
+    users = await db_scheduler.get_users_not_in_forecasts(
+        page.after_id, page.limit
+    )
+    return page.paginate(response, users)
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, Body, HTTPException, Query
 
+from app.core.config import LoggingRoute
+from app.core.database import get_pool_stats
 from app.crud import db_stat as statistics_crud
+from app.crud.db_cover import arcan_descriptions_cache
+from app.crud.db_payment import processed_invoices
+from app.crud.db_user import user_profiles
 from app.schemas.sh_stat import (
     FormattedStatisticsResponse,
     StatisticsResponse,
 )
 
-router = APIRouter()
+router = APIRouter(route_class=LoggingRoute)
 
 
 @router.get("/", response_model=StatisticsResponse)
@@ -58,3 +63,18 @@ def set_important_mes_id(
 def update_stat_every_day():
     statistics_crud.clean_stat_and_put_today_date()
     return {"status": 200}
+
+
+@router.get("/db-pool", response_model=dict)
+def get_db_pool_stats():
+    return {"status": 200, "pool": get_pool_stats()}
+
+
+@router.get("/cache", response_model=dict)
+def get_cache_stats():
+    return {
+        "status": 200,
+        "arcan_descriptions": arcan_descriptions_cache.stats(),
+        "user_profiles": user_profiles.stats(),
+        "processed_invoices": processed_invoices.stats(),
+    }
@@ -1,18 +1,23 @@
-from typing import List
+import csv
+import io
+import json
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Body, HTTPException
+from fastapi import APIRouter, Body, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
+from app.core.config import LoggingRoute
+from app.crud import aio
 from app.crud import db_user as users_crud
 from app.crud.db_loyalty import add_user_to_loyalty
-from app.crud.db_scheduler import get_unique_users_coun
 from app.schemas.sh_user import User, UserBasic, UserCreate
 
-router = APIRouter()
+router = APIRouter(route_class=LoggingRoute)
 
 
 from fastapi import APIRouter
 
-router = APIRouter()
+router = APIRouter(route_class=LoggingRoute)
 
 
 @router.post("/", response_model=dict)
@@ -28,7 +33,7 @@ def create_user(user: UserCreate = Body(...)):
 
 @router.get("/all", response_model=List[UserBasic])
 async def get_all_users():
-    users = users_crud.get_all_users()
+    users = await aio.db_user.get_all_users()
     result = []
     for user in users:
         try:
@@ -40,22 +45,57 @@ async def get_all_users():
 
 @router.get("/unique-users-count")
 async def get_unique_users_count():
-    count = get_unique_users_coun()
+    count = await aio.db_scheduler.get_unique_users_coun()
     return count
 
 
 @router.get("/all_users_list", response_model=List[UserBasic])
 async def get_all_users_list_endpoint():
-    users = users_crud.get_all_users_list()
+    users = await aio.db_user.get_all_users_list()
     return [UserBasic(**user) for user in users]
 
 
 @router.get("/all_users", response_model=List[UserBasic])
 async def get_all_users_endpoint():
-    users = users_crud.get_all_users()
+    users = await aio.db_user.get_all_users()
     return [UserBasic(**user) for user in users]
 
 
+EXPORT_FIELDS = ("user_id", "chat_id", "username")
+
+
+def _ndjson_lines(users):
+    for user in users:
+        yield json.dumps(user, ensure_ascii=False) + "\n"
+
+
+def _csv_lines(users):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for user in users:
+        writer.writerow(user)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+@router.get("/export")
+def export_users(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    after_id: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    chunk_size: int = Query(1000, ge=1, le=10000),
+):
+    # Потоковая выгрузка: рассыльщик начинает работу до загрузки всего списка
+    users = users_crud.iter_users(after_id, limit, chunk_size)
+    if format == "csv":
+        return StreamingResponse(_csv_lines(users), media_type="text/csv")
+    return StreamingResponse(
+        _ndjson_lines(users), media_type="application/x-ndjson"
+    )
+
+
 @router.get("/gift_dates", response_model=List[dict])
 def get_gift_dates():
     return users_crud.get_gift_date()
@@ -106,12 +146,37 @@ def get_user(user_id: int):
     return User(**user)
 
 
+@router.get("/{user_id}/profile", response_model=dict)
+def get_user_profile(user_id: int):
+    profile = users_crud.get_user_profile(user_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return profile
+
+
+@router.get("/{user_id}/snapshot", response_model=dict)
+async def get_user_snapshot(
+    user_id: int,
+    # Разделы или поля через запятую: "loyalty,city.have_pay"
+    fields: Optional[str] = None,
+):
+    try:
+        snapshot = await aio.db_snapshot.get_user_snapshot(
+            user_id, fields.split(",") if fields else None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return snapshot
+
+
 @router.put("/{chat_id}/birth_date", response_model=dict)
 async def update_birth_date(
     chat_id: int, birth_date: str = Body(..., embed=True)
 ):
     try:
-        users_crud.set_birth_date(chat_id, birth_date)
+        await aio.db_user.set_birth_date(chat_id, birth_date)
         return {"message": "Birth date updated successfully"}
     except Exception as e:
         raise HTTPException(
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Отличает «в кэше лежит None» от «ключа нет в кэше»
+MISSING = object()
+
+# Именованные кэши, которые сбрасываются во всех воркерах
+# (app.crud.db_cache): имя -> кэш этого процесса
+shared_caches: Dict[str, "Cache"] = {}
+
+
+class Cache:
+    """Потокобезопасный in-process кэш с TTL и LRU-вытеснением.
+
+    ttl=None — записи не устаревают, maxsize=None — размер не ограничен.
+    Кэш с name регистрируется в shared_caches, и его сбросы доходят до
+    других воркеров через журнал cache_invalidations.
+    Счётчики hits/misses показываются в /api/statistics/cache.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        maxsize: Optional[int] = None,
+        name: Optional[str] = None,
+    ):
+        self.name = name
+        if name is not None:
+            shared_caches[name] = self
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "evictions": 0,
+        }
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.metrics["hits"] += 1
+                    return value
+                del self._data[key]
+            self.metrics["misses"] += 1
+            return MISSING
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while self.maxsize is not None and len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.metrics["evictions"] += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.metrics["invalidations"] += 1
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]):
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+                self.metrics["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["size"] = len(self._data)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = (
+            round(stats["hits"] / lookups, 4) if lookups else None
+        )
+        return stats
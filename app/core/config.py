@@ -1,12 +1,21 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import threading
 import time
+from contextvars import ContextVar
 from functools import wraps
 
 # from re import DEBUG
-from typing import Callable
+from typing import Callable, Optional
 
 from fastapi import Request, Response
+from fastapi.exceptions import RequestValidationError
 from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -20,6 +29,62 @@ class Settings(BaseSettings):
     ROBOKASSA_TEST_PASSWORD2: str
     SECRET_WORD: str
 
+    DATABASE_PATH: str = "new_database.db"
+    DB_POOL_SIZE: int = 8
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_HEALTH_CHECK_INTERVAL: float = 60.0
+
+    # Профиль движка SQLite, применяется к каждому соединению пула
+    DB_JOURNAL_MODE: str = "WAL"
+    DB_SYNCHRONOUS: str = "NORMAL"
+    DB_MMAP_SIZE: int = 256 * 1024 * 1024
+    DB_CACHE_SIZE: int = -64000
+    DB_BUSY_TIMEOUT_MS: int = 5000
+    DB_TEMP_STORE: str = "MEMORY"
+
+    # Сколько номеров счетов процесс резервирует за одно обращение к базе
+    INVOICE_ID_BLOCK_SIZE: int = 1
+
+    # Время жизни кэша описаний арканов, секунды
+    ARCAN_DESCRIPTION_CACHE_TTL: float = 600.0
+    # LRU-кэш строк users для частых проверок флагов пользователя
+    USER_PROFILE_CACHE_SIZE: int = 10000
+    USER_PROFILE_CACHE_TTL: float = 60.0
+    # Как часто воркер дочитывает журнал сбросов кэшей других воркеров,
+    # секунды, и сколько последних записей журнала хранится в базе
+    CACHE_SYNC_INTERVAL: float = 1.0
+    CACHE_INVALIDATION_LOG_SIZE: int = 10000
+    # Сколько последних проведённых InvId помнить в памяти
+    PROCESSED_INVOICE_CACHE_SIZE: int = 10000
+    # Буфер счётчиков stat: сброс в базу раз в N мс или каждые N событий
+    STAT_FLUSH_INTERVAL_MS: int = 1000
+    STAT_FLUSH_MAX_EVENTS: int = 500
+    # Сколько живёт резерв баллов при оформлении заказа, секунды
+    POINTS_HOLD_TTL: float = 900.0
+    # Встроенный планировщик (app.scheduler). Выключен, пока бот сам
+    # дёргает эндпоинты периодических задач, иначе они выполнятся дважды
+    SCHEDULER_ENABLED: bool = False
+    SCHEDULER_TIMEZONE: str = "Europe/Moscow"
+    # Разброс запуска, секунды: воркеры не бьются за блокировку разом
+    SCHEDULER_JITTER: int = 30
+    # Насколько опоздавший запуск ещё выполняется, секунды
+    SCHEDULER_MISFIRE_GRACE: int = 6 * 3600
+    # Аренда блокировки планировщика: только один воркер выполняет задачи
+    SCHEDULER_LEASE_SECONDS: int = 60
+    # Как часто ожидающий читатель ленты оплаченных задач перечитывает
+    # базу: задачи, записанные другим воркером, приходят с такой задержкой
+    PAID_TASKS_POLL_INTERVAL: float = 1.0
+
+    LOG_LEVEL: str = "INFO"
+    LOG_FILE: str = "app.log"
+    # "text" или "json" (по записи JSON на строку) для файла логов
+    LOG_FORMAT: str = "text"
+    LOG_MAX_BYTES: int = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT: int = 5
+    # Доля вызовов CRUD, которые пишутся в лог с длительностью (0 — никакие);
+    # полная картина — в гистограммах /metrics
+    DB_LOG_SAMPLE_RATE: float = 0.0
+
     model_config = SettingsConfigDict(env_file=".env", extra="allow")
 
     @property
@@ -43,20 +108,73 @@ settings = Settings()
 DEBUG = settings.DEBUG
 from colorlog import ColoredFormatter
 
+from app.core.metrics import db_metrics
+
+# Атрибуты, которые есть у любой LogRecord; всё остальное пришло в extra
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной JSON-строкой, поля из extra — на верхнем уровне."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestTimings:
+    """Время и число CRUD-вызовов в рамках одного запроса API."""
+
+    def __init__(self):
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self.db_calls += 1
+            self.db_seconds += seconds
+
+
+_request_timings: ContextVar[Optional["RequestTimings"]] = ContextVar(
+    "request_timings", default=None
+)
+# Глубина вложенных CRUD-вызовов в потоке: в RequestTimings идут только
+# внешние, иначе время вложенных посчиталось бы дважды
+_db_call_depth = threading.local()
+
 
 class CustomLogger:
     def __init__(self):
         self.logger = logging.getLogger("custom_logger")
-        self.logger.setLevel(logging.DEBUG)
+        self.logger.setLevel(settings.LOG_LEVEL)
 
         # Форматтер для файлового хендлера (без цветов)
         file_formatter = logging.Formatter(
             "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
         )
 
-        file_handler = logging.FileHandler("app.log")
-        file_handler.setFormatter(file_formatter)
-        self.logger.addHandler(file_handler)
+        file_handler = logging.handlers.RotatingFileHandler(
+            settings.LOG_FILE,
+            maxBytes=settings.LOG_MAX_BYTES,
+            backupCount=settings.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+        file_handler.setFormatter(
+            JsonFormatter()
+            if settings.LOG_FORMAT == "json"
+            else file_formatter
+        )
 
         # Цветной форматтер для консольного вывода
         console_formatter = ColoredFormatter(
@@ -74,57 +192,90 @@ class CustomLogger:
 
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(console_formatter)
-        self.logger.addHandler(console_handler)
+
+        # Запись в файл и консоль — в отдельном потоке: вызывающий код
+        # только кладёт запись в очередь
+        log_queue = queue.SimpleQueue()
+        self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        self.listener = logging.handlers.QueueListener(
+            log_queue,
+            file_handler,
+            console_handler,
+            respect_handler_level=True,
+        )
+        self.listener.start()
+        atexit.register(self.listener.stop)
 
     def log_db_operation(self, func: Callable) -> Callable:
+        # Каждый вызов попадает в гистограмму db_metrics (/metrics), в лог —
+        # только ошибки и выборка DB_LOG_SAMPLE_RATE
+        name = func.__name__
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
-            if not DEBUG:
-                self.logger.info(f"Starting DB operation: {func.__name__}")
+            depth = getattr(_db_call_depth, "value", 0)
+            _db_call_depth.value = depth + 1
+            start_time = time.perf_counter()
+            error = False
             try:
-                result = func(*args, **kwargs)
-                if not DEBUG:
-                    self.logger.info(
-                        f"DB operation {func.__name__} completed successfully"
-                    )
-                return result
+                return func(*args, **kwargs)
             except Exception as e:
-                self.logger.error(
-                    f"DB operation {func.__name__} failed: {str(e)}"
-                )
+                error = True
+                self.logger.error(f"DB operation {name} failed: {str(e)}")
                 raise
             finally:
-                end_time = time.time()
-                if not DEBUG:
+                elapsed = time.perf_counter() - start_time
+                _db_call_depth.value = depth
+                db_metrics.observe(name, elapsed, error)
+                timings = _request_timings.get()
+                if timings is not None and depth == 0:
+                    timings.add(elapsed)
+                if settings.DB_LOG_SAMPLE_RATE and (
+                    random.random() < settings.DB_LOG_SAMPLE_RATE
+                ):
                     self.logger.info(
-                        f"DB operation {func.__name__} took {end_time - start_time:.2f} seconds"
+                        f"DB operation {name} took {elapsed * 1000:.3f} ms"
                     )
 
         return wrapper
 
     def log_endpoint(self, func: Callable) -> Callable:
+        # Одна запись на запрос; время запроса и CRUD-вызовов — полями
+        # записи (в JSON-формате они попадают в лог как есть)
         @wraps(func)
         async def wrapper(request: Request, *args, **kwargs):
-            start_time = time.time()
-            self.logger.info(
-                f"Received {request.method} request for {request.url.path}"
-            )
+            timings = RequestTimings()
+            token = _request_timings.set(timings)
+            start_time = time.perf_counter()
+            fields = {"method": request.method, "path": request.url.path}
             try:
                 response = await func(request, *args, **kwargs)
-                self.logger.info(
-                    f"Request to {request.url.path} completed successfully"
-                )
+                fields["status"] = response.status_code
                 return response
+            except HTTPException as e:
+                fields["status"] = e.status_code
+                raise
+            except RequestValidationError:
+                fields["status"] = 422
+                raise
             except Exception as e:
-                self.logger.error(
-                    f"Request to {request.url.path} failed: {str(e)}"
-                )
+                fields["error"] = str(e)
                 raise
             finally:
-                end_time = time.time()
-                self.logger.info(
-                    f"Request to {request.url.path} took {end_time - start_time:.2f} seconds"
+                _request_timings.reset(token)
+                fields["duration_ms"] = round(
+                    (time.perf_counter() - start_time) * 1000, 3
+                )
+                fields["db_calls"] = timings.db_calls
+                fields["db_ms"] = round(timings.db_seconds * 1000, 3)
+                level = logging.ERROR if "error" in fields else logging.INFO
+                self.logger.log(
+                    level,
+                    f"{request.method} {request.url.path} "
+                    f"{fields.get('status', 'error')} "
+                    f"{fields['duration_ms']} ms "
+                    f"(db: {timings.db_calls} calls, {fields['db_ms']} ms)",
+                    extra=fields,
                 )
 
         return wrapper
@@ -135,15 +286,7 @@ custom_logger = CustomLogger()
 
 class LoggingRoute(APIRoute):
     def get_route_handler(self) -> Callable:
-        original_route_handler = super().get_route_handler()
-
-        @wraps(original_route_handler)
-        async def custom_route_handler(request: Request) -> Response:
-            return await custom_logger.log_endpoint(original_route_handler)(
-                request
-            )
-
-        return custom_route_handler
+        return custom_logger.log_endpoint(super().get_route_handler())
 
 
 # class CustomLogger:
@@ -1,14 +1,415 @@
+import asyncio
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from functools import partial
+from queue import Empty, LifoQueue
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-DATABASE_PATH = "new_database.db"
+from app.core.config import settings
+
+DATABASE_PATH = settings.DATABASE_PATH
+
+# PRAGMA, действующие только в пределах соединения: выставляются при каждом
+# подключении. journal_mode хранится в самом файле базы и включается один раз
+# в init_db через apply_engine_profile(conn, persistent=True).
+ENGINE_PRAGMAS = {
+    "synchronous": settings.DB_SYNCHRONOUS,
+    "mmap_size": settings.DB_MMAP_SIZE,
+    "cache_size": settings.DB_CACHE_SIZE,
+    "busy_timeout": settings.DB_BUSY_TIMEOUT_MS,
+    "temp_store": settings.DB_TEMP_STORE,
+}
+
+
+def apply_engine_profile(conn: sqlite3.Connection, persistent: bool = False):
+    cursor = conn.cursor()
+    if persistent:
+        cursor.execute(f"PRAGMA journal_mode = {settings.DB_JOURNAL_MODE}")
+    for name, value in ENGINE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений SQLite.
+
+    Соединения создаются лениво (не больше ``size``), после использования
+    возвращаются в пул и переиспользуются. Перед выдачей соединение,
+    простоявшее дольше ``health_check_interval`` секунд, проверяется
+    запросом ``SELECT 1`` и пересоздаётся, если оно сломано.
+    """
+
+    def __init__(
+        self,
+        database: str,
+        size: int = 8,
+        timeout: float = 30.0,
+        health_check_interval: float = 60.0,
+        pragmas: Optional[Dict[str, object]] = None,
+    ):
+        self.database = database
+        self.pragmas = pragmas or {}
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle: LifoQueue = LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._last_used: Dict[int, float] = {}
+        self._closed = False
+        self._metrics = {
+            "created": 0,
+            "reused": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "health_checks": 0,
+            "discarded": 0,
+            "in_use": 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.database, timeout=self.timeout, check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        self._bump("created")
+        return conn
+
+    def _bump(self, name: str, value: int = 1):
+        with self._lock:
+            self._metrics[name] += value
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0)
+        if idle_for < self.health_check_interval:
+            return True
+        self._bump("health_checks")
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection):
+        self._last_used.pop(id(conn), None)
+        self._bump("discarded")
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise PoolTimeout("Connection pool is closed")
+        if not self._slots.acquire(blocking=False):
+            self._bump("waits")
+            if not self._slots.acquire(timeout=self.timeout):
+                self._bump("timeouts")
+                raise PoolTimeout(
+                    f"No free database connection after {self.timeout} seconds"
+                )
+        try:
+            conn = self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+        self._bump("checkouts")
+        self._bump("in_use")
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                return self._connect()
+            if self._is_healthy(conn):
+                self._bump("reused")
+                return conn
+            self._discard(conn)
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._idle.put(conn)
+        except sqlite3.Error:
+            self._discard(conn)
+        finally:
+            self._bump("in_use", -1)
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except Empty:
+                break
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["size"] = self.size
+        stats["idle"] = self._idle.qsize()
+        return stats
+
+
+pool = ConnectionPool(
+    DATABASE_PATH,
+    size=settings.DB_POOL_SIZE,
+    timeout=settings.DB_POOL_TIMEOUT,
+    health_check_interval=settings.DB_POOL_HEALTH_CHECK_INTERVAL,
+    pragmas=ENGINE_PRAGMAS,
+)
+
+# Соединение, уже выданное текущему потоку / asyncio-задаче. Вложенные вызовы
+# get_db_connection() получают то же соединение, а не берут новое из пула.
+_current_connection: ContextVar[Optional[sqlite3.Connection]] = ContextVar(
+    "current_db_connection", default=None
+)
+
+
+# Колбэки on_commit() для соединения, взятого get_db_connection() из пула
+# без транзакции: (соединение, колбэки)
+_commit_callbacks: ContextVar[
+    Optional[Tuple[sqlite3.Connection, List[Callable[[], Any]]]]
+] = ContextVar("db_commit_callbacks", default=None)
 
 
 @contextmanager
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = _current_connection.get()
+    if conn is not None:
+        yield conn
+        return
+
+    unit = _current_unit.get()
+    if unit is not None and not unit.closed:
+        yield unit.connection()
+        return
+
+    conn = pool.acquire()
+    callbacks: List[Callable[[], Any]] = []
+    token = _current_connection.set(conn)
+    callbacks_token = _commit_callbacks.set((conn, callbacks))
     try:
         yield conn
     finally:
-        conn.close()
+        _commit_callbacks.reset(callbacks_token)
+        _current_connection.reset(token)
+        # Незафиксированные изменения pool.release() откатит
+        committed = not conn.in_transaction
+        pool.release(conn)
+        if committed:
+            _run_callbacks(callbacks)
+
+
+def _run_callbacks(callbacks: List[Callable[[], Any]]):
+    for callback in callbacks:
+        callback()
+
+
+def on_commit(conn, callback: Callable[[], Any]):
+    """Выполняет callback после commit изменений, сделанных через conn.
+
+    При откате callback не выполняется. Внутри transaction() и единицы
+    работы — после их commit, для соединения из get_db_connection() — при
+    выходе из блока, если всё зафиксировано.
+    """
+    if isinstance(conn, TransactionConnection):
+        conn.callbacks.append(callback)
+        return
+    pending = _commit_callbacks.get()
+    if pending is not None and pending[0] is conn:
+        pending[1].append(callback)
+    else:
+        callback()
+
+
+class TransactionConnection:
+    """Соединение внутри transaction().
+
+    commit() вложенных CRUD-функций откладывается до выхода из блока,
+    rollback() помечает всю транзакцию на откат. callbacks (on_commit)
+    выполняются после настоящего commit.
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self.rollback_only = False
+        self.callbacks: List[Callable[[], Any]] = []
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rollback_only = True
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+
+class TransactionRolledBack(Exception):
+    pass
+
+
+@contextmanager
+def transaction():
+    """Один commit на все вложенные вызовы get_db_connection().
+
+    Если вложенная функция вызвала rollback(), блок откатывается целиком
+    и поднимает TransactionRolledBack.
+    """
+    current = _current_connection.get()
+    if isinstance(current, TransactionConnection):
+        yield current
+        return
+
+    with get_db_connection() as conn:
+        tx = TransactionConnection(conn)
+        token = _current_connection.set(tx)
+        try:
+            yield tx
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            if tx.rollback_only:
+                conn.rollback()
+                # Вызывающий не должен принять откат за успешную запись
+                raise TransactionRolledBack(
+                    "Transaction was rolled back by a nested rollback()"
+                )
+            else:
+                conn.commit()
+                # Внутри единицы работы commit ещё впереди
+                for callback in tx.callbacks:
+                    on_commit(conn, callback)
+        finally:
+            _current_connection.reset(token)
+
+
+class UnitOfWork:
+    """Единица работы запроса API: одно соединение и не больше одного commit.
+
+    Соединение берётся из пула при первом обращении к базе и общее для всех
+    потоков запроса (run_db копирует контекст). commit() CRUD-функций
+    откладывается до close(), как в transaction().
+    """
+
+    def __init__(self):
+        self._conn: Optional[sqlite3.Connection] = None
+        self._tx: Optional[TransactionConnection] = None
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def connection(self) -> TransactionConnection:
+        with self._lock:
+            if self._tx is None:
+                self._conn = pool.acquire()
+                self._tx = TransactionConnection(self._conn)
+            return self._tx
+
+    def close(self, commit: bool = True):
+        with self._lock:
+            self.closed = True
+            conn, tx = self._conn, self._tx
+            self._conn = self._tx = None
+        if conn is None:
+            return
+        committed = False
+        try:
+            if commit and not tx.rollback_only:
+                conn.commit()
+                committed = True
+            else:
+                conn.rollback()
+        finally:
+            pool.release(conn)
+        if committed:
+            _run_callbacks(tx.callbacks)
+
+
+_current_unit: ContextVar[Optional[UnitOfWork]] = ContextVar(
+    "current_unit_of_work", default=None
+)
+
+
+@contextmanager
+def unit_of_work():
+    """Все get_db_connection() внутри блока делят одно соединение.
+
+    Commit один, при выходе без исключения; при исключении — откат.
+    Код, выполняющийся после закрытия (тело StreamingResponse, фоновые
+    задачи), снова берёт соединения из пула.
+    """
+    unit = UnitOfWork()
+    token = _current_unit.set(unit)
+    try:
+        yield unit
+    except BaseException:
+        unit.close(commit=False)
+        raise
+    else:
+        unit.close()
+    finally:
+        _current_unit.reset(token)
+
+
+@contextmanager
+def outside_unit_of_work():
+    """get_db_connection() внутри блока берёт своё соединение из пула.
+
+    Для записей, которые не должны ждать commit запроса и откатываться
+    вместе с ним, и для долгих ожиданий, которые не должны держать
+    соединение единицы работы.
+    """
+    unit_token = _current_unit.set(None)
+    conn_token = _current_connection.set(None)
+    try:
+        yield
+    finally:
+        _current_connection.reset(conn_token)
+        _current_unit.reset(unit_token)
+
+
+def get_pool_stats() -> Dict[str, int]:
+    return pool.stats()
+
+
+# Отдельный пул потоков для блокирующих вызовов sqlite3 из async-эндпоинтов:
+# event loop uvicorn не ждёт завершения запроса к базе.
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_POOL_SIZE, thread_name_prefix="db"
+)
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    context = copy_context()
+    return await loop.run_in_executor(
+        db_executor, partial(context.run, func, *args, **kwargs)
+    )
@@ -0,0 +1,147 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence
+
+# Границы корзин гистограммы, секунды: от 50 мкс до 5 с
+LATENCY_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+
+class LatencyHistogram:
+    """Гистограмма длительностей с фиксированными корзинами.
+
+    Последняя корзина — всё, что дольше LATENCY_BUCKETS[-1] (+Inf).
+    Не потокобезопасна сама по себе, защищается замком реестра.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float, error: bool = False):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if error:
+            self.errors += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля по верхней границе корзины."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total * 1000, 3),
+            "avg_ms": (
+                round(self.total / self.count * 1000, 3)
+                if self.count
+                else None
+            ),
+            "max_ms": round(self.max * 1000, 3),
+            "p50_ms": _to_ms(self.quantile(0.5)),
+            "p99_ms": _to_ms(self.quantile(0.99)),
+        }
+
+
+def _to_ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class MetricsRegistry:
+    """Счётчики и гистограммы длительностей по именам операций."""
+
+    def __init__(self, metric: str, label: str):
+        self.metric = metric
+        self.label = label
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.observe(seconds, error)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                name: histogram.snapshot()
+                for name, histogram in sorted(self._histograms.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render_prometheus(self) -> List[str]:
+        """Строки в текстовом формате Prometheus.
+
+        Все сэмплы семейства идут подряд под его строкой # TYPE.
+        """
+        metric = self.metric
+        with self._lock:
+            items = [
+                (f'{self.label}="{name}"', histogram)
+                for name, histogram in sorted(self._histograms.items())
+            ]
+            lines = [f"# TYPE {metric}_seconds histogram"]
+            for label, histogram in items:
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{metric}_seconds_bucket{{{label},le="{bound}"}} '
+                        f"{cumulative}"
+                    )
+                lines.append(
+                    f'{metric}_seconds_bucket{{{label},le="+Inf"}} '
+                    f"{histogram.count}"
+                )
+                lines.append(
+                    f"{metric}_seconds_sum{{{label}}} {histogram.total:.6f}"
+                )
+                lines.append(
+                    f"{metric}_seconds_count{{{label}}} {histogram.count}"
+                )
+            lines.append(f"# TYPE {metric}_errors_total counter")
+            for label, histogram in items:
+                lines.append(
+                    f"{metric}_errors_total{{{label}}} {histogram.errors}"
+                )
+        return lines
+
+
+db_metrics = MetricsRegistry("db_operation", "operation")
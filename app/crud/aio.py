@@ -0,0 +1,63 @@
+"""Awaitable-версии CRUD-функций для async-эндпоинтов.
+
+    from app.crud.aio import db_city as cities_crud
+
+    last_id = await cities_crud.get_last_transaction_id_from_db()
+
+Каждый вызов выполняется в db_executor, поэтому медленный запрос к SQLite
+не блокирует event loop.
+"""
+
+from functools import wraps
+from types import ModuleType
+
+from app.core.database import run_db
+from app.crud import db_broadcasts as _db_broadcasts
+from app.crud import db_cache as _db_cache
+from app.crud import db_city as _db_city
+from app.crud import db_competition as _db_competition
+from app.crud import db_cover as _db_cover
+from app.crud import db_forecast as _db_forecast
+from app.crud import db_jobs as _db_jobs
+from app.crud import db_loyalty as _db_loyalty
+from app.crud import db_paid_tasks as _db_paid_tasks
+from app.crud import db_payment as _db_payment
+from app.crud import db_points as _db_points
+from app.crud import db_scheduler as _db_scheduler
+from app.crud import db_snapshot as _db_snapshot
+from app.crud import db_stat as _db_stat
+from app.crud import db_user as _db_user
+
+
+class AsyncCrud:
+    def __init__(self, module: ModuleType):
+        self._module = module
+
+    def __getattr__(self, name: str):
+        func = getattr(self._module, name)
+        if not callable(func):
+            return func
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await run_db(func, *args, **kwargs)
+
+        setattr(self, name, wrapper)
+        return wrapper
+
+
+db_broadcasts = AsyncCrud(_db_broadcasts)
+db_cache = AsyncCrud(_db_cache)
+db_city = AsyncCrud(_db_city)
+db_competition = AsyncCrud(_db_competition)
+db_cover = AsyncCrud(_db_cover)
+db_forecast = AsyncCrud(_db_forecast)
+db_jobs = AsyncCrud(_db_jobs)
+db_loyalty = AsyncCrud(_db_loyalty)
+db_paid_tasks = AsyncCrud(_db_paid_tasks)
+db_payment = AsyncCrud(_db_payment)
+db_points = AsyncCrud(_db_points)
+db_scheduler = AsyncCrud(_db_scheduler)
+db_snapshot = AsyncCrud(_db_snapshot)
+db_stat = AsyncCrud(_db_stat)
+db_user = AsyncCrud(_db_user)
@@ -1,74 +1,221 @@
 # from venv import logger
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
 from app.core.config import custom_logger
 from app.core.database import get_db_connection
 
+DELIVERED = "delivered"
+FAILED = "failed"
+
+# (user_id, broadcast_name, status, timestamp)
+BroadcastEvent = Tuple[int, str, str, Optional[datetime]]
+
 
 @custom_logger.log_db_operation
 def create_broadcast(broadcast_name: str):
+    # Отдельная колонка на рассылку больше не нужна: доставка пишется
+    # в broadcast_events, а имя рассылки — в реестр broadcast_names
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            f"ALTER TABLE broadcasts ADD COLUMN {broadcast_name} BOOLEAN"
-        )
+        row = conn.execute(
+            """
+            INSERT INTO broadcast_names (name, created_at) VALUES (?, ?)
+            ON CONFLICT (name) DO NOTHING
+            RETURNING name
+            """,
+            (broadcast_name, datetime.now()),
+        ).fetchone()
         conn.commit()
+    if row is None:
+        raise ValueError(f"Broadcast {broadcast_name} already exists")
+
+
+# Итоговый статус пользователя меняется, только если пришёл другой статус
+# не раньше текущего: повтор того же статуса не сдвигает день доставки
+_UPSERT_STATUS = """
+    ON CONFLICT (broadcast, user_id) DO UPDATE SET
+        status = excluded.status,
+        updated_at = excluded.updated_at
+    WHERE excluded.status != broadcast_statuses.status
+        AND excluded.updated_at >= COALESCE(broadcast_statuses.updated_at, '')
+"""
+
+# Дневные счётчики по итоговым статусам: пользователь учтён ровно один раз,
+# в дне своего последнего статуса. День '' — статус без даты (старая
+# таблица broadcasts без created_at).
+_STATUS_DELTA = """
+    INSERT INTO broadcast_daily_stats (broadcast, day, delivered, failed)
+    VALUES (
+        {row}.broadcast,
+        COALESCE(date({row}.updated_at), ''),
+        {sign}({row}.status = 'delivered'),
+        {sign}({row}.status = 'failed')
+    )
+    ON CONFLICT (broadcast, day) DO UPDATE SET
+        delivered = delivered + excluded.delivered,
+        failed = failed + excluded.failed;
+"""
+
+
+def _status_triggers() -> Dict[str, str]:
+    added = _STATUS_DELTA.format(row="NEW", sign="")
+    removed = _STATUS_DELTA.format(row="OLD", sign="-")
+    return {
+        "trg_broadcast_statuses_insert": (
+            f"AFTER INSERT ON broadcast_statuses BEGIN {added} END"
+        ),
+        "trg_broadcast_statuses_delete": (
+            f"AFTER DELETE ON broadcast_statuses BEGIN {removed} END"
+        ),
+        "trg_broadcast_statuses_update": (
+            "AFTER UPDATE OF status, updated_at ON broadcast_statuses "
+            f"BEGIN {removed} {added} END"
+        ),
+    }
+
+
+BROADCAST_STATUS_TRIGGERS = _status_triggers()
 
 
 @custom_logger.log_db_operation
-def mark_broadcast_delivered(user_id: int, broadcast_name: str):
+def record_broadcast_events(events: Iterable[BroadcastEvent]) -> int:
+    """Добавляет пакет событий доставки одной транзакцией.
+
+    Событие пишется в журнал broadcast_events и обновляет итоговый статус
+    пользователя в broadcast_statuses; дневные счётчики
+    broadcast_daily_stats ведут триггеры на broadcast_statuses.
+    """
+    rows = []
+    now = datetime.now()
+    for user_id, broadcast_name, status, event_at in events:
+        if status not in (DELIVERED, FAILED):
+            raise ValueError(f"Unknown broadcast status: {status}")
+        rows.append((broadcast_name, user_id, status, event_at or now))
+    # В пакете события одного пользователя применяются по времени
+    rows.sort(key=lambda row: row[3])
+
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            f"""
-            INSERT INTO broadcasts (user_id, {broadcast_name})
-            VALUES (?, TRUE)
-            ON CONFLICT (user_id) DO UPDATE SET {broadcast_name} = TRUE
+        cursor.executemany(
+            """
+            INSERT OR IGNORE INTO broadcast_names (name, created_at)
+            VALUES (?, ?)
             """,
-            (user_id,),
+            [(name, now) for name in {row[0] for row in rows}],
+        )
+        cursor.executemany(
+            """
+            INSERT INTO broadcast_events (broadcast, user_id, status, event_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            rows,
+        )
+        cursor.executemany(
+            """
+            INSERT INTO broadcast_statuses
+                (broadcast, user_id, status, updated_at)
+            VALUES (?, ?, ?, ?)
+            """
+            + _UPSERT_STATUS,
+            rows,
         )
         conn.commit()
+    return len(rows)
+
+
+def _legacy_broadcast_statuses(cursor):
+    """Статусы из старой таблицы broadcasts: колонка на рассылку."""
+    cursor.execute("PRAGMA table_info(broadcasts)")
+    columns = {column[1] for column in cursor.fetchall()}
+    updated_at = "created_at" if "created_at" in columns else "NULL"
+    for name in sorted(columns - {"id", "user_id", "created_at"}):
+        cursor.execute(
+            f"""
+            INSERT INTO broadcast_statuses
+                (broadcast, user_id, status, updated_at)
+            SELECT
+                ?,
+                user_id,
+                CASE WHEN "{name}" THEN 'delivered' ELSE 'failed' END,
+                {updated_at}
+            FROM broadcasts
+            WHERE "{name}" IS NOT NULL AND user_id IS NOT NULL
+            """
+            + _UPSERT_STATUS,
+            (name,),
+        )
 
 
 @custom_logger.log_db_operation
-def mark_broadcast_failed(user_id: int, broadcast_name: str):
+def rebuild_broadcast_statuses():
+    """Собирает итоговые статусы и дневные счётчики заново.
+
+    Источники — старая таблица broadcasts и журнал broadcast_events (он
+    новее, поэтому применяется после). Нужен один раз при появлении
+    broadcast_statuses и для ручной сверки.
+    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        cursor.execute("DELETE FROM broadcast_statuses")
+        _legacy_broadcast_statuses(cursor)
         cursor.execute(
-            f"""
-            INSERT INTO broadcasts (user_id, {broadcast_name})
-            VALUES (?, FALSE)
-            ON CONFLICT (user_id) DO UPDATE SET {broadcast_name} = FALSE
-            """,
-            (user_id,),
+            """
+            INSERT INTO broadcast_statuses
+                (broadcast, user_id, status, updated_at)
+            SELECT broadcast, user_id, status, event_at
+            FROM broadcast_events
+            WHERE true
+            ORDER BY event_at, id
+            """
+            + _UPSERT_STATUS
+        )
+        cursor.execute("DELETE FROM broadcast_daily_stats")
+        cursor.execute(
+            """
+            INSERT INTO broadcast_daily_stats
+                (broadcast, day, delivered, failed)
+            SELECT
+                broadcast,
+                COALESCE(date(updated_at), ''),
+                SUM(status = 'delivered'),
+                SUM(status = 'failed')
+            FROM broadcast_statuses
+            GROUP BY 1, 2
+            """
+        )
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO broadcast_names (name, created_at)
+            SELECT broadcast, MIN(updated_at) FROM broadcast_statuses
+            GROUP BY broadcast
+            """
         )
         conn.commit()
 
 
+@custom_logger.log_db_operation
+def mark_broadcast_delivered(user_id: int, broadcast_name: str):
+    record_broadcast_events([(user_id, broadcast_name, DELIVERED, None)])
+
+
+@custom_logger.log_db_operation
+def mark_broadcast_failed(user_id: int, broadcast_name: str):
+    record_broadcast_events([(user_id, broadcast_name, FAILED, None)])
+
+
 @custom_logger.log_db_operation
 def get_all_broadcasts_statistics():
     with get_db_connection() as conn:
         cursor = conn.cursor()
-
-        # Получаем список всех колонок рассылок
-        cursor.execute("PRAGMA table_info(broadcasts)")
-        columns = [
-            col[1]
-            for col in cursor.fetchall()
-            if col[1] not in ("id", "user_id", "created_at")
-        ]
-
-        # Формируем SQL-запрос динамически
-        sql_query = f"""
-        SELECT 
-            DATE(created_at) as date,
-            {', '.join([f"SUM(CASE WHEN {col} = TRUE THEN 1 ELSE 0 END) as {col}_delivered" for col in columns])},
-            {', '.join([f"SUM(CASE WHEN {col} = FALSE THEN 1 ELSE 0 END) as {col}_failed" for col in columns])}
-        FROM broadcasts
-        GROUP BY DATE(created_at)
-        ORDER BY DATE(created_at)
-        """
-
-        cursor.execute(sql_query)
-        return cursor.fetchall(), columns
+        cursor.execute(
+            """
+            SELECT day, broadcast, delivered, failed
+            FROM broadcast_daily_stats
+            WHERE delivered > 0 OR failed > 0
+            ORDER BY day, broadcast
+            """
+        )
+        return cursor.fetchall()
 
 
 @custom_logger.log_db_operation
@@ -76,15 +223,12 @@ def get_broadcast_statistics(broadcast_name: str):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            f"""
-            SELECT 
-                DATE(created_at) as date,
-                SUM(CASE WHEN {broadcast_name} = TRUE THEN 1 ELSE 0 END) as delivered,
-                SUM(CASE WHEN {broadcast_name} = FALSE THEN 1 ELSE 0 END) as failed
-            FROM broadcasts
-            WHERE {broadcast_name} IS NOT NULL
-            GROUP BY DATE(created_at)
-            ORDER BY DATE(created_at)
             """
+            SELECT day, delivered, failed
+            FROM broadcast_daily_stats
+            WHERE broadcast = ? AND (delivered > 0 OR failed > 0)
+            ORDER BY day
+            """,
+            (broadcast_name,),
         )
         return cursor.fetchall()
@@ -0,0 +1,142 @@
+"""Сброс кэшей процесса во всех воркерах.
+
+Именованные кэши (user_profiles, arcan_descriptions_cache) живут в памяти
+каждого воркера. Функция, изменившая закэшированные строки, записывает
+ключи в cache_invalidations тем же соединением, что и саму запись
+(publish_invalidation), поэтому событие появляется в журнале вместе с
+commit. Каждый воркер раз в CACHE_SYNC_INTERVAL секунд дочитывает журнал
+после своего курсора (sync_cache_invalidations) и сбрасывает эти ключи у
+себя. TTL кэшей — страховка на случай, если синхронизация отстала.
+"""
+
+import json
+import threading
+from functools import partial
+from typing import Any, Callable, Hashable, Iterable, List, Optional
+
+from app.core.cache import MISSING, Cache, shared_caches
+from app.core.config import custom_logger, settings
+from app.core.database import get_db_connection, on_commit
+
+
+def _encode_key(key: Hashable) -> str:
+    return json.dumps(key)
+
+
+def _decode_key(value: str) -> Hashable:
+    # Ключи-кортежи (arcan, month) приходят из JSON списками
+    key = json.loads(value)
+    return tuple(key) if isinstance(key, list) else key
+
+
+class SyncCursor:
+    """Последний seq журнала, уже применённый этим процессом."""
+
+    def __init__(self):
+        self.seq: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.seq = None
+
+
+sync_cursor = SyncCursor()
+
+
+def _invalidate(cache: Cache, keys: Optional[List[Hashable]]):
+    if keys is None:
+        cache.clear()
+    else:
+        for key in keys:
+            cache.invalidate(key)
+
+
+def publish_invalidation(
+    conn, cache: Cache, keys: Optional[Iterable[Hashable]] = None
+):
+    """Сбрасывает ключи кэша в этом процессе и пишет их в журнал.
+
+    keys=None — сбросить кэш целиком. Ключи сбрасываются сразу, чтобы
+    чтение в той же транзакции не взяло старое значение из кэша, и ещё
+    раз после commit: значение, закэшированное конкурентным чтением до
+    commit, устарело.
+    """
+    if keys is None:
+        rows = [(cache.name, None)]
+    else:
+        keys = list(keys)
+        rows = [(cache.name, _encode_key(key)) for key in keys]
+    if not rows:
+        return
+    _invalidate(cache, keys)
+    on_commit(conn, partial(_invalidate, cache, keys))
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO cache_invalidations (cache, key) VALUES (?, ?)", rows
+    )
+    # Журнал ограничен последними CACHE_INVALIDATION_LOG_SIZE записями
+    cursor.execute(
+        "DELETE FROM cache_invalidations "
+        "WHERE seq <= last_insert_rowid() - ?",
+        (settings.CACHE_INVALIDATION_LOG_SIZE,),
+    )
+
+
+def load_cached(cache: Cache, key: Hashable, loader: Callable[[], Any]):
+    """Как Cache.get_or_load, но кэширует значение только после commit.
+
+    Внутри транзакции loader видит её незафиксированные изменения: после
+    отката они не должны остаться в кэше.
+    """
+    value = cache.get(key)
+    if value is MISSING:
+        with get_db_connection() as conn:
+            value = loader()
+            on_commit(conn, partial(cache.set, key, value))
+    return value
+
+
+def _clear_shared_caches():
+    for cache in shared_caches.values():
+        cache.clear()
+
+
+@custom_logger.log_db_operation
+def sync_cache_invalidations() -> int:
+    """Применяет записи журнала после курсора, возвращает их число.
+
+    Свои записи тоже применяются: ключ, закэшированный конкурентным
+    чтением до commit, сбросится повторно.
+    """
+    with sync_cursor.lock, get_db_connection() as conn:
+        if sync_cursor.seq is None:
+            # Кэш процесса только начал заполняться: старые записи не нужны
+            sync_cursor.seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM cache_invalidations"
+            ).fetchone()[0]
+            return 0
+        rows = conn.execute(
+            """
+            SELECT seq, cache, key FROM cache_invalidations
+            WHERE seq > ?
+            ORDER BY seq
+            """,
+            (sync_cursor.seq,),
+        ).fetchall()
+        if not rows:
+            return 0
+        if rows[0]["seq"] != sync_cursor.seq + 1:
+            # Пропущенные записи уже вытеснены из журнала
+            _clear_shared_caches()
+        else:
+            for row in rows:
+                cache = shared_caches.get(row["cache"])
+                if cache is None:
+                    continue
+                if row["key"] is None:
+                    cache.clear()
+                else:
+                    cache.invalidate(_decode_key(row["key"]))
+        sync_cursor.seq = rows[-1]["seq"]
+        return len(rows)
@@ -5,6 +5,13 @@ from typing import List, Optional
 # from venv import logger
 from app.core.config import custom_logger, settings
 from app.core.database import get_db_connection
+from app.crud.db_invoice import (
+    CITY_INVOICE,
+    allocate_invoice_id,
+    get_invoice_type,
+    register_invoice,
+)
+from app.utils.pagination import paginate_query
 
 
 @custom_logger.log_db_operation
@@ -50,16 +57,30 @@ def get_all_answers() -> bool:
 
 
 @custom_logger.log_db_operation
-def get_all_city_users_and_free_tries(all: bool = False):
+def get_all_city_users_and_free_tries(
+    all: bool = False,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         if not all:
-            cursor.execute(
+            sql, params = paginate_query(
                 "SELECT user_id, have_free_try FROM city WHERE recive_request = ?",
                 (False,),
+                "user_id",
+                after_id,
+                limit,
             )
         else:
-            cursor.execute("SELECT user_id, have_free_try FROM city")
+            sql, params = paginate_query(
+                "SELECT user_id, have_free_try FROM city",
+                (),
+                "user_id",
+                after_id,
+                limit,
+            )
+        cursor.execute(sql, params)
         return cursor.fetchall()
 
 
@@ -84,6 +105,19 @@ def add_user_to_city_table(user_id: int):
         conn.commit()
 
 
+@custom_logger.log_db_operation
+def add_all_users_to_city_table():
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO city (user_id, have_free_try)
+            SELECT DISTINCT user_id, 2 FROM users WHERE user_id IS NOT NULL
+            """
+        )
+        conn.commit()
+
+
 @custom_logger.log_db_operation
 def set_free_try_used(user_id: int):
     with get_db_connection() as conn:
@@ -129,26 +163,18 @@ def has_unlimited_city_compatibility(user_id: int) -> bool:
 
 @custom_logger.log_db_operation
 def add_checked_city(user_id: int, city_name: str):
+    # Город пишется только пользователям из таблицы city, повтор игнорируется
+    # уникальным индексом; общий счётчик ведёт триггер
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT cities_checked FROM city WHERE user_id = ?", (user_id,)
+            """
+            INSERT OR IGNORE INTO city_checks (user_id, city_name, checked_at)
+            SELECT ?, ?, ?
+            WHERE EXISTS (SELECT 1 FROM city WHERE user_id = ?)
+            """,
+            (user_id, city_name, datetime.now(), user_id),
         )
-        result = cursor.fetchone()
-        if result and result["cities_checked"]:
-            cities = result["cities_checked"].split(",")
-            if city_name not in cities:
-                cities.append(city_name)
-                new_cities = ",".join(cities)
-                cursor.execute(
-                    "UPDATE city SET cities_checked = ? WHERE user_id = ?",
-                    (new_cities, user_id),
-                )
-        else:
-            cursor.execute(
-                "UPDATE city SET cities_checked = ? WHERE user_id = ?",
-                (city_name, user_id),
-            )
         conn.commit()
 
 
@@ -157,14 +183,44 @@ def get_checked_cities(user_id: int) -> List[str]:
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT cities_checked FROM city WHERE user_id = ?", (user_id,)
+            "SELECT city_name FROM city_checks WHERE user_id = ? ORDER BY rowid",
+            (user_id,),
         )
-        result = cursor.fetchone()
-        return (
-            result["cities_checked"].split(",")
-            if result and result["cities_checked"]
-            else []
+        return [row["city_name"] for row in cursor.fetchall()]
+
+
+@custom_logger.log_db_operation
+def migrate_cities_checked():
+    """Переносит строку cities_checked ("Москва,Казань") в city_checks."""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT user_id, cities_checked FROM city
+            WHERE cities_checked IS NOT NULL
+            """
+        )
+        rows = [
+            (row["user_id"], city_name)
+            for row in cursor.fetchall()
+            for city_name in row["cities_checked"].split(",")
+            if city_name
+        ]
+        cursor.executemany(
+            """
+            INSERT OR IGNORE INTO city_checks (user_id, city_name)
+            VALUES (?, ?)
+            """,
+            rows,
+        )
+        # Колонка остаётся в схеме, но больше не заполняется
+        cursor.execute(
+            """
+            UPDATE city SET cities_checked = NULL
+            WHERE cities_checked IS NOT NULL
+            """
         )
+        conn.commit()
 
 
 # @custom_logger.log_db_operation
@@ -242,6 +298,9 @@ def record_city_transaction(user_id: int, amount: int, status: bool = False):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         current_time = datetime.now()
+        # Номер счёта берём до первой записи: резерв блока номеров идёт
+        # отдельной транзакцией и не должен ждать нашу блокировку
+        invoice_id = allocate_invoice_id(conn)
 
         # Check if a transaction exists for the user
         cursor.execute(
@@ -264,38 +323,20 @@ def record_city_transaction(user_id: int, amount: int, status: bool = False):
                     "UPDATE city_transactions SET amount = ?, pay_date = ?, status = ? WHERE id = ?",
                     (amount, current_time, status, transaction_id),
                 )
-        else:
-            # Получаем максимальный ID из обеих таблиц
-            cursor.execute(
-                """
-                SELECT COALESCE(MAX(id), 0) as max_id FROM (
-                    SELECT id FROM city_transactions
-                    UNION ALL
-                    SELECT id FROM transactions
-                    UNION ALL
-                    SELECT id FROM pre_transactions
-                    ) combined_ids
-            """
-            )
-        max_id = cursor.fetchone()
-
-        if max_id:
-            max_id = max_id["max_id"]
-        else:
-            max_id = 1000 + user_id / 2
 
         # Insert new transaction
         if not status:
             cursor.execute(
                 "INSERT INTO city_transactions (id, user_id, amount, create_date, status) VALUES (?, ?, ?, ?, ?)",
-                (max_id + 1, user_id, amount, current_time, status),
+                (invoice_id, user_id, amount, current_time, status),
             )
         else:
             cursor.execute(
                 "INSERT INTO city_transactions (id, user_id, amount, pay_date, status) VALUES (?, ?, ?, ?, ?)",
-                (max_id + 1, user_id, amount, current_time, status),
+                (invoice_id, user_id, amount, current_time, status),
             )
-        transaction_id = cursor.lastrowid
+        transaction_id = invoice_id
+        register_invoice(conn, invoice_id, CITY_INVOICE, user_id)
 
         # Update city table if status is True (this remains the same)
         if status:
@@ -311,25 +352,8 @@ def record_city_transaction(user_id: int, amount: int, status: bool = False):
 
 @custom_logger.log_db_operation
 def get_transaction_type(transaction_id: int) -> str:
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-
-        # Проверяем наличие ID в таблице city_transactions
-        cursor.execute(
-            "SELECT 1 FROM city_transactions WHERE id = ?", (transaction_id,)
-        )
-        if cursor.fetchone():
-            return "city"
-
-        # Проверяем наличие ID в таблице pre_transactions
-        cursor.execute(
-            "SELECT 1 FROM pre_transactions WHERE id = ?", (transaction_id,)
-        )
-        if cursor.fetchone():
-            return "product"
-
-        # Если ID не найден ни в одной таблице
-        return ""
+    # Тип счёта берётся из реестра invoices одним поиском по ключу
+    return get_invoice_type(transaction_id)
 
 
 @custom_logger.log_db_operation
@@ -411,21 +435,41 @@ def del_task_product_transaction(inv_id: int):
 
 
 @custom_logger.log_db_operation
-def get_all_task_city_transaction():
+def get_all_task_city_transaction(
+    after_id: Optional[int] = None, limit: Optional[int] = None
+):
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
-        cursor.execute("SELECT user_id FROM task_city_transactions")
+        cursor.execute(
+            *paginate_query(
+                "SELECT user_id FROM task_city_transactions",
+                (),
+                "user_id",
+                after_id,
+                limit,
+            )
+        )
 
         return cursor.fetchall()
 
 
 @custom_logger.log_db_operation
-def get_all_task_product_transaction():
+def get_all_task_product_transaction(
+    after_id: Optional[int] = None, limit: Optional[int] = None
+):
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
-        cursor.execute("SELECT * FROM task_product_transactions")
+        cursor.execute(
+            *paginate_query(
+                "SELECT * FROM task_product_transactions",
+                (),
+                "id",
+                after_id,
+                limit,
+            )
+        )
 
         return cursor.fetchall()
 
@@ -482,7 +526,8 @@ def check_signature(inv_id, signature_value, out_sum, shp_id) -> bool:
 #             return 0  # Возвращаем 0, если транзакций нет
 
 
-async def get_last_transaction_id_from_db() -> int:
+@custom_logger.log_db_operation
+def get_last_transaction_id_from_db() -> int:
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
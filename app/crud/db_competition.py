@@ -17,6 +17,9 @@ from typing import Optional
 
 from app.core.config import custom_logger, settings
 from app.core.database import get_db_connection
+from app.crud.db_cache import publish_invalidation
+from app.crud.db_user import user_profiles
+from app.utils.pagination import paginate_query
 
 
 def add_user_to_competition(user_id: int):
@@ -97,6 +100,7 @@ def set_inst_username(user_id: int, inst_username: str):
             "UPDATE users SET inst_username = ? WHERE user_id = ?",
             (inst_username, user_id),
         )
+        publish_invalidation(conn, user_profiles, [user_id])
         conn.commit()
 
 
@@ -200,12 +204,19 @@ def get_user_by_secret_link(secret_link: str) -> int:
 
 
 @custom_logger.log_db_operation
-def get_all_users_status(status: str):
+def get_all_users_status(
+    status: str, after_id: Optional[int] = None, limit: Optional[int] = None
+):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         result = cursor.execute(
-            "SELECT user_id, inst_username, count_of_friends, should_send_message FROM new_year_competition WHERE status = ?",
-            (status,),
+            *paginate_query(
+                "SELECT user_id, inst_username, count_of_friends, should_send_message FROM new_year_competition WHERE status = ?",
+                (status,),
+                "user_id",
+                after_id,
+                limit,
+            )
         ).fetchall()
         if result:
             return [
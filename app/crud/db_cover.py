@@ -1,8 +1,21 @@
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 
-from app.core.config import custom_logger
+from app.core.cache import Cache
+from app.core.config import custom_logger, settings
 from app.core.database import get_db_connection
+from app.crud.db_cache import load_cached, publish_invalidation
+
+# Описания арканов по ключу (arcan, month); ("*", month) — все арканы месяца
+arcan_descriptions_cache = Cache(
+    ttl=settings.ARCAN_DESCRIPTION_CACHE_TTL, name="arcan_descriptions"
+)
+
+
+def _description_month(use_next=False) -> str:
+    if use_next:
+        return (datetime.now() + timedelta(days=30)).strftime("%Y-%m")
+    return datetime.now().strftime("%Y-%m")
 
 
 @custom_logger.log_db_operation
@@ -59,15 +72,23 @@ def add_arcan_description(arcan: int, description: str, month: str = None):
             "INSERT OR REPLACE INTO arcan_descriptions (arcan, month, description) VALUES (?, ?, ?)",
             (arcan, month, description),
         )
+        publish_invalidation(
+            conn, arcan_descriptions_cache, [(arcan, month), ("*", month)]
+        )
         conn.commit()
 
 
 @custom_logger.log_db_operation
 def get_arcan_description(arcan: int, use_next=False) -> Optional[str]:
-    if use_next:
-        month = (datetime.now() + timedelta(days=30)).strftime("%Y-%m")
-    else:
-        month = datetime.now().strftime("%Y-%m")
+    month = _description_month(use_next)
+    return load_cached(
+        arcan_descriptions_cache,
+        (arcan, month),
+        lambda: _load_arcan_description(arcan, month),
+    )
+
+
+def _load_arcan_description(arcan: int, month: str) -> Optional[str]:
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
@@ -158,6 +179,16 @@ def record_transaction(user_id: int, amount: float):
 
 @custom_logger.log_db_operation
 def get_all_arcan_descriptions(month: str) -> Dict[int, Dict]:
+    return dict(
+        load_cached(
+            arcan_descriptions_cache,
+            ("*", month),
+            lambda: _load_month_descriptions(month),
+        )
+    )
+
+
+def _load_month_descriptions(month: str) -> Dict[int, Dict]:
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
@@ -167,3 +198,16 @@ def get_all_arcan_descriptions(month: str) -> Dict[int, Dict]:
         results = cursor.fetchall()
         # return {row["arcan"]: dict(row) for row in results}
         return {row[0]: row for row in results}
+
+
+@custom_logger.log_db_operation
+def preload_arcan_descriptions():
+    """Прогревает кэш текущим и следующим месяцем, старые месяцы удаляет."""
+    months = {_description_month(), _description_month(use_next=True)}
+    current = min(months)
+    arcan_descriptions_cache.invalidate_where(lambda key: key[1] < current)
+    for month in months:
+        descriptions = _load_month_descriptions(month)
+        arcan_descriptions_cache.set(("*", month), descriptions)
+        for arcan, row in descriptions.items():
+            arcan_descriptions_cache.set((arcan, month), row["description"])
@@ -1,9 +1,52 @@
+import sqlite3
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 
 from app.core.config import custom_logger, settings
 from app.core.database import get_db_connection
 
+MONTHS = (
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+)
+# Поля forecast_deliveries, которые раньше были колонками <month>_send/_like
+DELIVERY_FIELDS = {"send": "sent", "like": "liked"}
+
+
+def forecast_month(month_name: Optional[str] = None) -> str:
+    """Ключ месяца в forecast_deliveries: "2024-10".
+
+    Имя месяца ("october") относится к последнему такому месяцу, не позже
+    текущего, поэтому рассылка следующего года не путается с прошлогодней.
+    """
+    now = datetime.now()
+    if month_name is None:
+        return now.strftime("%Y-%m")
+    month = MONTHS.index(month_name.lower()) + 1
+    year = now.year if month <= now.month else now.year - 1
+    return f"{year}-{month:02d}"
+
+
+def parse_forecast_column(column_name: str) -> Tuple[str, str]:
+    """Колонка "october_send" -> ("2024-10", "sent").
+
+    Для колонок, которые не являются отметками месяца, ValueError.
+    """
+    month_name, _, suffix = column_name.lower().rpartition("_")
+    if month_name not in MONTHS or suffix not in DELIVERY_FIELDS:
+        raise ValueError(f"Unknown forecast column: {column_name}")
+    return forecast_month(month_name), DELIVERY_FIELDS[suffix]
+
 
 @custom_logger.log_db_operation
 def add_user_to_forecast(user_id: int, arcan: Optional[int] = None):
@@ -25,61 +68,72 @@ def add_user_to_forecast(user_id: int, arcan: Optional[int] = None):
                 "INSERT INTO monthly_forecasts (user_id, arcan, subscription) VALUES (?, ?, TRUE)",
                 (user_id, arcan),
             )
-
-        cursor.execute("PRAGMA table_info(monthly_forecasts)")
-        send_columns = [
-            col[1] for col in cursor.fetchall() if col[1].endswith("_send")
-        ]
-
-        # set_clauses = [
-        #     f"{col} = CASE WHEN {col} = TRUE THEN TRUE ELSE FALSE END"
-        #     for col in send_columns
-        # ]
-        if send_columns:
-            set_clauses = [
-                f"{col} = CASE WHEN {col} = 1 THEN 1 ELSE 0 END"
-                for col in send_columns
-            ]
-            sql_query = f"UPDATE monthly_forecasts SET {', '.join(set_clauses)} WHERE user_id = ?"
-            cursor.execute(sql_query, (user_id,))
-        sql_query = f"UPDATE monthly_forecasts SET {', '.join(set_clauses)}"
-        cursor.execute(sql_query)
+        # Отметки о доставке живут в forecast_deliveries: отсутствие строки
+        # за месяц означает «ещё не отправлен», обновлять нечего
 
         conn.commit()
 
 
 @custom_logger.log_db_operation
-def add_month_column():
+def migrate_month_columns():
+    """Переносит старые колонки <month>_send/_like в forecast_deliveries."""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        month_name = datetime.now().strftime("%B").lower()
-        column_send = f"{month_name}_send"
-        column_like = f"{month_name}_like"
-        try:
-            cursor.execute(
-                f"ALTER TABLE monthly_forecasts ADD COLUMN {column_send} BOOLEAN DEFAULT FALSE"
-            )
+        cursor.execute("PRAGMA table_info(monthly_forecasts)")
+        columns = {row[1] for row in cursor.fetchall()}
+        for month_name in MONTHS:
+            column_send = f"{month_name}_send"
+            column_like = f"{month_name}_like"
+            if column_send not in columns:
+                continue
+            like = column_like if column_like in columns else "NULL"
             cursor.execute(
-                f"ALTER TABLE monthly_forecasts ADD COLUMN {column_like} BOOLEAN DEFAULT NULL"
+                f"""
+                INSERT OR IGNORE INTO forecast_deliveries (user_id, month, sent, liked)
+                SELECT user_id, ?, COALESCE({column_send}, FALSE), {like}
+                FROM monthly_forecasts
+                WHERE {column_send} = TRUE OR {like} IS NOT NULL
+                """,
+                (forecast_month(month_name),),
             )
-            conn.commit()
-        except:
-            pass
+            try:
+                cursor.execute(
+                    f"ALTER TABLE monthly_forecasts DROP COLUMN {column_send}"
+                )
+                if column_like in columns:
+                    cursor.execute(
+                        f"ALTER TABLE monthly_forecasts DROP COLUMN {column_like}"
+                    )
+            except sqlite3.OperationalError:
+                # SQLite < 3.35: колонки остаются, повторный перенос безвреден
+                pass
+        conn.commit()
 
 
 @custom_logger.log_db_operation
-def mark_forecast_sent(user_id: int):
+def set_forecast_delivery(
+    user_id: int, field: str, value, month: Optional[str] = None
+):
+    if field not in DELIVERY_FIELDS.values():
+        raise ValueError(f"Unknown forecast delivery field: {field}")
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        current_month = datetime.now().strftime("%B").lower()
-        column_name = f"{current_month}_send"
         cursor.execute(
-            f"UPDATE monthly_forecasts SET {column_name} = TRUE WHERE user_id = ?",
-            (user_id,),
+            f"""
+            INSERT INTO forecast_deliveries (user_id, month, {field})
+            VALUES (?, ?, ?)
+            ON CONFLICT (user_id, month) DO UPDATE SET {field} = excluded.{field}
+            """,
+            (user_id, month or forecast_month(), value),
         )
         conn.commit()
 
 
+@custom_logger.log_db_operation
+def mark_forecast_sent(user_id: int):
+    set_forecast_delivery(user_id, "sent", True)
+
+
 @custom_logger.log_db_operation
 def set_first_useful_and_date(user_id: int):
     with get_db_connection() as conn:
@@ -96,15 +150,7 @@ def set_first_useful_and_date(user_id: int):
 
 @custom_logger.log_db_operation
 def mark_forecast_like(user_id: int, like: bool):
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        current_month = datetime.now().strftime("%B").lower()
-        column_name = f"{current_month}_like"
-        cursor.execute(
-            f"UPDATE monthly_forecasts SET {column_name} = ? WHERE user_id = ?",
-            (like, user_id),
-        )
-        conn.commit()
+    set_forecast_delivery(user_id, "liked", like)
 
 
 @custom_logger.log_db_operation
@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+from app.core.config import custom_logger, settings
+from app.core.database import get_db_connection, pool
+
+INVOICE_SEQUENCE = "invoice"
+# Типы счетов в реестре invoices, как их возвращает get_transaction_type
+CITY_INVOICE = "city"
+PRODUCT_INVOICE = "product"
+
+
+class InvoiceIdAllocator:
+    """Выдаёт номера счетов (InvId) из таблицы id_sequences.
+
+    При block_size == 1 номер берётся одним UPDATE ... RETURNING внутри
+    транзакции вызывающего: откат вставки откатывает и номер. При
+    block_size > 1 процесс резервирует сразу блок номеров отдельной
+    короткой транзакцией и раздаёт их из памяти; неиспользованные номера
+    блока теряются при перезапуске, но никогда не выдаются повторно.
+    """
+
+    def __init__(self, block_size: int = 1):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 1
+        self._last = 0
+
+    def _reserve(self, conn: sqlite3.Connection, count: int) -> int:
+        row = conn.execute(
+            "UPDATE id_sequences SET value = value + ? WHERE name = ? RETURNING value",
+            (count, INVOICE_SEQUENCE),
+        ).fetchone()
+        return row[0]
+
+    def allocate(self, conn: sqlite3.Connection) -> int:
+        # Внутри уже начатой записи (единица работы запроса) отдельная
+        # транзакция резерва ждала бы нашу же блокировку: берём один номер
+        # в транзакции вызывающего, блок из памяти это не задевает
+        if self.block_size <= 1 or conn.in_transaction:
+            return self._reserve(conn, 1)
+        with self._lock:
+            if self._next > self._last:
+                with pool.connection() as block_conn:
+                    self._last = self._reserve(block_conn, self.block_size)
+                    block_conn.commit()
+                self._next = self._last - self.block_size + 1
+            invoice_id = self._next
+            self._next += 1
+            return invoice_id
+
+
+invoice_ids = InvoiceIdAllocator(settings.INVOICE_ID_BLOCK_SIZE)
+
+
+def allocate_invoice_id(conn: sqlite3.Connection) -> int:
+    return invoice_ids.allocate(conn)
+
+
+def register_invoice(
+    conn: sqlite3.Connection, invoice_id: int, invoice_type: str, user_id
+):
+    conn.execute(
+        "INSERT OR REPLACE INTO invoices (id, type, user_id, created_at) VALUES (?, ?, ?, ?)",
+        (invoice_id, invoice_type, user_id, datetime.now()),
+    )
+
+
+@custom_logger.log_db_operation
+def get_invoice_type(invoice_id: int) -> str:
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT type FROM invoices WHERE id = ?", (invoice_id,))
+        result = cursor.fetchone()
+        return result["type"] if result else ""
@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from app.core.config import custom_logger
+from app.core.database import get_db_connection
+
+
+@custom_logger.log_db_operation
+def acquire_scheduler_lease(owner: str, seconds: float) -> bool:
+    """Берёт или продлевает аренду блокировки планировщика.
+
+    Удаётся, если блокировки нет, она уже у owner или аренда истекла.
+    """
+    now = datetime.now()
+    with get_db_connection() as conn:
+        row = conn.execute(
+            """
+            INSERT INTO scheduler_lock (id, owner, expires_at)
+            VALUES (1, :owner, :expires_at)
+            ON CONFLICT (id) DO UPDATE
+            SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE scheduler_lock.owner = excluded.owner
+                OR scheduler_lock.expires_at < :now
+            RETURNING owner
+            """,
+            {
+                "owner": owner,
+                "expires_at": now + timedelta(seconds=seconds),
+                "now": now,
+            },
+        ).fetchone()
+        conn.commit()
+        return row is not None
+
+
+@custom_logger.log_db_operation
+def release_scheduler_lease(owner: str):
+    with get_db_connection() as conn:
+        conn.execute("DELETE FROM scheduler_lock WHERE owner = ?", (owner,))
+        conn.commit()
+
+
+@custom_logger.log_db_operation
+def get_last_run(name: str) -> Optional[str]:
+    with get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT last_run_at FROM scheduler_jobs WHERE name = ?", (name,)
+        ).fetchone()
+        return row["last_run_at"] if row else None
+
+
+@custom_logger.log_db_operation
+def record_job_run(
+    name: str,
+    started_at: datetime,
+    status: str,
+    duration_ms: float,
+    error: Optional[str] = None,
+):
+    with get_db_connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO scheduler_jobs
+                (name, last_run_at, last_status, last_error,
+                 last_duration_ms, runs)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT (name) DO UPDATE
+            SET last_run_at = excluded.last_run_at,
+                last_status = excluded.last_status,
+                last_error = excluded.last_error,
+                last_duration_ms = excluded.last_duration_ms,
+                runs = runs + 1
+            """,
+            (name, started_at, status, error, duration_ms),
+        )
+        conn.commit()
+
+
+@custom_logger.log_db_operation
+def get_jobs() -> List[Dict]:
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            "SELECT * FROM scheduler_jobs ORDER BY name"
+        ).fetchall()
+        return [dict(row) for row in rows]
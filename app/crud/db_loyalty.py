@@ -5,6 +5,12 @@ from typing import List, Optional, Tuple
 
 from app.core.config import custom_logger
 from app.core.database import get_db_connection
+from app.crud import db_points
+from app.crud.db_invoice import (
+    PRODUCT_INVOICE,
+    allocate_invoice_id,
+    register_invoice,
+)
 
 
 def with_db_connection(func):
@@ -202,17 +208,8 @@ def use_promo_code(
 def deduct_points(
     user_id: int, points: int, connection=None
 ) -> Tuple[bool, int]:
-    current_balance = get_user_balance(user_id, connection=connection)
-    if current_balance >= points:
-        cursor = connection.cursor()
-        cursor.execute(
-            "UPDATE loyalty SET balance = balance - ? WHERE user_id = ?",
-            (points, user_id),
-        )
-        connection.commit()
-        return True, current_balance - points
-    else:
-        return False, current_balance
+    # Проверка остатка и списание — один условный UPDATE в db_points
+    return db_points.deduct_points(user_id, points)
 
 
 @custom_logger.log_db_operation
@@ -248,8 +245,16 @@ def record_transaction(
 ):
     cursor = connection.cursor()
     cursor.execute(
-        "INSERT INTO transactions (user_id, amount, bonus, service, comment, date) VALUES (?, ?, ?, ?, ?, ?)",
-        (user_id, amount, bonus, service, comment, datetime.now()),
+        "INSERT INTO transactions (id, user_id, amount, bonus, service, comment, date) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            allocate_invoice_id(connection),
+            user_id,
+            amount,
+            bonus,
+            service,
+            comment,
+            datetime.now(),
+        ),
     )
     print("HERE", user_id, amount, bonus, service, comment, datetime.now())
     cursor.execute(
@@ -285,19 +290,7 @@ def record_pre_transaction(
 ):
     cursor = connection.cursor()
 
-    # Получаем максимальный ID из обеих таблиц
-    cursor.execute(
-        """
-    SELECT COALESCE(MAX(id), 0) as max_id FROM (
-        SELECT id FROM city_transactions
-        UNION ALL
-        SELECT id FROM transactions
-        UNION ALL
-        SELECT id FROM pre_transactions
-    ) combined_ids
-    """
-    )
-    max_id = cursor.fetchone()["max_id"]
+    invoice_id = allocate_invoice_id(connection)
     if bonus > 0:
         bonus = -int(bonus)
     if bonus == 0:
@@ -305,12 +298,13 @@ def record_pre_transaction(
 
     cursor.execute(
         "INSERT INTO pre_transactions (id, user_id, amount, bonus, service, comment, date) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (max_id + 1, user_id, amount, bonus, service, comment, datetime.now()),
+        (invoice_id, user_id, amount, bonus, service, comment, datetime.now()),
     )
+    register_invoice(connection, invoice_id, PRODUCT_INVOICE, user_id)
     # print("HERE", user_id, amount, bonus, service, comment, datetime.now())
 
     connection.commit()
-    return max_id + 1
+    return invoice_id
 
 
 @custom_logger.log_db_operation
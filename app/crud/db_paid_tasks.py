@@ -0,0 +1,140 @@
+"""Лента оплаченных задач для бота.
+
+Каждая строка task_city_transactions и task_product_transactions попадает
+в paid_tasks через триггеры и получает возрастающий seq (AUTOINCREMENT,
+номера не переиспользуются). Бот читает ленту после своего курсора и
+подтверждает обработанные задачи (ack_paid_tasks) — тогда удаляется и сама
+задача. Неподтверждённые задачи остаются и придут снова при чтении с
+более раннего курсора.
+"""
+
+import asyncio
+from typing import Dict, Iterable, List, Set
+
+from app.core.config import custom_logger
+from app.core.database import get_db_connection
+
+CITY_TASK = "city"
+PRODUCT_TASK = "product"
+
+# Итоги подтверждения по каждому seq
+ACKED = "acked"
+NOT_FOUND = "not_found"
+
+_TASK_TABLES = {
+    CITY_TASK: "task_city_transactions",
+    PRODUCT_TASK: "task_product_transactions",
+}
+
+
+def _task_triggers(kind: str, table: str) -> Dict[str, str]:
+    return {
+        f"paid_tasks_{kind}_insert": f"""
+            AFTER INSERT ON {table}
+            BEGIN
+                INSERT OR IGNORE INTO paid_tasks (kind, task_id, user_id)
+                VALUES ('{kind}', NEW.id, NEW.user_id);
+            END
+        """,
+        f"paid_tasks_{kind}_delete": f"""
+            AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM paid_tasks
+                WHERE kind = '{kind}' AND task_id = OLD.id;
+            END
+        """,
+    }
+
+
+PAID_TASK_TRIGGERS: Dict[str, str] = {
+    name: body
+    for kind, table in _TASK_TABLES.items()
+    for name, body in _task_triggers(kind, table).items()
+}
+
+
+class PaidTaskSignal:
+    """Будит ожидающих читателей ленты, когда появились новые задачи.
+
+    Сигнал живёт в процессе; задачи, записанные другим воркером, читатель
+    увидит при следующей периодической проверке.
+    """
+
+    def __init__(self):
+        self._waiters: Set[asyncio.Future] = set()
+
+    async def wait(self, timeout: float) -> bool:
+        """True, если разбудил notify(), False — по таймауту."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters.discard(waiter)
+
+    def notify(self):
+        # Можно вызывать из любого потока и цикла событий
+        for waiter in list(self._waiters):
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+paid_task_signal = PaidTaskSignal()
+
+
+@custom_logger.log_db_operation
+def backfill_paid_tasks():
+    """Заносит в ленту задачи, созданные до появления триггеров."""
+    with get_db_connection() as conn:
+        for kind, table in _TASK_TABLES.items():
+            conn.execute(
+                f"""
+                INSERT OR IGNORE INTO paid_tasks (kind, task_id, user_id)
+                SELECT ?, id, user_id FROM {table} ORDER BY id
+                """,
+                (kind,),
+            )
+        conn.commit()
+
+
+@custom_logger.log_db_operation
+def get_paid_tasks(after: int = 0, limit: int = 100) -> List[Dict]:
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT seq, kind, task_id, user_id, created_at
+            FROM paid_tasks
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+            """,
+            (after, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+@custom_logger.log_db_operation
+def ack_paid_tasks(seqs: Iterable[int]) -> Dict[int, str]:
+    """Удаляет подтверждённые задачи из ленты и из таблиц задач."""
+    outcomes = {}
+    with get_db_connection() as conn:
+        for seq in dict.fromkeys(seqs):
+            task = conn.execute(
+                "DELETE FROM paid_tasks WHERE seq = ? RETURNING kind, task_id",
+                (seq,),
+            ).fetchone()
+            outcomes[seq] = NOT_FOUND if task is None else ACKED
+            if task is not None:
+                conn.execute(
+                    f"DELETE FROM {_TASK_TABLES[task['kind']]} WHERE id = ?",
+                    (task["task_id"],),
+                )
+        conn.commit()
+    return outcomes
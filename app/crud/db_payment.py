@@ -0,0 +1,76 @@
+from datetime import datetime
+from functools import partial
+from typing import Optional
+
+from app.core.cache import MISSING, Cache
+from app.core.config import custom_logger, settings
+from app.core.database import on_commit, transaction
+from app.crud import db_city, db_loyalty
+from app.crud.db_invoice import CITY_INVOICE, PRODUCT_INVOICE, get_invoice_type
+
+# Номера уже проведённых счетов. Повторное уведомление Робокассы по такому
+# счёту отвечается сразу, без обращения к базе. Заполняется только после
+# commit проводки (mark_processed), поэтому не может опередить базу.
+processed_invoices = Cache(maxsize=settings.PROCESSED_INVOICE_CACHE_SIZE)
+
+
+class UnknownInvoice(Exception):
+    """Счёта нет в реестре invoices или его тип не проводится."""
+
+
+class SettlementFailed(Exception):
+    """Шаг проводки не выполнен, проводка откачена."""
+
+
+def is_processed(inv_id: int) -> bool:
+    return processed_invoices.get(inv_id) is not MISSING
+
+
+def mark_processed(inv_id: int):
+    processed_invoices.set(inv_id, True)
+
+
+@custom_logger.log_db_operation
+def settle_payment(inv_id: int, user_id: int, out_sum) -> Optional[str]:
+    """Проводит оплаченный счёт целиком: одно соединение, один commit.
+
+    Если любой шаг падает, откатывается вся проводка и вебхук отвечает
+    ошибкой, чтобы Робокасса повторила уведомление. Повтор уже проведённого
+    счёта отсекается строкой processed_invoices и возвращает None, таблицы
+    проводок не трогаются. Счёт неизвестного типа не записывается в
+    processed_invoices (UnknownInvoice): повтор уведомления, пришедший
+    после регистрации счёта, ещё проведёт его.
+    """
+    with transaction() as conn:
+        invoice_type = get_invoice_type(inv_id)
+        if invoice_type not in (CITY_INVOICE, PRODUCT_INVOICE):
+            raise UnknownInvoice(
+                f"Invoice {inv_id} has unknown type {invoice_type!r}"
+            )
+        row = conn.execute(
+            """
+            INSERT INTO processed_invoices
+                (inv_id, invoice_type, user_id, out_sum, processed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (inv_id) DO NOTHING
+            RETURNING inv_id
+            """,
+            (inv_id, invoice_type, user_id, out_sum, datetime.now()),
+        ).fetchone()
+        # Номер счёта попадает в кэш только после commit проводки
+        on_commit(conn, partial(mark_processed, inv_id))
+        if row is None:
+            return None
+        if invoice_type == CITY_INVOICE:
+            # Сначала запись с новым номером счёта: резерв блока номеров
+            # не должен ждать блокировку, взятую этой же транзакцией
+            db_city.record_city_transaction(user_id, out_sum, True)
+            db_city.set_unlimited_city_compatibility(user_id)
+            db_city.add_task_city_transaction(user_id)
+        else:
+            if not db_loyalty.move_pre_transaction_to_transaction(inv_id):
+                raise SettlementFailed(
+                    f"Pre-transaction {inv_id} was not moved to transactions"
+                )
+            db_city.add_task_product_transaction(inv_id, user_id)
+        return invoice_type
@@ -0,0 +1,159 @@
+"""Списание и резервирование баллов лояльности.
+
+Проверка остатка и списание — один условный UPDATE ... RETURNING, поэтому
+параллельные списания из разных воркеров не уводят баланс в минус.
+
+Для оформления заказа баллы сначала резервируются (hold_points): они сразу
+уходят с баланса в points_holds. Затем резерв подтверждается
+(confirm_hold) или возвращается на баланс (release_hold). Просроченные
+резервы возвращает release_expired_holds.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from app.core.config import custom_logger, settings
+from app.core.database import get_db_connection, transaction
+
+HELD = "held"
+CONFIRMED = "confirmed"
+RELEASED = "released"
+
+
+def _check_points(points: int):
+    if points <= 0:
+        raise ValueError("Points must be positive")
+
+
+def _take_points(conn, user_id: int, points: int) -> Optional[int]:
+    # Новый баланс или None, если баллов не хватает
+    row = conn.execute(
+        """
+        UPDATE loyalty SET balance = balance - ?
+        WHERE user_id = ? AND balance >= ?
+        RETURNING balance
+        """,
+        (points, user_id, points),
+    ).fetchone()
+    return row["balance"] if row else None
+
+
+def _current_balance(conn, user_id: int) -> int:
+    row = conn.execute(
+        "SELECT balance FROM loyalty WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row["balance"] if row else 0
+
+
+@custom_logger.log_db_operation
+def deduct_points(user_id: int, points: int) -> Tuple[bool, int]:
+    """(True, новый баланс) или (False, текущий баланс)."""
+    _check_points(points)
+    with get_db_connection() as conn:
+        balance = _take_points(conn, user_id, points)
+        conn.commit()
+        if balance is None:
+            return False, _current_balance(conn, user_id)
+        return True, balance
+
+
+@custom_logger.log_db_operation
+def hold_points(
+    user_id: int, points: int, ttl_seconds: Optional[float] = None
+) -> Tuple[Optional[int], int]:
+    """Резервирует баллы: (id резерва, новый баланс).
+
+    Если баллов не хватает — (None, текущий баланс).
+    """
+    _check_points(points)
+    now = datetime.now()
+    ttl = settings.POINTS_HOLD_TTL if ttl_seconds is None else ttl_seconds
+    with transaction() as conn:
+        balance = _take_points(conn, user_id, points)
+        if balance is None:
+            return None, _current_balance(conn, user_id)
+        row = conn.execute(
+            """
+            INSERT INTO points_holds
+                (user_id, points, status, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+            RETURNING id
+            """,
+            (user_id, points, HELD, now, now + timedelta(seconds=ttl)),
+        ).fetchone()
+        return row["id"], balance
+
+
+@custom_logger.log_db_operation
+def confirm_hold(hold_id: int) -> bool:
+    """Окончательно списывает зарезервированные баллы."""
+    with get_db_connection() as conn:
+        row = conn.execute(
+            """
+            UPDATE points_holds SET status = ?, settled_at = ?
+            WHERE id = ? AND status = ?
+            RETURNING id
+            """,
+            (CONFIRMED, datetime.now(), hold_id, HELD),
+        ).fetchone()
+        conn.commit()
+        return row is not None
+
+
+@custom_logger.log_db_operation
+def release_hold(hold_id: int) -> Optional[int]:
+    """Возвращает баллы резерва на баланс: новый баланс или None."""
+    with transaction() as conn:
+        hold = conn.execute(
+            """
+            UPDATE points_holds SET status = ?, settled_at = ?
+            WHERE id = ? AND status = ?
+            RETURNING user_id, points
+            """,
+            (RELEASED, datetime.now(), hold_id, HELD),
+        ).fetchone()
+        if hold is None:
+            return None
+        row = conn.execute(
+            """
+            UPDATE loyalty SET balance = balance + ?
+            WHERE user_id = ?
+            RETURNING balance
+            """,
+            (hold["points"], hold["user_id"]),
+        ).fetchone()
+        return row["balance"] if row else None
+
+
+@custom_logger.log_db_operation
+def release_expired_holds() -> Dict[str, int]:
+    """Возвращает на баланс все просроченные резервы одной транзакцией."""
+    now = datetime.now()
+    with transaction() as conn:
+        holds = conn.execute(
+            """
+            UPDATE points_holds SET status = ?, settled_at = ?
+            WHERE status = ? AND expires_at <= ?
+            RETURNING user_id, points
+            """,
+            (RELEASED, now, HELD, now),
+        ).fetchall()
+        refunds: Dict[int, int] = {}
+        for hold in holds:
+            refunds[hold["user_id"]] = (
+                refunds.get(hold["user_id"], 0) + hold["points"]
+            )
+        conn.executemany(
+            "UPDATE loyalty SET balance = balance + ? WHERE user_id = ?",
+            [(points, user_id) for user_id, points in refunds.items()],
+        )
+    return {"released": len(holds), "users": len(refunds)}
+
+
+@custom_logger.log_db_operation
+def get_hold(hold_id: int) -> Optional[dict]:
+    with get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT * FROM points_holds WHERE id = ?", (hold_id,)
+        ).fetchone()
+        return dict(row) if row else None
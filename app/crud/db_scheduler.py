@@ -1,7 +1,44 @@
 from datetime import datetime
+from typing import Dict, Iterable, List, Optional
 
 from app.core.config import custom_logger
-from app.core.database import get_db_connection
+from app.core.database import get_db_connection, transaction
+from app.crud.db_cache import publish_invalidation
+from app.crud.db_forecast import (
+    forecast_month,
+    parse_forecast_column,
+    set_forecast_delivery,
+)
+from app.crud.db_invoice import allocate_invoice_id
+from app.crud.db_stat import BONUS_BURN_SERVICE
+from app.crud.db_user import user_profiles
+from app.utils.pagination import Cursor, paginate_query
+
+# Итоги пакетного обновления по каждому id
+UPDATED = "updated"
+NOT_FOUND = "not_found"
+
+
+def _batch_outcomes(
+    cursor, table: str, key: str, ids: Iterable[int]
+) -> Dict[int, str]:
+    ids = list(dict.fromkeys(ids))
+    found = set()
+    # Лимит параметров SQLite: проверяем наличие строк порциями
+    for start in range(0, len(ids), 500):
+        chunk = ids[start : start + 500]
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT {key} FROM {table} WHERE {key} IN ({placeholders})",
+            chunk,
+        )
+        found.update(row[0] for row in cursor.fetchall())
+    return {i: UPDATED if i in found else NOT_FOUND for i in ids}
+
+
+def _updated_ids(outcomes: Dict[int, str]) -> List[tuple]:
+    return [(i,) for i, outcome in outcomes.items() if outcome == UPDATED]
+
 
 # @custom_logger.log_db_operation
 # def get_forecast_users(current_month):
@@ -19,34 +56,59 @@ from app.core.database import get_db_connection
 
 
 @custom_logger.log_db_operation
-def get_forecast_users(current_month):
-    column_name = f"{current_month}_send"
+def get_forecast_users(
+    current_month, after_id: Optional[int] = None, limit: Optional[int] = None
+):
+    month = forecast_month(current_month)
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        # Anti-join по первичному ключу forecast_deliveries (user_id, month)
         cursor.execute(
-            f"""
-            SELECT user_id, arcan
-            FROM monthly_forecasts
-            WHERE {column_name} = FALSE AND subscription = TRUE
-            GROUP BY user_id
-            """
+            *paginate_query(
+                """
+            SELECT f.user_id, f.arcan
+            FROM monthly_forecasts f
+            WHERE f.subscription = TRUE
+            AND NOT EXISTS (
+                SELECT 1 FROM forecast_deliveries d
+                WHERE d.user_id = f.user_id AND d.month = ? AND d.sent = TRUE
+            )
+            """,
+                (month,),
+                "user_id",
+                after_id,
+                limit,
+            )
         )
         return cursor.fetchall()
 
 
 @custom_logger.log_db_operation
 def update_forecast_status(user_id, column_name):
+    month, field = parse_forecast_column(column_name)
+    set_forecast_delivery(user_id, field, True, month)
+
+
+@custom_logger.log_db_operation
+def update_forecast_status_batch(
+    user_ids: List[int], column_name: str
+) -> Dict[int, str]:
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
+        month, field = parse_forecast_column(column_name)
+        outcomes = _batch_outcomes(
+            cursor, "monthly_forecasts", "user_id", user_ids
+        )
+        cursor.executemany(
             f"""
-            UPDATE monthly_forecasts
-            SET {column_name} = TRUE
-            WHERE user_id = ?
+            INSERT INTO forecast_deliveries (user_id, month, {field})
+            VALUES (?, ?, TRUE)
+            ON CONFLICT (user_id, month) DO UPDATE SET {field} = TRUE
             """,
-            (user_id,),
+            [(user_id, month) for (user_id,) in _updated_ids(outcomes)],
         )
         conn.commit()
+        return outcomes
 
 
 @custom_logger.log_db_operation
@@ -59,19 +121,30 @@ def reset_forecast_reminder():
             SET forecast_reminder = FALSE
             """
         )
+        publish_invalidation(conn, user_profiles)
         conn.commit()
 
 
 @custom_logger.log_db_operation
-def get_gift_users():
+def get_gift_users(
+    after_id: Optional[Cursor] = None, limit: Optional[int] = None
+):
     with get_db_connection() as conn:
         cursor = conn.cursor()
+        # user_id в gifts не уникален: курсор — пара (user_id, id)
         cursor.execute(
-            """
-            SELECT user_id
+            *paginate_query(
+                """
+            SELECT user_id, id
             FROM gifts
             WHERE already_take = FALSE
-            """
+            """,
+                (),
+                "user_id",
+                after_id,
+                limit,
+                tiebreak="id",
+            )
         )
         return cursor.fetchall()
 
@@ -91,6 +164,24 @@ def update_gift_status(user_id):
         conn.commit()
 
 
+@custom_logger.log_db_operation
+def update_gift_status_batch(user_ids: List[int]) -> Dict[int, str]:
+    gift_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        outcomes = _batch_outcomes(cursor, "gifts", "user_id", user_ids)
+        cursor.executemany(
+            """
+            UPDATE gifts
+            SET already_take = TRUE, gift_date = ?
+            WHERE user_id = ?
+            """,
+            [(gift_date, user_id) for (user_id,) in _updated_ids(outcomes)],
+        )
+        conn.commit()
+        return outcomes
+
+
 @custom_logger.log_db_operation
 def get_expired_bonuses():
     current_date = datetime.now()
@@ -137,6 +228,134 @@ def update_bonus_burned_status(bonus_id):
         conn.commit()
 
 
+@custom_logger.log_db_operation
+def update_bonus_burned_status_batch(bonus_ids: List[int]) -> Dict[int, str]:
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        outcomes = _batch_outcomes(
+            cursor, "expiration_bonus_movement", "id", bonus_ids
+        )
+        cursor.executemany(
+            """
+            UPDATE expiration_bonus_movement
+            SET flag_is_burned = TRUE
+            WHERE id = ?
+            """,
+            _updated_ids(outcomes),
+        )
+        conn.commit()
+        return outcomes
+
+
+def _unspent_lots(lots: List, spends: List) -> Dict[int, int]:
+    """Остаток каждой партии бонусов после списаний по FIFO.
+
+    Списание в момент date забирает баллы из самых ранних партий, открытых
+    в этот момент (add_date <= date < expire_date). Что не покрыто
+    партиями, ушло с постоянного баланса.
+    """
+    left = {lot["id"]: lot["bonus"] for lot in lots}
+    for spend in spends:
+        need = -spend["bonus"]
+        for lot in lots:
+            if need <= 0:
+                break
+            if not lot["add_date"] <= spend["date"] < lot["expire_date"]:
+                continue
+            taken = min(left[lot["id"]], need)
+            left[lot["id"]] -= taken
+            need -= taken
+    return left
+
+
+@custom_logger.log_db_operation
+def burn_expired_bonuses() -> Dict[str, int]:
+    """Сжигает все просроченные партии бонусов одной транзакцией.
+
+    Для каждого пользователя с просроченными партиями списания из
+    transactions раскладываются по его партиям (FIFO), и с баланса
+    снимается неизрасходованный остаток просроченных партий, но не больше
+    самого баланса; сгоревшая сумма пишется в transactions строкой с
+    service = BONUS_BURN_SERVICE. Заменяет цепочку expired_bonuses ->
+    spent_bonus -> update_bonus_burned_status.
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+        # Флаги ставятся первым запросом: он же берёт блокировку записи,
+        # и до commit ни другой прогон, ни списания не вклинятся
+        cursor.execute(
+            """
+            UPDATE expiration_bonus_movement
+            SET flag_is_burned = TRUE
+            WHERE expire_date <= ? AND flag_is_burned = FALSE
+            RETURNING id, user_id
+            """,
+            (datetime.now(),),
+        )
+        due: Dict[int, List[int]] = {}
+        for row in cursor.fetchall():
+            due.setdefault(row["user_id"], []).append(row["id"])
+
+        burned = 0
+        for user_id, lot_ids in due.items():
+            cursor.execute(
+                """
+                SELECT id, bonus, add_date, expire_date
+                FROM expiration_bonus_movement
+                WHERE user_id = ?
+                ORDER BY add_date, id
+                """,
+                (user_id,),
+            )
+            lots = cursor.fetchall()
+            # Прошлые сгорания — не траты: партии они уже закрыли
+            cursor.execute(
+                """
+                SELECT bonus, date
+                FROM transactions
+                WHERE user_id = ? AND bonus < 0 AND date >= ?
+                    AND service IS NOT ?
+                ORDER BY date
+                """,
+                (user_id, lots[0]["add_date"], BONUS_BURN_SERVICE),
+            )
+            left = _unspent_lots(lots, cursor.fetchall())
+            amount = sum(max(left[lot_id], 0) for lot_id in lot_ids)
+            cursor.execute(
+                "SELECT balance FROM loyalty WHERE user_id = ?", (user_id,)
+            )
+            row = cursor.fetchone()
+            amount = min(amount, max(row["balance"], 0)) if row else 0
+            if amount:
+                cursor.execute(
+                    """
+                    UPDATE loyalty
+                    SET balance = balance - ?
+                    WHERE user_id = ?
+                    """,
+                    (amount, user_id),
+                )
+                # Запись в журнале операций, чтобы баланс сходился с историей
+                cursor.execute(
+                    """
+                    INSERT INTO transactions
+                        (id, user_id, amount, bonus, service, comment, date)
+                    VALUES (?, ?, 0, ?, ?, ?, ?)
+                    """,
+                    (
+                        allocate_invoice_id(conn),
+                        user_id,
+                        -amount,
+                        BONUS_BURN_SERVICE,
+                        f"Сгорели партии бонусов: {len(lot_ids)}",
+                        datetime.now(),
+                    ),
+                )
+                burned += amount
+        lots_burned = sum(len(lot_ids) for lot_ids in due.values())
+    return {"lots": lots_burned, "users": len(due), "burned": burned}
+
+
 @custom_logger.log_db_operation
 def get_users_for_useful_message():
     current_time = datetime.now()
@@ -169,16 +388,43 @@ def update_useful_sent_status(user_id):
 
 
 @custom_logger.log_db_operation
-def get_users_not_in_forecasts():
+def update_useful_sent_status_batch(user_ids: List[int]) -> Dict[int, str]:
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        return cursor.execute(
+        outcomes = _batch_outcomes(
+            cursor, "monthly_forecasts", "user_id", user_ids
+        )
+        cursor.executemany(
             """
+            UPDATE monthly_forecasts
+            SET useful_sent = 2
+            WHERE user_id = ?
+            """,
+            _updated_ids(outcomes),
+        )
+        conn.commit()
+        return outcomes
+
+
+@custom_logger.log_db_operation
+def get_users_not_in_forecasts(
+    after_id: Optional[int] = None, limit: Optional[int] = None
+):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        return cursor.execute(
+            *paginate_query(
+                """
         SELECT user_id
         FROM users
         WHERE user_id NOT IN (SELECT user_id FROM monthly_forecasts)
         AND forecast_reminder = FALSE
-        """
+        """,
+                (),
+                "user_id",
+                after_id,
+                limit,
+            )
         ).fetchall()
 
 
@@ -0,0 +1,165 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import custom_logger
+from app.core.database import get_db_connection
+from app.crud.db_forecast import forecast_month
+
+# Раздел снимка -> (JOIN, ключ строки раздела, колонки).
+# Строка раздела отсутствует, если ключ после LEFT JOIN равен NULL.
+SNAPSHOT_SECTIONS: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    "user": (
+        "",
+        "u.user_id",
+        (
+            "u.username",
+            "u.chat_id",
+            "u.arcan",
+            "u.birth_date",
+            "u.first_name",
+            "u.discount_end",
+            "u.phone_number",
+        ),
+    ),
+    "loyalty": (
+        "LEFT JOIN loyalty l ON l.user_id = u.user_id",
+        "l.user_id",
+        (
+            "l.balance",
+            "l.total_spent",
+            "l.count_of_transaction",
+            "l.last_transaction_date",
+            "l.promo_code",
+            "l.referrer_id",
+        ),
+    ),
+    "city": (
+        "LEFT JOIN city c ON c.user_id = u.user_id",
+        "c.user_id",
+        (
+            "c.have_free_try",
+            "c.have_pay",
+            "c.last_transaction_date",
+            "c.recive_request",
+        ),
+    ),
+    "forecast": (
+        """
+        LEFT JOIN monthly_forecasts f ON f.user_id = u.user_id
+        LEFT JOIN forecast_deliveries fd
+            ON fd.user_id = u.user_id AND fd.month = :month
+        """,
+        "f.user_id",
+        (
+            "f.arcan",
+            "f.subscription",
+            "f.useful_sent",
+            "f.time_to_send_useful",
+            "COALESCE(fd.sent, FALSE) AS sent",
+            "fd.liked",
+        ),
+    ),
+    "cover": (
+        "LEFT JOIN cover_users cu ON cu.user_id = u.user_id",
+        "cu.user_id",
+        (
+            "cu.arcan",
+            "cu.attempts_left",
+            "cu.has_paid",
+            "cu.like_last",
+        ),
+    ),
+    "competition": (
+        "LEFT JOIN new_year_competition nc ON nc.user_id = u.user_id",
+        "nc.user_id",
+        (
+            "nc.status",
+            "nc.subscribe",
+            "nc.inst_username",
+            "nc.count_of_friends",
+            "nc.should_send_message",
+            "nc.refer_id",
+            "nc.secret_link",
+        ),
+    ),
+}
+
+
+def _column_name(column: str) -> str:
+    # "l.balance" -> "balance", "COALESCE(...) AS sent" -> "sent"
+    return column.rpartition(" AS ")[2].rpartition(".")[2]
+
+
+def parse_snapshot_fields(
+    fields: Optional[Iterable[str]],
+) -> Dict[str, List[str]]:
+    """Разбирает выбор полей: "loyalty", "city.have_free_try", ...
+
+    Без выбора возвращаются все разделы целиком. Неизвестный раздел или
+    поле — ValueError.
+    """
+    if not fields:
+        return {
+            section: [_column_name(column) for column in columns]
+            for section, (_, _, columns) in SNAPSHOT_SECTIONS.items()
+        }
+    selected: Dict[str, List[str]] = {}
+    for field in fields:
+        section, _, name = field.strip().partition(".")
+        if section not in SNAPSHOT_SECTIONS:
+            raise ValueError(f"Unknown snapshot section: {section}")
+        known = [_column_name(c) for c in SNAPSHOT_SECTIONS[section][2]]
+        if name and name not in known:
+            raise ValueError(f"Unknown snapshot field: {field}")
+        names = selected.setdefault(section, [])
+        for column in [name] if name else known:
+            if column not in names:
+                names.append(column)
+    return selected
+
+
+@custom_logger.log_db_operation
+def get_user_snapshot(
+    user_id: int, fields: Optional[Iterable[str]] = None
+) -> Optional[Dict[str, Any]]:
+    """Состояние пользователя по всем подсистемам одним запросом.
+
+    Подключаются только JOIN выбранных разделов. Раздел, в котором у
+    пользователя нет строки, возвращается как None; незнакомый
+    пользователь — None целиком.
+    """
+    selected = parse_snapshot_fields(fields)
+    joins = []
+    columns = []
+    for section, names in selected.items():
+        join, key, section_columns = SNAPSHOT_SECTIONS[section]
+        joins.append(join)
+        columns.append(f'{key} AS "{section}.__key"')
+        for column in section_columns:
+            name = _column_name(column)
+            if name in names:
+                expression = column.rpartition(" AS ")[0] or column
+                columns.append(f'{expression} AS "{section}.{name}"')
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # В users user_id не уникален: берём первую строку, как get_user
+        cursor.execute(
+            f"""
+            SELECT {", ".join(columns)}
+            FROM users u
+            {" ".join(joins)}
+            WHERE u.id = (SELECT MIN(id) FROM users WHERE user_id = :user_id)
+            """,
+            {"user_id": user_id, "month": forecast_month()},
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+
+    snapshot: Dict[str, Any] = {"user_id": user_id}
+    for section, names in selected.items():
+        if row[f"{section}.__key"] is None:
+            snapshot[section] = None
+            continue
+        snapshot[section] = {name: row[f"{section}.{name}"] for name in names}
+    return snapshot
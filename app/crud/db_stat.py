@@ -1,8 +1,171 @@
+import threading
+from collections import Counter
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple
 
-from app.core.config import custom_logger
-from app.core.database import get_db_connection
+from app.core.config import custom_logger, settings
+from app.core.database import get_db_connection, outside_unit_of_work
+
+# Дневные счётчики статистики пополняет сама база триггерами на исходных
+# таблицах, поэтому ни один путь записи не может их обойти. День '' —
+# строки без даты: в периоды они не входят, в total_users входят.
+_USER_DELTA = """
+    INSERT INTO user_daily_stats (day, new_users)
+    VALUES (COALESCE(date({row}.first_meet), ''), {sign}1)
+    ON CONFLICT (day) DO UPDATE SET
+        new_users = new_users + excluded.new_users;
+"""
+_TRANSACTION_DELTA = """
+    INSERT INTO transaction_daily_stats
+        (day, service, count, amount, credited, debited)
+    SELECT
+        COALESCE(date({row}.date), ''),
+        COALESCE({row}.service, ''),
+        {sign}1,
+        {sign}COALESCE({row}.amount, 0),
+        {sign}MAX(COALESCE({row}.bonus, 0), 0),
+        {sign}MAX(-COALESCE({row}.bonus, 0), 0)
+    WHERE {row}.service IS NOT '{burn}'
+    ON CONFLICT (day, service) DO UPDATE SET
+        count = count + excluded.count,
+        amount = amount + excluded.amount,
+        credited = credited + excluded.credited,
+        debited = debited + excluded.debited;
+"""
+_CITY_DELTA = """
+    INSERT INTO city_daily_stats (day, count, amount, tips_count, tips_amount)
+    SELECT
+        COALESCE(date({row}.pay_date), ''),
+        {sign}1,
+        {sign}COALESCE({row}.amount, 0),
+        {sign}(COALESCE({row}.amount, 0) > {price}),
+        {sign}MAX(COALESCE({row}.amount, 0) - {price}, 0)
+    WHERE {row}.pay_date IS NOT NULL
+    ON CONFLICT (day) DO UPDATE SET
+        count = count + excluded.count,
+        amount = amount + excluded.amount,
+        tips_count = tips_count + excluded.tips_count,
+        tips_amount = tips_amount + excluded.tips_amount;
+"""
+_CITY_CHECK_DELTA = """
+    INSERT INTO stat_totals (name, value)
+    VALUES ('checked_cities', {sign}1)
+    ON CONFLICT (name) DO UPDATE SET value = value + excluded.value;
+"""
+# Цена совместимости с городом; всё, что заплачено сверх, — чаевые
+CITY_COMPATIBILITY_PRICE = 270
+# Ключ общего счётчика проверенных городов в stat_totals
+CHECKED_CITIES = "checked_cities"
+# service строк transactions, которыми burn_expired_bonuses списывает
+# сгоревшие бонусы: это не покупки, в статистику они не входят
+BONUS_BURN_SERVICE = "bonus_burn"
+
+
+def _rollup_triggers(
+    name: str, table: str, delta: str, columns: str
+) -> Dict[str, str]:
+    params = {"price": CITY_COMPATIBILITY_PRICE, "burn": BONUS_BURN_SERVICE}
+    added = delta.format(row="NEW", sign="", **params)
+    removed = delta.format(row="OLD", sign="-", **params)
+    return {
+        f"trg_{name}_stats_insert": (
+            f"AFTER INSERT ON {table} BEGIN {added} END"
+        ),
+        f"trg_{name}_stats_delete": (
+            f"AFTER DELETE ON {table} BEGIN {removed} END"
+        ),
+        f"trg_{name}_stats_update": (
+            f"AFTER UPDATE OF {columns} ON {table} "
+            f"BEGIN {removed} {added} END"
+        ),
+    }
+
+
+STAT_ROLLUP_TRIGGERS = {
+    **_rollup_triggers("users", "users", _USER_DELTA, "first_meet"),
+    **_rollup_triggers(
+        "transactions",
+        "transactions",
+        _TRANSACTION_DELTA,
+        "amount, bonus, service, date",
+    ),
+    **_rollup_triggers(
+        "city_transactions",
+        "city_transactions",
+        _CITY_DELTA,
+        "amount, pay_date",
+    ),
+    **_rollup_triggers(
+        "city_checks", "city_checks", _CITY_CHECK_DELTA, "user_id"
+    ),
+}
+
+
+@custom_logger.log_db_operation
+def rebuild_statistics_rollups():
+    """Пересчитывает дневные счётчики с нуля по исходным таблицам.
+
+    Нужен один раз при появлении триггеров и для ручной сверки.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM user_daily_stats")
+        cursor.execute(
+            """
+            INSERT INTO user_daily_stats (day, new_users)
+            SELECT COALESCE(date(first_meet), ''), COUNT(*)
+            FROM users
+            GROUP BY 1
+        """
+        )
+        cursor.execute("DELETE FROM transaction_daily_stats")
+        cursor.execute(
+            """
+            INSERT INTO transaction_daily_stats
+                (day, service, count, amount, credited, debited)
+            SELECT
+                COALESCE(date(date), ''),
+                COALESCE(service, ''),
+                COUNT(*),
+                COALESCE(SUM(amount), 0),
+                SUM(MAX(COALESCE(bonus, 0), 0)),
+                SUM(MAX(-COALESCE(bonus, 0), 0))
+            FROM transactions
+            WHERE service IS NOT ?
+            GROUP BY 1, 2
+        """,
+            (BONUS_BURN_SERVICE,),
+        )
+        cursor.execute("DELETE FROM city_daily_stats")
+        cursor.execute(
+            """
+            INSERT INTO city_daily_stats
+                (day, count, amount, tips_count, tips_amount)
+            SELECT
+                COALESCE(date(pay_date), ''),
+                COUNT(*),
+                COALESCE(SUM(amount), 0),
+                SUM(COALESCE(amount, 0) > ?),
+                SUM(MAX(COALESCE(amount, 0) - ?, 0))
+            FROM city_transactions
+            WHERE pay_date IS NOT NULL
+            GROUP BY 1
+        """,
+            (CITY_COMPATIBILITY_PRICE, CITY_COMPATIBILITY_PRICE),
+        )
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO stat_totals (name, value)
+            SELECT ?, COUNT(*) FROM city_checks
+        """,
+            (CHECKED_CITIES,),
+        )
+        conn.commit()
+
+
+def _period_days(start_date: datetime, end_date: datetime) -> Tuple[str, str]:
+    # Счётчики дневные: период округляется до целых дней
+    return start_date.date().isoformat(), end_date.date().isoformat()
 
 
 @custom_logger.log_db_operation
@@ -21,56 +184,49 @@ def get_statistics(period: str) -> Dict:
         )
     else:
         raise ValueError("Invalid period")
+    start_day, end_day = _period_days(start_date, end_date)
 
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
-        # Новые пользователи за выбранный период
+        # Новые пользователи за выбранный период и всего
         cursor.execute(
             """
-            SELECT COUNT(*) FROM users
-            WHERE first_meet >= ? AND first_meet <= ?
+            SELECT
+                COALESCE(SUM(new_users) FILTER (
+                    WHERE day >= ? AND day <= ?
+                ), 0),
+                COALESCE(SUM(new_users), 0)
+            FROM user_daily_stats
         """,
-            (start_date, end_date),
+            (start_day, end_day),
         )
-        new_users = cursor.fetchone()[0]
+        new_users, total_users = cursor.fetchone()
 
-        # Всего уникальных пользователей
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-
-        # Количество и сумма покупок вне бота
+        # Покупки вне бота, начисленные и списанные баллы
         cursor.execute(
             """
-            SELECT COUNT(*), SUM(amount)
-            FROM transactions
-            WHERE date >= ? AND date <= ?
+            SELECT SUM(count), SUM(amount), SUM(credited), SUM(debited)
+            FROM transaction_daily_stats
+            WHERE day >= ? AND day <= ?
         """,
-            (start_date, end_date),
+            (start_day, end_day),
         )
-        external_purchases, external_amount = cursor.fetchone()
-
-        # Начисленные и списанные баллы
-        cursor.execute(
-            """
-            SELECT 
-                SUM(CASE WHEN bonus > 0 THEN bonus ELSE 0 END) as credited,
-                SUM(CASE WHEN bonus < 0 THEN ABS(bonus) ELSE 0 END) as debited
-            FROM transactions
-            WHERE date >= ? AND date <= ?
-        """,
-            (start_date, end_date),
-        )
-        credited_points, debited_points = cursor.fetchone()
+        (
+            external_purchases,
+            external_amount,
+            credited_points,
+            debited_points,
+        ) = cursor.fetchone()
 
         # Количество и сумма покупок в боте
         cursor.execute(
             """
-            SELECT COUNT(*), SUM(amount)
-            FROM city_transactions
-            WHERE pay_date >= ? AND pay_date <= ?
+            SELECT SUM(count), SUM(amount)
+            FROM city_daily_stats
+            WHERE day >= ? AND day <= ?
         """,
-            (start_date, end_date),
+            (start_day, end_day),
         )
         bot_purchases, bot_amount = cursor.fetchone()
 
@@ -103,40 +259,39 @@ def get_statistics(period: str) -> Dict:
 def get_services_statistics(
     cursor, start_date: datetime, end_date: datetime
 ) -> List[Tuple[str, int, int]]:
-    # Получаем статистику по обычным услугам
+    start_day, end_day = _period_days(start_date, end_date)
+    # Получаем статистику по обычным услугам (без названия — пустая строка)
     cursor.execute(
         """
-        SELECT service, SUM(amount) as total_amount, COUNT(*) as count
-        FROM transactions
-        WHERE date >= ? AND date <= ?
+        SELECT
+            service,
+            SUM(amount) as total_amount,
+            SUM(count) as count
+        FROM transaction_daily_stats
+        WHERE day >= ? AND day <= ?
         GROUP BY service
+        HAVING SUM(count) > 0
         ORDER BY total_amount DESC
     """,
-        (start_date, end_date),
+        (start_day, end_day),
     )
 
-    services = cursor.fetchall()
+    services = [tuple(row) for row in cursor.fetchall()]
 
     # Получаем статистику по совместимости с городом и чаевым
     cursor.execute(
         """
-        SELECT amount
-        FROM city_transactions
-        WHERE pay_date >= ? AND pay_date <= ?
+        SELECT
+            COALESCE(SUM(count), 0),
+            COALESCE(SUM(tips_count), 0),
+            COALESCE(SUM(tips_amount), 0)
+        FROM city_daily_stats
+        WHERE day >= ? AND day <= ?
     """,
-        (start_date, end_date),
-    )
-
-    city_transactions = cursor.fetchall()
-
-    compatibility_count = len(city_transactions)
-    compatibility_amount = 270 * compatibility_count
-    tips_amount = sum(
-        max(0, transaction[0] - 270) for transaction in city_transactions
-    )
-    tips_count = sum(
-        1 for transaction in city_transactions if transaction[0] > 270
+        (start_day, end_day),
     )
+    compatibility_count, tips_count, tips_amount = cursor.fetchone()
+    compatibility_amount = CITY_COMPATIBILITY_PRICE * compatibility_count
 
     # Добавляем статистику по совместимости и чаевым к общему списку услуг
     services.append(
@@ -151,46 +306,92 @@ def get_services_statistics(
     return services
 
 
+class StatCounterBuffer:
+    """Копит инкременты счётчиков stat в памяти и пишет их пачкой.
+
+    Сброс — одним UPSERT на все накопленные id: по таймеру из lifespan
+    приложения (flush_interval_ms), при накоплении max_events событий
+    и перед каждым чтением stat, чтобы итоги всегда сходились.
+    """
+
+    def __init__(self, max_events: int):
+        self.max_events = max_events
+        self._pending: Counter = Counter()
+        self._events = 0
+        self._lock = threading.Lock()
+
+    def add(self, counter_id: int):
+        with self._lock:
+            self._pending[counter_id] += 1
+            self._events += 1
+            full = self._events >= self.max_events
+        if full:
+            self.flush()
+
+    def _take(self) -> Counter:
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._events = 0
+        return pending
+
+    def discard(self):
+        self._take()
+
+    def flush(self) -> int:
+        """Пишет буфер своим соединением и сразу фиксирует.
+
+        В буфере инкременты разных запросов, поэтому сброс не входит в
+        единицу работы или транзакцию того, кто его вызвал.
+        """
+        pending = self._take()
+        if not pending:
+            return 0
+        try:
+            with outside_unit_of_work(), get_db_connection() as conn:
+                conn.cursor().executemany(
+                    """
+                    INSERT INTO stat (id, counter) VALUES (?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        counter = counter + excluded.counter
+                    """,
+                    pending.items(),
+                )
+                conn.commit()
+        except Exception:
+            # Не теряем инкременты: вернём их в буфер до следующего сброса
+            with self._lock:
+                self._pending.update(pending)
+                self._events += sum(pending.values())
+            raise
+        return sum(pending.values())
+
+
+stat_counters = StatCounterBuffer(max_events=settings.STAT_FLUSH_MAX_EVENTS)
+
+
 @custom_logger.log_db_operation
 def incriment_stat_counter(counter_id: int):
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        # Проверяем существует ли счетчик
-        cursor.execute("SELECT id FROM stat WHERE id = ?", (counter_id,))
-        exists = cursor.fetchone()
+    stat_counters.add(counter_id)
 
-        if not exists:
-            # Если счетчик не существует, создаем его
-            cursor.execute(
-                "INSERT INTO stat (id, counter) VALUES (?, 0)", (counter_id,)
-            )
 
-        # Увеличиваем значение счетчика
-        cursor.execute(
-            "UPDATE stat SET counter = counter + 1 WHERE id = ?", (counter_id,)
-        )
-        conn.commit()
+@custom_logger.log_db_operation
+def flush_stat_counters() -> int:
+    return stat_counters.flush()
 
 
 @custom_logger.log_db_operation
 def clean_stat_and_put_today_date():
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        # cursor.execute("SELECT UNIQUE(id) FROM stat")
-        # Получаем количество уникальных пользователей
-        cursor.execute("SELECT DISTINCT id FROM stat")
-        count_of_users = (
-            len(unique_ids) if (unique_ids := cursor.fetchall()) else 0
-        )
-        if res := cursor.execute(
-            "SELECT COALESCE(SUM(counter), 0) FROM stat"
-        ).fetchone():
-            action_count = res[0]
-        else:
-            action_count = 0
-
-        cursor.execute("DELETE FROM stat")
-        conn.commit()
+        # Сначала досылаем буфер; всё, что придёт позже, попадёт уже
+        # в следующий день
+        stat_counters.flush()
+        # Забираем и обнуляем счётчики одним запросом, чтобы сброс буфера
+        # из другого потока не попал между чтением и удалением
+        cursor.execute("DELETE FROM stat RETURNING id, counter")
+        counters = cursor.fetchall()
+        count_of_users = len(counters)
+        action_count = sum(row["counter"] or 0 for row in counters)
         cursor.execute(
             "INSERT INTO every_day_stat (date, actions_count, unique_users) VALUES (?, ?, ?)",
             (
@@ -204,6 +405,7 @@ def clean_stat_and_put_today_date():
 
 @custom_logger.log_db_operation
 def del_stat():
+    stat_counters.discard()
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM stat")
@@ -212,6 +414,7 @@ def del_stat():
 
 @custom_logger.log_db_operation
 def get_all_count():
+    stat_counters.flush()
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT COALESCE(SUM(counter), 0) FROM stat")
@@ -222,20 +425,10 @@ def get_all_count():
 @custom_logger.log_db_operation
 def count_checked_cities(cursor) -> int:
     cursor.execute(
-        """
-        SELECT cities_checked
-        FROM city
-        WHERE cities_checked IS NOT NULL
-    """
+        "SELECT value FROM stat_totals WHERE name = ?", (CHECKED_CITIES,)
     )
-    cities_lists = cursor.fetchall()
-
-    total_cities = 0
-    for cities_string in cities_lists:
-        cities = cities_string[0].split(",")
-        total_cities += len(cities)
-
-    return total_cities
+    result = cursor.fetchone()
+    return result[0] if result else 0
 
 
 @custom_logger.log_db_operation
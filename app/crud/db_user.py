@@ -1,8 +1,38 @@
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
-from app.core.config import custom_logger
+from app.core.cache import Cache
+from app.core.config import custom_logger, settings
 from app.core.database import get_db_connection
+from app.crud.db_cache import load_cached, publish_invalidation
+
+# Строка users целиком по user_id (None — пользователя нет). Сбрасывается
+# set_*-функциями, которые меняют строку, во всех воркерах (db_cache).
+user_profiles = Cache(
+    ttl=settings.USER_PROFILE_CACHE_TTL,
+    maxsize=settings.USER_PROFILE_CACHE_SIZE,
+    name="user_profiles",
+)
+
+
+def _forget_profiles(conn, rows):
+    publish_invalidation(conn, user_profiles, [row["user_id"] for row in rows])
+
+
+def _load_user_profile(user_id: int) -> Optional[Dict[str, Any]]:
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        result = cursor.fetchone()
+        return dict(result) if result else None
+
+
+@custom_logger.log_db_operation
+def get_user_profile(user_id: int) -> Optional[Dict[str, Any]]:
+    profile = load_cached(
+        user_profiles, user_id, lambda: _load_user_profile(user_id)
+    )
+    return dict(profile) if profile else None
 
 
 @custom_logger.log_db_operation
@@ -24,6 +54,7 @@ def add_user(
             "INSERT INTO gifts (user_id, already_take) VALUES (?, FALSE)",
             (chat_id,),
         )
+        publish_invalidation(conn, user_profiles, [user_id])
         conn.commit()
 
 
@@ -93,21 +124,57 @@ def get_all_users_list() -> List[Dict[str, Any]]:
 
 
 @custom_logger.log_db_operation
-def get_user(user_id: int):
+def get_users_page(after_id: int, limit: int) -> List[Dict[str, Any]]:
+    # Keyset-страница по индексу idx_users_user_id, без OFFSET и сортировки
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        return cursor.fetchone()
+        cursor.execute(
+            """
+            SELECT user_id, chat_id, COALESCE(username, '') as username
+            FROM users
+            WHERE user_id > ?
+            GROUP BY user_id
+            ORDER BY user_id
+            LIMIT ?
+            """,
+            (after_id, limit),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def iter_users(
+    after_id: int = 0, limit: Optional[int] = None, chunk_size: int = 1000
+) -> Iterator[Dict[str, Any]]:
+    """Пользователи по возрастанию user_id, порциями по chunk_size.
+
+    Соединение берётся из пула только на время чтения порции и не
+    удерживается, пока клиент забирает ответ.
+    """
+    sent = 0
+    while limit is None or sent < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - sent)
+        page = get_users_page(after_id, size)
+        yield from page
+        sent += len(page)
+        if len(page) < size:
+            return
+        after_id = page[-1]["user_id"]
+
+
+@custom_logger.log_db_operation
+def get_user(user_id: int):
+    return get_user_profile(user_id)
 
 
 @custom_logger.log_db_operation
 def set_birth_date(chat_id: int, birth_date: str):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET first_name = ? WHERE chat_id = ?",
+        updated = cursor.execute(
+            "UPDATE users SET first_name = ? WHERE chat_id = ? RETURNING user_id",
             (birth_date, chat_id),
-        )
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
@@ -115,50 +182,40 @@ def set_birth_date(chat_id: int, birth_date: str):
 def set_phone_number(chat_id: int, phone_number: str):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET phone_number = ? WHERE chat_id = ?",
+        updated = cursor.execute(
+            "UPDATE users SET phone_number = ? WHERE chat_id = ? RETURNING user_id",
             (phone_number, chat_id),
-        )
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
 @custom_logger.log_db_operation
 def is_user_exists(user_id: int) -> bool:
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        result = cursor.execute(
-            "SELECT user_id FROM users WHERE user_id = ?", (user_id,)
-        )
-        return result.fetchone() is not None
+    return get_user_profile(user_id) is not None
 
 
 @custom_logger.log_db_operation
 def is_already_know_birth(user_id: int) -> bool:
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        result = cursor.execute(
-            "SELECT first_name FROM users WHERE user_id = ?", (user_id,)
-        ).fetchone()
-        return result is not None and result["first_name"] is not None
+    profile = get_user_profile(user_id)
+    return profile is not None and profile.get("first_name") is not None
 
 
 @custom_logger.log_db_operation
 def get_arcan(user_id: int):
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        result = cursor.execute(
-            "SELECT arcan FROM users WHERE user_id = ?", (user_id,)
-        ).fetchone()
-        return result["arcan"] if result else None
+    profile = get_user_profile(user_id)
+    return profile.get("arcan") if profile else None
 
 
 @custom_logger.log_db_operation
 def set_arcan(user_id: int, arcan: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        result = cursor.execute(
-            "UPDATE users SET arcan = ? WHERE user_id = ?", (arcan, user_id)
-        )
+        updated = cursor.execute(
+            "UPDATE users SET arcan = ? WHERE user_id = ? RETURNING user_id",
+            (arcan, user_id),
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
@@ -166,9 +223,11 @@ def set_arcan(user_id: int, arcan: int):
 def db_no_friend(id: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET no_friend = ? WHERE user_id = ?", ("TRUE", id)
-        )
+        updated = cursor.execute(
+            "UPDATE users SET no_friend = ? WHERE user_id = ? RETURNING user_id",
+            ("TRUE", id),
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
@@ -176,30 +235,29 @@ def db_no_friend(id: int):
 def set_advert(id: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET after_advert = ? WHERE user_id = ?", ("Yes", id)
-        )
+        updated = cursor.execute(
+            "UPDATE users SET after_advert = ? WHERE user_id = ? RETURNING user_id",
+            ("Yes", id),
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
 @custom_logger.log_db_operation
 def get_first_sphere(user_id: int) -> Optional[int]:
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        result = cursor.execute(
-            "SELECT first_sphere FROM users WHERE user_id = ?", (user_id,)
-        ).fetchone()
-        return result["first_sphere"] if result else None
+    profile = get_user_profile(user_id)
+    return profile.get("first_sphere") if profile else None
 
 
 @custom_logger.log_db_operation
 def set_first_sphere(user_id: int, sphere: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET first_sphere = ? WHERE user_id = ?",
+        updated = cursor.execute(
+            "UPDATE users SET first_sphere = ? WHERE user_id = ? RETURNING user_id",
             (sphere, user_id),
-        )
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
@@ -207,10 +265,11 @@ def set_first_sphere(user_id: int, sphere: int):
 def add_points(user_id: int, points: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET points = points + ? WHERE id = ?",
+        updated = cursor.execute(
+            "UPDATE users SET points = points + ? WHERE id = ? RETURNING user_id",
             (points, user_id),
-        )
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
@@ -227,13 +286,14 @@ def what_choose_in_march(id: int):
 def set_already_receive_one(chat_id: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET alredy_recive_one = ? WHERE chat_id = ?",
+        updated = cursor.execute(
+            "UPDATE users SET alredy_recive_one = ? WHERE chat_id = ? RETURNING user_id",
             (
                 "True",
                 chat_id,
             ),
-        )
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
@@ -241,13 +301,14 @@ def set_already_receive_one(chat_id: int):
 def set_already_receive_all_march(chat_id: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET march_send_all = ? WHERE chat_id = ?",
+        updated = cursor.execute(
+            "UPDATE users SET march_send_all = ? WHERE chat_id = ? RETURNING user_id",
             (
                 "True",
                 chat_id,
             ),
-        )
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
@@ -255,13 +316,14 @@ def set_already_receive_all_march(chat_id: int):
 def set_discount_end(chat_id: int, discount_end: str):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET discount_end = ? WHERE chat_id = ?",
+        updated = cursor.execute(
+            "UPDATE users SET discount_end = ? WHERE chat_id = ? RETURNING user_id",
             (
                 discount_end,
                 chat_id,
             ),
-        )
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
@@ -269,46 +331,33 @@ def set_discount_end(chat_id: int, discount_end: str):
 def set_user_received_all_files(user_id: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET already_have_all_files = ? WHERE user_id = ?",
+        updated = cursor.execute(
+            "UPDATE users SET already_have_all_files = ? WHERE user_id = ? RETURNING user_id",
             (
                 "True",
                 user_id,
             ),
-        )
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
 @custom_logger.log_db_operation
 def check_if_user_received_one_file(user_id: int) -> Optional[str]:
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT alredy_recive_one FROM users WHERE user_id = ?", (user_id,)
-        )
-        result = cursor.fetchone()
-        return result["alredy_recive_one"] if result else None
+    profile = get_user_profile(user_id)
+    return profile.get("alredy_recive_one") if profile else None
 
 
 @custom_logger.log_db_operation
 def get_nik(id: int) -> Optional[str]:
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT username FROM users WHERE user_id = ?", (id,))
-        result = cursor.fetchone()
-        return result["username"] if result else None
+    profile = get_user_profile(id)
+    return profile.get("username") if profile else None
 
 
 @custom_logger.log_db_operation
 def check_if_user_received_all_files(user_id: int) -> Optional[str]:
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT already_have_all_files FROM users WHERE user_id = ?",
-            (user_id,),
-        )
-        result = cursor.fetchone()
-        return result["already_have_all_files"] if result else None
+    profile = get_user_profile(user_id)
+    return profile.get("already_have_all_files") if profile else None
 
 
 @custom_logger.log_db_operation
@@ -438,10 +487,11 @@ def get_comp_send_false_and_no_one_per() -> List[int]:
 def set_comp_send_true(chat_id: int, set_value: bool):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET comp_send = ? WHERE chat_id = ?",
+        updated = cursor.execute(
+            "UPDATE users SET comp_send = ? WHERE chat_id = ? RETURNING user_id",
             (set_value, chat_id),
-        )
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
@@ -449,9 +499,11 @@ def set_comp_send_true(chat_id: int, set_value: bool):
 def set_time(time: str, chat_id: int):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET time = ? WHERE chat_id = ?", (time, chat_id)
-        )
+        updated = cursor.execute(
+            "UPDATE users SET time = ? WHERE chat_id = ? RETURNING user_id",
+            (time, chat_id),
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
 
 
@@ -459,8 +511,9 @@ def set_time(time: str, chat_id: int):
 def add_info(chat_id: int, info: str):
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET next_month = ? WHERE chat_id = ?",
+        updated = cursor.execute(
+            "UPDATE users SET next_month = ? WHERE chat_id = ? RETURNING user_id",
             (info, chat_id),
-        )
+        ).fetchall()
+        _forget_profiles(conn, updated)
         conn.commit()
@@ -1,9 +1,43 @@
-from app.core.database import get_db_connection
-from app.crud.db_forecast import add_month_column
+from app.core.database import apply_engine_profile, get_db_connection
+from app.crud.db_broadcasts import (
+    BROADCAST_STATUS_TRIGGERS,
+    rebuild_broadcast_statuses,
+)
+from app.crud.db_city import migrate_cities_checked
+from app.crud.db_forecast import migrate_month_columns
+from app.crud.db_paid_tasks import PAID_TASK_TRIGGERS, backfill_paid_tasks
+from app.crud.db_stat import STAT_ROLLUP_TRIGGERS, rebuild_statistics_rollups
+
+# Индексы под горячие выборки из app/crud (проверяются app.utils.query_audit).
+# loyalty.promo_code и city.user_id уже покрыты автоиндексами UNIQUE.
+INDEXES = {
+    "idx_users_user_id": "users (user_id)",
+    "idx_users_chat_id": "users (chat_id)",
+    "idx_users_first_meet": "users (first_meet)",
+    "idx_transactions_user_date": "transactions (user_id, date)",
+    "idx_transactions_date": "transactions (date)",
+    "idx_city_transactions_user": "city_transactions (user_id, create_date)",
+    "idx_city_transactions_pay_date": "city_transactions (pay_date)",
+    "idx_task_city_transactions_user": "task_city_transactions (user_id)",
+    "idx_gifts_user_id": "gifts (user_id)",
+    "idx_new_year_competition_secret_link": "new_year_competition (secret_link)",
+    "idx_new_year_competition_status": "new_year_competition (status)",
+    "idx_expiration_bonus_due": "expiration_bonus_movement (flag_is_burned, expire_date)",
+    "idx_expiration_bonus_user": "expiration_bonus_movement (user_id, add_date, id)",
+    "idx_monthly_forecasts_useful": "monthly_forecasts (useful_sent, time_to_send_useful)",
+    "idx_arcan_descriptions_month": "arcan_descriptions (month)",
+    "idx_important_mes_id_name": "important_mes_id (mes_name)",
+    "idx_broadcast_events_broadcast": "broadcast_events (broadcast, event_at)",
+    "idx_broadcast_events_user": "broadcast_events (user_id, broadcast)",
+    "idx_broadcast_daily_stats_day": "broadcast_daily_stats (day)",
+    "idx_points_holds_due": "points_holds (status, expires_at)",
+}
 
 
 def init_db():
     with get_db_connection() as conn:
+        # Включаем WAL и остальной профиль движка (journal_mode сохраняется в файле базы)
+        apply_engine_profile(conn, persistent=True)
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -18,6 +52,23 @@ def init_db():
             )
         """
         )
+        # Проверенные пользователем города, по строке на город
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS city_checks (
+                user_id INTEGER NOT NULL,
+                city_name TEXT NOT NULL,
+                checked_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        """
+        )
+        cursor.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_city_checks_user_city
+            ON city_checks (user_id, city_name)
+        """
+        )
         cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS stat (
@@ -82,6 +133,47 @@ def init_db():
         """
         )
         # status BOOL DEFAULT FALSE,
+        # Проведённые уведомления об оплате: повтор по InvId не проводится
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed_invoices (
+                inv_id INTEGER PRIMARY KEY,
+                invoice_type TEXT,
+                user_id INTEGER,
+                out_sum TEXT,
+                processed_at TIMESTAMP
+            )
+        """
+        )
+        # Журнал сбросов кэшей процесса для других воркеров (app.crud.db_cache)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_invalidations (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                cache TEXT NOT NULL,
+                key TEXT,
+                created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+            )
+        """
+        )
+        # Лента оплаченных задач для бота (app.crud.db_paid_tasks)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS paid_tasks (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                task_id INTEGER NOT NULL,
+                user_id INTEGER,
+                created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+            )
+        """
+        )
+        cursor.execute(
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_paid_tasks_task
+            ON paid_tasks (kind, task_id)
+        """
+        )
 
         # Создание таблицы транзакций
         cursor.execute(
@@ -158,6 +250,18 @@ def init_db():
         )
         """
         )
+        # Доставка и лайки прогноза: строка на пользователя и месяц ("2024-10")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS forecast_deliveries (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                sent BOOLEAN NOT NULL DEFAULT FALSE,
+                liked BOOLEAN DEFAULT NULL,
+                PRIMARY KEY (user_id, month)
+            ) WITHOUT ROWID
+        """
+        )
 
         # Создание таблицы лояльности
         cursor.execute(
@@ -207,6 +311,97 @@ def init_db():
             )
         """
         )
+        # Последовательность номеров счетов (InvId) для всех видов транзакций
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS id_sequences (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """
+        )
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO id_sequences (name, value)
+            SELECT 'invoice', COALESCE(MAX(id), 0) FROM (
+                SELECT MAX(id) AS id FROM city_transactions
+                UNION ALL
+                SELECT MAX(id) FROM transactions
+                UNION ALL
+                SELECT MAX(id) FROM pre_transactions
+            )
+        """
+        )
+        # Реестр счетов: тип счёта по InvId для вебхука оплаты
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS invoices (
+                id INTEGER PRIMARY KEY,
+                type TEXT NOT NULL,
+                user_id INTEGER,
+                created_at TIMESTAMP
+            )
+        """
+        )
+        # Дозаполняем реестр счетами, созданными до его появления
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM invoices")
+        registered_up_to = cursor.fetchone()[0]
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO invoices (id, type, user_id, created_at)
+            SELECT id, 'city', user_id, COALESCE(create_date, pay_date)
+            FROM city_transactions
+            WHERE id > ?
+        """,
+            (registered_up_to,),
+        )
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO invoices (id, type, user_id, created_at)
+            SELECT id, 'product', user_id, date FROM pre_transactions
+            WHERE id > ?
+        """,
+            (registered_up_to,),
+        )
+        # Резервы баллов лояльности (app.crud.db_points)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS points_holds (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                points INTEGER NOT NULL CHECK (points > 0),
+                status TEXT NOT NULL
+                    CHECK (status IN ('held', 'confirmed', 'released')),
+                created_at TIMESTAMP NOT NULL,
+                expires_at TIMESTAMP NOT NULL,
+                settled_at TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        """
+        )
+        # Состояние задач встроенного планировщика (app.scheduler)
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scheduler_jobs (
+                name TEXT PRIMARY KEY,
+                last_run_at TIMESTAMP,
+                last_status TEXT,
+                last_error TEXT,
+                last_duration_ms REAL,
+                runs INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        """
+        )
+        # Аренда блокировки: задачи выполняет только её владелец
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scheduler_lock (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                owner TEXT NOT NULL,
+                expires_at TIMESTAMP NOT NULL
+            )
+        """
+        )
         # Создание таблицы временных бонусов
         cursor.execute(
             """
@@ -262,6 +457,107 @@ def init_db():
             """
         )
 
+        # Реестр рассылок: имя появляется при создании или с первым событием
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS broadcast_names (
+                name TEXT PRIMARY KEY,
+                created_at TIMESTAMP
+            ) WITHOUT ROWID
+            """
+        )
+
+        # Журнал доставки рассылок: только добавление, строка на событие
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS broadcast_events (
+                id INTEGER PRIMARY KEY,
+                broadcast TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL CHECK (status IN ('delivered', 'failed')),
+                event_at TIMESTAMP NOT NULL
+            )
+            """
+        )
+        # Итоговый статус рассылки у пользователя: строка на пару
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'broadcast_statuses'"
+        )
+        has_broadcast_statuses = cursor.fetchone() is not None
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS broadcast_statuses (
+                broadcast TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL CHECK (status IN ('delivered', 'failed')),
+                updated_at TIMESTAMP,
+                PRIMARY KEY (broadcast, user_id)
+            ) WITHOUT ROWID
+            """
+        )
+        # Счётчики по дням из итоговых статусов, ведутся триггерами
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS broadcast_daily_stats (
+                broadcast TEXT NOT NULL,
+                day DATE NOT NULL,
+                delivered INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (broadcast, day)
+            )
+            """
+        )
+        # Рассылки, созданные до реестра, известны по их событиям
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO broadcast_names (name, created_at)
+            SELECT broadcast, MIN(day) FROM broadcast_daily_stats
+            GROUP BY broadcast
+            """
+        )
+
+        # Дневные счётчики для /api/statistics, ведутся триггерами
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS stat_totals (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_daily_stats (
+                day TEXT PRIMARY KEY,
+                new_users INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS transaction_daily_stats (
+                day TEXT NOT NULL,
+                service TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                amount INTEGER NOT NULL DEFAULT 0,
+                credited INTEGER NOT NULL DEFAULT 0,
+                debited INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, service)
+            ) WITHOUT ROWID
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS city_daily_stats (
+                day TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0,
+                amount INTEGER NOT NULL DEFAULT 0,
+                tips_count INTEGER NOT NULL DEFAULT 0,
+                tips_amount INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+            """
+        )
+
         # Создание таблицы для транзакций
         cursor.execute(
             """
@@ -516,7 +812,43 @@ def init_db():
             conn.commit()
         except:
             pass
-        add_month_column()
+        for index_name, index_columns in INDEXES.items():
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {index_columns}"
+            )
+        conn.commit()
+        migrate_month_columns()
+        migrate_cities_checked()
+        # Счётчики статистики: при создании или изменении триггеров
+        # пересчитываем их по уже накопленной истории
+        cursor.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"
+        )
+        existing_triggers = {row[0]: row[1] for row in cursor.fetchall()}
+        # Триггер с другим текстом (счётчики поменялись) пересоздаём
+        outdated = False
+        for trigger_name, trigger_body in STAT_ROLLUP_TRIGGERS.items():
+            trigger_sql = f"CREATE TRIGGER {trigger_name} {trigger_body}"
+            if existing_triggers.get(trigger_name) != trigger_sql:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+                cursor.execute(trigger_sql)
+                outdated = True
+        if outdated:
+            rebuild_statistics_rollups()
+        # Лента задач: задачи, созданные до триггеров, переносим один раз
+        for trigger_name, trigger_body in PAID_TASK_TRIGGERS.items():
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {trigger_body}"
+            )
+        if not existing_triggers.keys() >= PAID_TASK_TRIGGERS.keys():
+            backfill_paid_tasks()
+        # Рассылки: статусы собираются из старой таблицы и журнала один раз
+        for trigger_name, trigger_body in BROADCAST_STATUS_TRIGGERS.items():
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {trigger_body}"
+            )
+        if not has_broadcast_statuses:
+            rebuild_broadcast_statuses()
         conn.commit()
 
 
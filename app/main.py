@@ -1,8 +1,24 @@
 # from a2wsgi import ASGIMiddleware
-from fastapi import FastAPI, Request
+import asyncio
+import json
+from contextlib import asynccontextmanager, suppress
+from typing import List, Optional
+
+from fastapi import (
+    BackgroundTasks,
+    Body,
+    Depends,
+    FastAPI,
+    Header,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.routing import APIRouter
 
 from app.api.endpoint import (
+    api_broadcast,
     api_city,
     api_competition,
     api_cover,
@@ -12,27 +28,60 @@ from app.api.endpoint import (
     api_stat,
     api_user,
 )
-from app.core.config import LoggingRoute
-from app.crud import db_loyalty
-from app.crud.db_city import (
-    add_task_city_transaction,
-    add_task_product_transaction,
-    check_signature,
-    del_task_city_transaction,
-    del_task_product_transaction,
-    get_all_task_city_transaction,
-    get_all_task_product_transaction,
-    get_transaction_type,
-    record_city_transaction,
-    # move_pre_transaction_to_transaction,
-    set_unlimited_city_compatibility,
-)
-from app.crud.db_loyalty import move_pre_transaction_to_transaction
+from app.api.dependencies import PageParams, request_unit_of_work
+from app.core.config import LoggingRoute, custom_logger, settings
+from app.core.database import get_pool_stats, outside_unit_of_work
+from app.core.metrics import db_metrics
+from app.crud import aio, db_payment
+from app.crud.db_city import check_signature
+from app.crud.db_paid_tasks import paid_task_signal
 from app.init import init_db
+from app.scheduler import job_scheduler
 
 init_db()
+
+
+async def flush_stat_counters_periodically():
+    while True:
+        await asyncio.sleep(settings.STAT_FLUSH_INTERVAL_MS / 1000)
+        try:
+            await aio.db_stat.flush_stat_counters()
+        except Exception:
+            # Инкременты остались в буфере, повторим на следующем тике
+            custom_logger.logger.exception("Stat counters flush failed")
+
+
+async def sync_cache_invalidations_periodically():
+    while True:
+        await asyncio.sleep(settings.CACHE_SYNC_INTERVAL)
+        try:
+            await aio.db_cache.sync_cache_invalidations()
+        except Exception:
+            custom_logger.logger.exception("Cache invalidation sync failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Курсор журнала сбросов ставится до прогрева кэша
+    await aio.db_cache.sync_cache_invalidations()
+    await aio.db_cover.preload_arcan_descriptions()
+    cache_syncer = asyncio.create_task(sync_cache_invalidations_periodically())
+    stat_flusher = asyncio.create_task(flush_stat_counters_periodically())
+    if settings.SCHEDULER_ENABLED:
+        job_scheduler.start()
+    yield
+    await job_scheduler.shutdown()
+    for task in (stat_flusher, cache_syncer):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await aio.db_stat.flush_stat_counters()
+
+
 # ook
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, dependencies=[Depends(request_unit_of_work)])
+# Маршруты самого приложения тоже пишут запись на запрос
+app.router.route_class = LoggingRoute
 router = APIRouter(route_class=LoggingRoute)
 
 app.include_router(api_user.router, prefix="/api/users", tags=["users"])
@@ -51,6 +100,9 @@ app.include_router(
 app.include_router(
     api_competition.router, prefix="/api/competition", tags=["competition"]
 )
+app.include_router(
+    api_broadcast.router, prefix="/api/broadcasts", tags=["broadcasts"]
+)
 app.include_router(router)
 
 
@@ -59,8 +111,27 @@ async def root():
     return {"message": "Welcome to the Telegram Bot Backend"}
 
 
+@app.get("/metrics")
+async def metrics(format: str = "prometheus"):
+    # Длительности CRUD-вызовов (гистограммы) и состояние пула соединений
+    if format == "json":
+        return {
+            "db_operations": db_metrics.snapshot(),
+            "pool": get_pool_stats(),
+        }
+    lines = db_metrics.render_prometheus()
+    lines.append("# TYPE db_pool gauge")
+    lines.extend(
+        f'db_pool{{metric="{name}"}} {value}'
+        for name, value in get_pool_stats().items()
+    )
+    return PlainTextResponse("\n".join(lines) + "\n")
+
+
 @app.get("/payment-notification")
-async def payment_notification(request: Request):
+async def payment_notification(
+    request: Request, background_tasks: BackgroundTasks
+):
     params = dict(request.query_params)
     signature_value = params.get("SignatureValue")
     out_sum = params.get("OutSum")
@@ -70,51 +141,128 @@ async def payment_notification(request: Request):
     # print("Received payment notification:", params)
 
     if check_signature(inv_id, signature_value, out_sum, shp_id):
-        transaction_type = get_transaction_type(inv_id)
-        if transaction_type == "city":
-            try:
-                set_unlimited_city_compatibility(shp_id)
-            except:
-                pass
-            try:
-                record_city_transaction(shp_id, out_sum, True)
-            except:
-                pass
-            try:
-                add_task_city_transaction(shp_id)
-            except:
-                pass
-        elif transaction_type == "product":
-            move_pre_transaction_to_transaction(inv_id)
-            add_task_product_transaction(inv_id, shp_id)
+        invoice = int(inv_id)
+        # Повтор уведомления по уже проведённому счёту
+        if db_payment.is_processed(invoice):
+            return f"OK{inv_id}"
+        try:
+            settled = await aio.db_payment.settle_payment(
+                invoice, shp_id, out_sum
+            )
+        except db_payment.UnknownInvoice:
+            custom_logger.logger.warning(
+                f"Payment notification for unknown invoice {inv_id}"
+            )
+            # Не OK: Робокасса повторит уведомление
+            return "UNKNOWN INVOICE"
+        if settled:
+            # Фоновые задачи выполняются после commit единицы работы
+            background_tasks.add_task(paid_task_signal.notify)
         return f"OK{inv_id}"
     else:
         return "BAD SIGNATURE"
 
 
 @app.get("/api/payment-task")
-async def payment_tasks():
-    return get_all_task_city_transaction()
+async def payment_tasks(response: Response, page: PageParams = Depends()):
+    tasks = await aio.db_city.get_all_task_city_transaction(
+        page.after_id, page.limit
+    )
+    return page.paginate(response, tasks)
 
 
 @app.get("/api/payment-task-product")
-async def payment_tasks_product():
-    return get_all_task_product_transaction()
+async def payment_tasks_product(
+    response: Response, page: PageParams = Depends()
+):
+    tasks = await aio.db_city.get_all_task_product_transaction(
+        page.after_id, page.limit
+    )
+    return page.paginate(response, tasks, key="id")
 
 
 @app.post("/api/payment-task/{user_id}")
 async def del_payment_task(user_id: int):
-    return del_task_city_transaction(user_id)
+    return await aio.db_city.del_task_city_transaction(user_id)
 
 
 @app.post("/api/payment-task-product/{inv_id}")
 async def del_payment_task_product(inv_id: int):
-    return del_task_product_transaction(inv_id)
+    return await aio.db_city.del_task_product_transaction(inv_id)
+
+
+@app.get("/api/paid-tasks")
+async def get_paid_tasks(
+    after: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    timeout: float = Query(25.0, ge=0, le=60),
+):
+    """Long-poll: задачи после курсора after, ждёт до timeout секунд.
+
+    Каждое чтение берёт соединение из пула и сразу отдаёт: ожидание не
+    держит соединение единицы работы запроса.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    with outside_unit_of_work():
+        tasks = await aio.db_paid_tasks.get_paid_tasks(after, limit)
+        while not tasks and loop.time() < deadline:
+            await paid_task_signal.wait(
+                min(deadline - loop.time(), settings.PAID_TASKS_POLL_INTERVAL)
+            )
+            tasks = await aio.db_paid_tasks.get_paid_tasks(after, limit)
+    return {"tasks": tasks, "cursor": tasks[-1]["seq"] if tasks else after}
+
+
+async def _paid_task_events(after: int, heartbeat: float):
+    idle = 0.0
+    while True:
+        tasks = await aio.db_paid_tasks.get_paid_tasks(after)
+        for task in tasks:
+            after = task["seq"]
+            yield (
+                f"id: {after}\nevent: task\n"
+                f"data: {json.dumps(task, default=str)}\n\n"
+            )
+        if tasks:
+            idle = 0.0
+            continue
+        await paid_task_signal.wait(settings.PAID_TASKS_POLL_INTERVAL)
+        idle += settings.PAID_TASKS_POLL_INTERVAL
+        if idle >= heartbeat:
+            # Комментарий SSE не даёт прокси закрыть простаивающее соединение
+            idle = 0.0
+            yield ": ping\n\n"
+
+
+@app.get("/api/paid-tasks/stream")
+async def stream_paid_tasks(
+    after: Optional[int] = Query(None, ge=0),
+    last_event_id: Optional[int] = Header(None, ge=0),
+    heartbeat: float = Query(15.0, ge=1, le=300),
+):
+    """Server-Sent Events: задача на событие, id события — её seq.
+
+    После переподключения EventSource сам присылает Last-Event-ID, и
+    лента продолжается с него.
+    """
+    cursor = after if after is not None else last_event_id or 0
+    return StreamingResponse(
+        _paid_task_events(cursor, heartbeat),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/paid-tasks/ack")
+async def ack_paid_tasks(seqs: List[int] = Body(..., embed=True)):
+    results = await aio.db_paid_tasks.ack_paid_tasks(seqs)
+    return {"status": "success", "results": results}
 
 
 @app.get("/api/transaction-by-id/{inv_id}")
 async def get_transaction_by_id(inv_id: int):
-    return db_loyalty.get_transaction_by_id(inv_id)
+    return await aio.db_loyalty.get_transaction_by_id(inv_id)
 
 
 # application = ASGIMiddleware(app, wait_time=5.0)
@@ -0,0 +1,182 @@
+"""Встроенный планировщик периодических задач.
+
+Планировщик запускается из lifespan в каждом воркере, но задачи выполняет
+только владелец аренды scheduler_lock: остальные воркеры пропускают
+запуск. Время последнего запуска хранится в scheduler_jobs, поэтому после
+рестарта или смены владельца пропущенный запуск выполняется один раз, если
+опоздание не больше SCHEDULER_MISFIRE_GRACE.
+"""
+
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+from app.core.config import custom_logger, settings
+from app.core.database import outside_unit_of_work
+from app.crud import aio
+
+# Задача -> (корутина, расписание в полях CronTrigger)
+JOBS: Dict[str, Tuple[Callable[[], Awaitable], Dict]] = {
+    # Итоги дня в every_day_stat и обнуление stat
+    "stat_rollover": (
+        lambda: aio.db_stat.clean_stat_and_put_today_date(),
+        {"hour": 0, "minute": 0},
+    ),
+    "burn_bonuses": (
+        lambda: aio.db_scheduler.burn_expired_bonuses(),
+        {"hour": 3, "minute": 0},
+    ),
+    "release_holds": (
+        lambda: aio.db_points.release_expired_holds(),
+        {"minute": "*"},
+    ),
+}
+
+OK = "ok"
+ERROR = "error"
+
+
+def _as_local(value: str) -> datetime:
+    # Время в базе — наивное локальное, как datetime.now()
+    return datetime.fromisoformat(value).astimezone()
+
+
+class JobScheduler:
+    def __init__(self, jobs: Dict[str, Tuple[Callable, Dict]]):
+        self.jobs = jobs
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4()}"
+        self.is_leader = False
+        self._scheduler: Optional[AsyncIOScheduler] = None
+
+    def _trigger(self, name: str, jitter: Optional[int] = None):
+        return CronTrigger(
+            **self.jobs[name][1],
+            timezone=settings.SCHEDULER_TIMEZONE,
+            jitter=jitter,
+        )
+
+    def start(self):
+        self._scheduler = AsyncIOScheduler(
+            timezone=settings.SCHEDULER_TIMEZONE,
+            job_defaults={
+                "coalesce": True,
+                "max_instances": 1,
+                "misfire_grace_time": settings.SCHEDULER_MISFIRE_GRACE,
+            },
+        )
+        for name in self.jobs:
+            self._scheduler.add_job(
+                self.run_job,
+                self._trigger(name, settings.SCHEDULER_JITTER),
+                args=(name,),
+                id=name,
+            )
+        self._scheduler.add_job(
+            self._heartbeat,
+            IntervalTrigger(seconds=settings.SCHEDULER_LEASE_SECONDS / 3),
+            id="heartbeat",
+            next_run_time=datetime.now().astimezone(),
+        )
+        self._scheduler.start()
+
+    async def shutdown(self):
+        if self._scheduler is None:
+            return
+        self._scheduler.shutdown(wait=False)
+        self._scheduler = None
+        if self.is_leader:
+            await aio.db_jobs.release_scheduler_lease(self.owner)
+            self.is_leader = False
+
+    async def _acquire(self) -> bool:
+        self.is_leader = await aio.db_jobs.acquire_scheduler_lease(
+            self.owner, settings.SCHEDULER_LEASE_SECONDS
+        )
+        return self.is_leader
+
+    async def _heartbeat(self):
+        was_leader = self.is_leader
+        if await self._acquire() and not was_leader:
+            custom_logger.logger.info(f"Scheduler lease taken by {self.owner}")
+            await self._catch_up()
+
+    async def _catch_up(self):
+        """Ставит на немедленный запуск задачи, пропустившие срок."""
+        now = datetime.now().astimezone()
+        for name in self.jobs:
+            last_run = await aio.db_jobs.get_last_run(name)
+            if last_run is None:
+                continue
+            # Следующий срок строго после прошлого запуска
+            due = self._trigger(name).get_next_fire_time(
+                None, _as_local(last_run) + timedelta(seconds=1)
+            )
+            if due is None or due > now:
+                continue
+            late = now - due
+            if late > timedelta(seconds=settings.SCHEDULER_MISFIRE_GRACE):
+                custom_logger.logger.warning(
+                    f"Scheduled job {name} missed {due}, too late to run"
+                )
+                continue
+            self._scheduler.add_job(
+                self.run_job,
+                args=(name,),
+                id=f"{name}:catch_up",
+                replace_existing=True,
+            )
+
+    async def run_job(self, name: str) -> Optional[str]:
+        """Выполняет задачу, если блокировка у этого воркера.
+
+        Возвращает итог запуска или None, если задачу выполняет другой
+        воркер. Задача, аренда и запись о запуске фиксируются своими
+        соединениями, даже при ручном запуске из запроса API: откат
+        единицы работы запроса их не отменяет.
+        """
+        with outside_unit_of_work():
+            if not await self._acquire():
+                return None
+            started_at = datetime.now()
+            start = time.perf_counter()
+            try:
+                await self.jobs[name][0]()
+            except Exception as e:
+                custom_logger.logger.exception(f"Scheduled job {name} failed")
+                status, error = ERROR, repr(e)
+            else:
+                status, error = OK, None
+            duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            await aio.db_jobs.record_job_run(
+                name, started_at, status, duration_ms, error
+            )
+            return status
+
+    def next_runs(self) -> Dict[str, Optional[datetime]]:
+        if self._scheduler is None:
+            return {name: None for name in self.jobs}
+        return {
+            name: getattr(self._scheduler.get_job(name), "next_run_time", None)
+            for name in self.jobs
+        }
+
+    async def get_jobs(self) -> List[Dict]:
+        runs = {row["name"]: row for row in await aio.db_jobs.get_jobs()}
+        return [
+            {
+                "name": name,
+                "next_run_at": next_run_at,
+                **runs.get(name, {}),
+            }
+            for name, next_run_at in self.next_runs().items()
+        ]
+
+
+job_scheduler = JobScheduler(JOBS)
@@ -0,0 +1,87 @@
+"""Keyset-пагинация для выборок «все строки».
+
+Вместо OFFSET страница продолжается с последнего ключа предыдущей:
+
+    sql, params = paginate_query(sql, params, "user_id", after_id, limit)
+
+Без after_id и limit запрос не меняется, поэтому старые вызовы работают
+как раньше. Следующая страница передаётся клиенту непрозрачным токеном
+(encode_cursor / decode_cursor).
+
+Если ключ не уникален, строки с одинаковым ключом на границе страниц
+разделяет tiebreak: курсор тогда — пара (ключ, tiebreak).
+"""
+
+import base64
+import binascii
+from typing import Any, Optional, Sequence, Tuple, Union
+
+Cursor = Union[int, Tuple[int, int]]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def paginate_query(
+    sql: str,
+    params: Sequence[Any] = (),
+    key: str = "user_id",
+    after_id: Optional[Cursor] = None,
+    limit: Optional[int] = None,
+    tiebreak: Optional[str] = None,
+) -> Tuple[str, tuple]:
+    if after_id is None and limit is None:
+        return sql, tuple(params)
+    # SQLite проталкивает условие по ключу внутрь подзапроса и идёт по индексу
+    sql = f"SELECT * FROM ({sql})"
+    params = tuple(params)
+    if isinstance(after_id, tuple) and tiebreak is not None:
+        sql += f" WHERE ({key}, {tiebreak}) > (?, ?)"
+        params = (*params, *after_id)
+    elif after_id is not None:
+        sql += f" WHERE {key} > ?"
+        params = (*params, _key_part(after_id))
+    sql += f" ORDER BY {key}"
+    if tiebreak is not None:
+        sql += f", {tiebreak}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = (*params, limit)
+    return sql, params
+
+
+def _key_part(after_id: Cursor) -> int:
+    return after_id[0] if isinstance(after_id, tuple) else after_id
+
+
+def next_after_id(
+    rows: Sequence[Any],
+    key: str,
+    limit: Optional[int],
+    tiebreak: Optional[str] = None,
+) -> Optional[Cursor]:
+    """Курсор следующей страницы или None, если страница последняя."""
+    if limit is None or len(rows) < limit:
+        return None
+    if tiebreak is not None:
+        return rows[-1][key], rows[-1][tiebreak]
+    return rows[-1][key]
+
+
+def encode_cursor(after_id: Cursor) -> str:
+    if isinstance(after_id, tuple):
+        after_id = ":".join(map(str, after_id))
+    return base64.urlsafe_b64encode(str(after_id).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    try:
+        parts = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        if len(parts) == 2:
+            return int(parts[0]), int(parts[1])
+        if len(parts) == 1:
+            return int(parts[0])
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        pass
+    raise InvalidCursor(cursor)
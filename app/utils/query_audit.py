@@ -0,0 +1,125 @@
+"""Аудит запросов из app/crud через EXPLAIN QUERY PLAN.
+
+Находит литералы SQL в вызовах execute()/executemany() и сообщает о тех,
+что читают таблицу полным сканом (SCAN без индекса).
+
+    python -m app.utils.query_audit [--db new_database.db]
+
+Код выхода 1, если найден хотя бы один полный скан.
+"""
+
+import argparse
+import ast
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional
+
+from app.core.config import settings
+
+CRUD_DIR = Path(__file__).resolve().parent.parent / "crud"
+SKIP_PREFIXES = ("PRAGMA", "ALTER", "CREATE", "DROP")
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?! USING (COVERING )?INDEX)")
+NAMED_PARAM = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+
+
+class QueryPlan(NamedTuple):
+    location: str
+    sql: str
+    scans: List[str]
+    error: Optional[str] = None
+
+
+def iter_crud_queries(crud_dir: Path = CRUD_DIR) -> Iterator[tuple]:
+    for path in sorted(crud_dir.glob("db_*.py")):
+        tree = ast.parse(path.read_text(encoding="utf-8"))
+        calls = sorted(
+            (node for node in ast.walk(tree) if isinstance(node, ast.Call)),
+            key=lambda node: node.lineno,
+        )
+        for node in calls:
+            if not (
+                isinstance(node.func, ast.Attribute)
+                and node.func.attr in ("execute", "executemany")
+                and node.args
+            ):
+                continue
+            query = node.args[0]
+            # execute(*paginate_query(sql, ...)): проверяем исходный запрос
+            if (
+                isinstance(query, ast.Starred)
+                and isinstance(query.value, ast.Call)
+                and getattr(query.value.func, "id", None) == "paginate_query"
+                and query.value.args
+            ):
+                query = query.value.args[0]
+            # f-строки с динамическими колонками проверить нельзя
+            if isinstance(query, ast.Constant) and isinstance(
+                query.value, str
+            ):
+                yield f"{path.name}:{node.lineno}", " ".join(
+                    query.value.split()
+                )
+
+
+def _null_params(sql: str):
+    # Запрос с :name-параметрами связывается словарём, с ? — списком
+    names = NAMED_PARAM.findall(sql)
+    if names and "?" not in sql:
+        return dict.fromkeys(names)
+    return [None] * sql.count("?")
+
+
+def explain(conn: sqlite3.Connection, location: str, sql: str) -> QueryPlan:
+    params = _null_params(sql)
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.Error as e:
+        return QueryPlan(location, sql, [], str(e))
+    tables = {
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )
+    }
+    scans = []
+    for row in rows:
+        match = FULL_SCAN.match(row[-1])
+        if match and match.group(1) in tables:
+            scans.append(row[-1])
+    return QueryPlan(location, sql, scans)
+
+
+def audit(database: str) -> List[QueryPlan]:
+    conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        return [
+            explain(conn, location, sql)
+            for location, sql in iter_crud_queries()
+            if not sql.upper().startswith(SKIP_PREFIXES)
+        ]
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=settings.DATABASE_PATH)
+    args = parser.parse_args()
+
+    plans = audit(args.db)
+    full_scans = [plan for plan in plans if plan.scans]
+    for plan in full_scans:
+        print(f"FULL SCAN  {plan.location}: {'; '.join(plan.scans)}")
+        print(f"           {plan.sql}")
+    for plan in plans:
+        if plan.error:
+            print(f"ERROR      {plan.location}: {plan.error}")
+            print(f"           {plan.sql}")
+    print(f"\n{len(plans)} queries checked, {len(full_scans)} with full scans")
+    sys.exit(1 if full_scans else 0)
+
+
+if __name__ == "__main__":
+    main()
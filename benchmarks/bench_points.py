@@ -0,0 +1,176 @@
+"""Пропускная способность и корректность списания баллов.
+
+Несколько потоков раундами списывают баллы у небольшого числа
+пользователей: сравниваются прежняя схема «прочитать баланс, затем
+UPDATE» и условный UPDATE ... RETURNING из app.crud.db_points, а также
+цикл hold -> confirm. Перед каждым раундом баланс сбрасывается до
+значения меньше workers × POINTS, поэтому потоки спорят за последние
+баллы. Печатает попыток списания в секунду, число успешных и сколько
+баллов ушло в минус (баланс ниже нуля — гонка проверки и записи).
+Завершается с ошибкой, если в минус ушли условный UPDATE или hold.
+
+    python -m benchmarks.bench_points --seconds 5 --workers 8 --users 2
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POINTS = 3
+# Попыток каждого потока за раунд
+ROUND_ATTEMPTS = 4
+# Сценарии, которые не должны уводить баланс в минус
+RACE_FREE = ("conditional", "hold+confirm")
+
+
+def legacy_deduct(user_id: int, points: int) -> bool:
+    # Прежняя реализация db_loyalty.deduct_points: проверка и запись врозь
+    from app.core.database import get_db_connection
+
+    with get_db_connection() as conn:
+        balance = conn.execute(
+            "SELECT balance FROM loyalty WHERE user_id = ?", (user_id,)
+        ).fetchone()["balance"]
+        if balance < points:
+            return False
+        conn.execute(
+            "UPDATE loyalty SET balance = balance - ? WHERE user_id = ?",
+            (points, user_id),
+        )
+        conn.commit()
+        return True
+
+
+def engine_deduct(user_id: int, points: int) -> bool:
+    from app.crud import db_points
+
+    return db_points.deduct_points(user_id, points)[0]
+
+
+def hold_and_confirm(user_id: int, points: int) -> bool:
+    from app.crud import db_points
+
+    hold_id, _ = db_points.hold_points(user_id, points)
+    return hold_id is not None and db_points.confirm_hold(hold_id)
+
+
+SCENARIOS = {
+    "read+update": legacy_deduct,
+    "conditional": engine_deduct,
+    "hold+confirm": hold_and_confirm,
+}
+
+
+def run_scenario(
+    deduct, seconds: float, workers: int, users: int, balance: int
+) -> dict:
+    from app.core.database import get_db_connection
+
+    counters = {"attempts": 0, "ok": 0, "errors": 0, "overdrawn": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+    deadline = time.monotonic() + seconds
+
+    def refill():
+        # Между раундами: учесть минус прошлого раунда и вернуть балансы
+        with get_db_connection() as conn:
+            counters["overdrawn"] += conn.execute(
+                "SELECT COALESCE(SUM(-balance), 0) FROM loyalty "
+                "WHERE balance < 0"
+            ).fetchone()[0]
+            conn.execute("DELETE FROM loyalty")
+            conn.executemany(
+                "INSERT INTO loyalty (user_id, balance) VALUES (?, ?)",
+                [(user_id, balance) for user_id in range(1, users + 1)],
+            )
+            conn.commit()
+        if time.monotonic() >= deadline:
+            stop.set()
+
+    barrier = threading.Barrier(workers, action=refill)
+
+    def worker():
+        attempts = ok = errors = 0
+        while True:
+            barrier.wait()
+            if stop.is_set():
+                break
+            for _ in range(ROUND_ATTEMPTS):
+                attempts += 1
+                try:
+                    ok += deduct(random.randint(1, users), POINTS)
+                except Exception:
+                    errors += 1
+        with lock:
+            counters["attempts"] += attempts
+            counters["ok"] += ok
+            counters["errors"] += errors
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counters["per_sec"] = round(counters["attempts"] / seconds, 1)
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--users", type=int, default=2)
+    # По умолчанию баланса хватает половине потоков на одно списание
+    parser.add_argument("--balance", type=int, default=None)
+    args = parser.parse_args()
+    if args.balance is None:
+        args.balance = POINTS * max(args.workers // 2, 1)
+
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault("ROBOKASSA_LOGIN", "bench")
+    for key in (
+        "ROBOKASSA_PASSWORD1",
+        "ROBOKASSA_PASSWORD2",
+        "ROBOKASSA_TEST_PASSWORD1",
+        "ROBOKASSA_TEST_PASSWORD2",
+        "SECRET_WORD",
+    ):
+        os.environ.setdefault(key, "bench")
+    os.environ["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+    os.environ["LOG_FILE"] = os.path.join(tmp, "bench.log")
+    sys.path.insert(0, ROOT)
+
+    from app.init import init_db
+
+    init_db()
+
+    print(
+        f"{'scenario':<14}{'calls/s':>10}{'ok':>8}"
+        f"{'errors':>8}{'overdrawn':>11}"
+    )
+    overdrawn = {}
+    for name, deduct in SCENARIOS.items():
+        result = run_scenario(
+            deduct, args.seconds, args.workers, args.users, args.balance
+        )
+        overdrawn[name] = result["overdrawn"]
+        print(
+            f"{name:<14}{result['per_sec']:>10}{result['ok']:>8}"
+            f"{result['errors']:>8}{result['overdrawn']:>11}"
+        )
+
+    if not overdrawn["read+update"]:
+        print("read+update did not overdraw: raise --workers to see the race")
+    broken = [name for name in RACE_FREE if overdrawn[name]]
+    if broken:
+        sys.exit(f"Overdrawn balance in {', '.join(broken)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Нагрузочное сравнение профилей движка SQLite.
+
+Запускает смешанную нагрузку чтения/записи на эндпоинты лояльности и городов
+через TestClient и печатает пропускную способность и число ошибок
+"database is locked" для стандартного rollback-журнала и для WAL-профиля.
+
+    python -m benchmarks.bench_sqlite_profile --seconds 5 --readers 8 --writers 4
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PROFILES = {
+    # Поведение SQLite по умолчанию; без ожидания блокировки, чтобы
+    # конфликты писателей были видны как "database is locked"
+    "rollback": {
+        "DB_JOURNAL_MODE": "DELETE",
+        "DB_SYNCHRONOUS": "FULL",
+        "DB_MMAP_SIZE": "0",
+        "DB_CACHE_SIZE": "-2000",
+        "DB_BUSY_TIMEOUT_MS": "0",
+        "DB_TEMP_STORE": "DEFAULT",
+    },
+    # Профиль по умолчанию из app.core.config
+    "wal": {},
+}
+
+USERS = 200
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_profile(seconds: float, readers: int, writers: int) -> dict:
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    client = TestClient(app, raise_server_exceptions=False)
+    for user_id in range(1, USERS + 1):
+        client.post("/api/loyalty/users/", json={"user_id": user_id})
+        client.post("/api/cities/users", json={"user_id": user_id})
+
+    counters = {"reads": 0, "writes": 0, "errors": 0}
+    read_latencies = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def reader():
+        while time.monotonic() < deadline:
+            user_id = random.randint(1, USERS)
+            started = time.perf_counter()
+            if random.random() < 0.5:
+                response = client.get(f"/api/loyalty/users/{user_id}/balance")
+            else:
+                response = client.get(f"/api/cities/has_free_try/{user_id}")
+            elapsed = time.perf_counter() - started
+            with lock:
+                read_latencies.append(elapsed)
+                counters[
+                    "reads" if response.status_code == 200 else "errors"
+                ] += 1
+
+    def writer():
+        while time.monotonic() < deadline:
+            user_id = random.randint(1, USERS)
+            if random.random() < 0.5:
+                response = client.put(
+                    f"/api/loyalty/users/{user_id}/balance",
+                    params={"points": 1},
+                )
+            else:
+                response = client.post(
+                    "/api/cities/checked_cities",
+                    json={
+                        "user_id": user_id,
+                        "city_name": f"city{random.randint(1, 50)}",
+                    },
+                )
+            with lock:
+                counters[
+                    "writes" if response.status_code == 200 else "errors"
+                ] += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counters["reads_per_sec"] = round(counters["reads"] / seconds, 1)
+    counters["writes_per_sec"] = round(counters["writes"] / seconds, 1)
+    read_latencies.sort()
+    for pct in (50, 99):
+        index = min(len(read_latencies) - 1, len(read_latencies) * pct // 100)
+        counters[f"read_p{pct}_ms"] = round(read_latencies[index] * 1000, 2)
+    return counters
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--profile", choices=PROFILES, default=None)
+    args = parser.parse_args()
+
+    if args.profile:
+        # Дочерний процесс: окружение уже настроено родителем
+        result = run_profile(args.seconds, args.readers, args.writers)
+        print(json.dumps(result))
+        return
+
+    print(
+        f"{'profile':<10}{'reads/s':>10}{'writes/s':>10}"
+        f"{'read p50':>10}{'read p99':>10}{'errors':>8}"
+    )
+    for name, overrides in PROFILES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ)
+            env.setdefault("ROBOKASSA_LOGIN", "bench")
+            for key in (
+                "ROBOKASSA_PASSWORD1",
+                "ROBOKASSA_PASSWORD2",
+                "ROBOKASSA_TEST_PASSWORD1",
+                "ROBOKASSA_TEST_PASSWORD2",
+                "SECRET_WORD",
+            ):
+                env.setdefault(key, "bench")
+            env["PYTHONPATH"] = ROOT
+            env["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+            env.update(overrides)
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "benchmarks.bench_sqlite_profile",
+                    "--profile",
+                    name,
+                    "--seconds",
+                    str(args.seconds),
+                    "--readers",
+                    str(args.readers),
+                    "--writers",
+                    str(args.writers),
+                ],
+                env=env,
+                cwd=tmp,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{name:<10}{result['reads_per_sec']:>10}"
+                f"{result['writes_per_sec']:>10}"
+                f"{result['read_p50_ms']:>10}{result['read_p99_ms']:>10}"
+                f"{result['errors']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import os
+import tempfile
+
+import pytest
+
+# До импорта приложения: init_db при импорте app.main не трогает рабочую базу
+os.environ.setdefault(
+    "DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "test.db")
+)
+
+from app.core import database  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.crud import db_invoice  # noqa: E402
+from app.crud.db_cache import sync_cursor  # noqa: E402
+from app.crud.db_cover import arcan_descriptions_cache  # noqa: E402
+from app.crud.db_payment import processed_invoices  # noqa: E402
+from app.crud.db_stat import stat_counters  # noqa: E402
+from app.crud.db_user import user_profiles  # noqa: E402
+from app.init import init_db  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def test_database(tmp_path, monkeypatch):
+    """Каждый тест работает со своей пустой базой во временном каталоге."""
+    path = str(tmp_path / "test.db")
+    test_pool = database.ConnectionPool(
+        path,
+        size=settings.DB_POOL_SIZE,
+        timeout=settings.DB_POOL_TIMEOUT,
+        health_check_interval=settings.DB_POOL_HEALTH_CHECK_INTERVAL,
+        pragmas=database.ENGINE_PRAGMAS,
+    )
+    monkeypatch.setattr(database, "DATABASE_PATH", path)
+    monkeypatch.setattr(database, "pool", test_pool)
+    monkeypatch.setattr(db_invoice, "pool", test_pool)
+    # Кэши и буферы процесса не должны переносить строки прошлой базы
+    for cache in (arcan_descriptions_cache, processed_invoices, user_profiles):
+        cache.clear()
+    stat_counters.discard()
+    sync_cursor.reset()
+    init_db()
+    yield path
+    test_pool.close()
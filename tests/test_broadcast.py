@@ -0,0 +1,128 @@
+from app.core.database import get_db_connection
+from app.init import init_db
+from app.main import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app)
+
+
+def test_record_broadcast_events_updates_statistics():
+    events = [
+        {
+            "user_id": user_id,
+            "broadcast_name": "autumn_sale",
+            "status": "failed" if user_id % 3 == 0 else "delivered",
+            "timestamp": "2026-10-01T12:00:00",
+        }
+        for user_id in range(1, 31)
+    ]
+    response = client.post("/api/broadcasts/events", json={"events": events})
+    assert response.json() == {"recorded": 30}
+    client.post(
+        "/api/broadcasts/mark_failed",
+        json={"user_id": 31, "broadcast_name": "autumn_sale"},
+    )
+
+    response = client.get("/api/broadcasts/statistics/autumn_sale")
+    assert response.json()[0] == {
+        "date": "2026-10-01",
+        "delivered": 20,
+        "failed": 10,
+    }
+    totals = client.get("/api/broadcasts/statistics").json()
+    assert (
+        sum(day["statistics"]["autumn_sale"]["failed"] for day in totals) == 11
+    )
+
+
+def test_create_broadcast_registers_name_once():
+    response = client.post(
+        "/api/broadcasts/create", json={"broadcast_name": "winter_sale"}
+    )
+    assert response.status_code == 200
+    response = client.post(
+        "/api/broadcasts/create", json={"broadcast_name": "winter_sale"}
+    )
+    assert response.status_code == 400
+
+    # Рассылка, известная по событиям, тоже считается созданной
+    client.post(
+        "/api/broadcasts/mark_delivered",
+        json={"user_id": 1, "broadcast_name": "spring_sale"},
+    )
+    response = client.post(
+        "/api/broadcasts/create", json={"broadcast_name": "spring_sale"}
+    )
+    assert response.status_code == 400
+
+
+def test_retry_counts_user_once_in_final_state():
+    client.post(
+        "/api/broadcasts/events",
+        json={
+            "events": [
+                {
+                    "user_id": 1,
+                    "broadcast_name": "retry_sale",
+                    "status": "failed",
+                    "timestamp": "2026-10-01T12:00:00",
+                },
+                {
+                    "user_id": 2,
+                    "broadcast_name": "retry_sale",
+                    "status": "delivered",
+                    "timestamp": "2026-10-01T12:00:00",
+                },
+            ]
+        },
+    )
+    # Повторная отправка дошла на следующий день; запоздавшее старое
+    # событие итог не меняет
+    for status, timestamp in (
+        ("delivered", "2026-10-02T09:00:00"),
+        ("failed", "2026-10-01T11:00:00"),
+    ):
+        client.post(
+            "/api/broadcasts/events",
+            json={
+                "events": [
+                    {
+                        "user_id": 1,
+                        "broadcast_name": "retry_sale",
+                        "status": status,
+                        "timestamp": timestamp,
+                    }
+                ]
+            },
+        )
+
+    response = client.get("/api/broadcasts/statistics/retry_sale")
+    assert response.json() == [
+        {"date": "2026-10-01", "delivered": 1, "failed": 0},
+        {"date": "2026-10-02", "delivered": 1, "failed": 0},
+    ]
+
+
+def test_legacy_broadcasts_table_is_backfilled():
+    with get_db_connection() as conn:
+        conn.execute("ALTER TABLE broadcasts ADD COLUMN created_at TIMESTAMP")
+        conn.execute("ALTER TABLE broadcasts ADD COLUMN old_sale BOOLEAN")
+        conn.executemany(
+            "INSERT INTO broadcasts (user_id, created_at, old_sale) "
+            "VALUES (?, '2024-05-01 10:00:00', ?)",
+            [(1, True), (2, True), (3, False)],
+        )
+        # База до появления итоговых статусов
+        conn.execute("DROP TABLE broadcast_statuses")
+        conn.commit()
+
+    init_db()
+
+    response = client.get("/api/broadcasts/statistics/old_sale")
+    assert response.json() == [
+        {"date": "2024-05-01", "delivered": 2, "failed": 1}
+    ]
+    response = client.post(
+        "/api/broadcasts/create", json={"broadcast_name": "old_sale"}
+    )
+    assert response.status_code == 400
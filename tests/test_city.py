@@ -0,0 +1,131 @@
+import asyncio
+import random
+import threading
+
+from app.core import database
+from app.core.database import transaction
+from app.crud import db_city
+from app.crud.db_paid_tasks import paid_task_signal
+from app.main import _paid_task_events, app
+from fastapi.testclient import TestClient
+
+client = TestClient(app)
+
+
+def test_get_last_transaction_id():
+    response = client.get("/api/cities/transactions/last")
+    assert response.status_code == 200
+    assert isinstance(response.json()["last_transaction_id"], int)
+
+
+def test_get_all_users_free_try_adds_missing_users():
+    user_id = random.randrange(1, 999999999, 1)
+    client.post(
+        "/api/users/",
+        json={"username": "cityuser", "user_id": user_id, "chat_id": user_id},
+    )
+    response = client.get(
+        "/api/cities/all-users-free-try", params={"all": True}
+    )
+    assert response.status_code == 200
+    users = {user["user_id"]: user for user in response.json()["users"]}
+    assert users[user_id]["have_free_try"] == 2
+
+
+def test_transaction_ids_come_from_shared_sequence():
+    city_id = client.post(
+        "/api/cities/transactions",
+        json={"user_id": 9301, "amount": 100, "type": "city"},
+    ).json()
+    product_id = client.post(
+        "/api/cities/transactions",
+        json={"user_id": 9301, "amount": 100, "type": "product"},
+    ).json()
+    assert isinstance(city_id, int)
+    assert product_id == city_id + 1
+
+
+def test_all_users_free_try_keyset_pages():
+    for user_id in (9601, 9602, 9603):
+        client.post("/api/cities/users", json={"user_id": user_id})
+
+    response = client.get(
+        "/api/cities/all-users-free-try",
+        params={"all": True, "after_id": 9600, "limit": 2},
+    )
+    assert [user["user_id"] for user in response.json()["users"]] == [
+        9601,
+        9602,
+    ]
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(
+        "/api/cities/all-users-free-try",
+        params={"all": True, "cursor": cursor, "limit": 2},
+    )
+    assert response.json()["users"][0]["user_id"] == 9603
+
+
+def test_checked_cities_are_unique_rows_with_counter():
+    client.post("/api/cities/users", json={"user_id": 9901})
+    before = client.get("/api/statistics/", params={"period": "today"})
+
+    for city_name in ("Казань", "Москва", "Казань"):
+        client.post(
+            "/api/cities/checked_cities",
+            json={"user_id": 9901, "city_name": city_name},
+        )
+
+    response = client.get("/api/cities/checked_cities/9901")
+    assert response.json() == ["Казань", "Москва"]
+    after = client.get("/api/statistics/", params={"period": "today"})
+    assert (
+        after.json()["checked_cities"]
+        == before.json()["checked_cities"] + 2
+    )
+
+
+def test_paid_tasks_feed_long_poll_and_ack():
+    cursor = client.get(
+        "/api/paid-tasks", params={"timeout": 0, "limit": 1000}
+    ).json()["cursor"]
+
+    in_use = []
+
+    def add_tasks():
+        # Ожидающий long-poll не держит соединение
+        in_use.append(database.pool.stats()["in_use"])
+        with transaction():
+            db_city.add_task_city_transaction(9961)
+            db_city.add_task_product_transaction(99610, 9961)
+        paid_task_signal.notify()
+
+    # Long-poll ждёт, пока не появятся задачи после курсора
+    threading.Timer(0.2, add_tasks).start()
+    page = client.get(
+        "/api/paid-tasks", params={"after": cursor, "timeout": 5}
+    ).json()
+    kinds = {task["kind"]: task for task in page["tasks"]}
+    assert kinds["product"]["task_id"] == 99610
+    assert page["cursor"] == page["tasks"][-1]["seq"]
+    assert in_use == [0]
+
+    # SSE отдаёт те же задачи, id события — seq
+    events = _paid_task_events(cursor, heartbeat=15)
+    first = asyncio.run(events.__anext__())
+    assert first.startswith(f"id: {page['tasks'][0]['seq']}\n")
+
+    seq = kinds["product"]["seq"]
+    results = client.post("/api/paid-tasks/ack", json={"seqs": [seq]}).json()
+    assert results["results"] == {str(seq): "acked"}
+    results = client.post("/api/paid-tasks/ack", json={"seqs": [seq]}).json()
+    assert results["results"] == {str(seq): "not_found"}
+    products = client.get("/api/payment-task-product").json()
+    assert all(task["id"] != 99610 for task in products)
+
+    # Удаление задачи старым эндпоинтом убирает её и из ленты
+    client.post("/api/payment-task/9961")
+    page = client.get(
+        "/api/paid-tasks", params={"after": cursor, "timeout": 0}
+    ).json()
+    assert page["tasks"] == []
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from app.main import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app)
+
+
+def _cache_stats():
+    response = client.get("/api/statistics/cache")
+    return response.json()["arcan_descriptions"]
+
+
+def test_arcan_description_cache_hits_and_invalidation():
+    month = datetime.now().strftime("%Y-%m")
+    client.post(
+        "/api/covers/arcan_descriptions",
+        json={"arcan": 21, "description": "Мир", "month": month},
+    )
+    assert client.get("/api/covers/arcan_descriptions/21").json() == "Мир"
+    hits = _cache_stats()["hits"]
+    assert client.get("/api/covers/arcan_descriptions/21").json() == "Мир"
+    assert _cache_stats()["hits"] == hits + 1
+
+    client.post(
+        "/api/covers/arcan_descriptions",
+        json={"arcan": 21, "description": "Мир, новый", "month": month},
+    )
+    response = client.get("/api/covers/arcan_descriptions/21")
+    assert response.json() == "Мир, новый"
+    descriptions = client.get("/api/covers/arcan_descriptions").json()
+    assert descriptions["21"]["description"] == "Мир, новый"
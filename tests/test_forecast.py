@@ -0,0 +1,83 @@
+from app.main import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app)
+
+
+def test_update_useful_sent_status_batch_reports_each_id():
+    for user_id in (9701, 9702):
+        client.post(
+            "/api/forecasts/users/", json={"user_id": user_id, "arcan": 5}
+        )
+
+    response = client.put(
+        "/api/scheduler/update_useful_sent_status_batch",
+        json={"user_ids": [9701, 9702, 9799]},
+    )
+    assert response.status_code == 200
+    assert response.json()["results"] == {
+        "9701": "updated",
+        "9702": "updated",
+        "9799": "not_found",
+    }
+    response = client.get("/api/forecasts/users/9702/useful_sent")
+    assert response.json() == {"useful_sent": 2}
+
+
+def test_update_forecast_status_batch_rejects_unknown_column():
+    response = client.put(
+        "/api/scheduler/update_forecast_status_batch/user_id; DROP",
+        json={"user_ids": [9701]},
+    )
+    assert response.status_code == 400
+
+
+def test_forecast_users_skip_users_already_sent_this_month():
+    from datetime import datetime
+
+    from app.crud.db_forecast import MONTHS
+
+    month = MONTHS[datetime.now().month - 1]
+    for user_id in (9711, 9712):
+        client.post(
+            "/api/forecasts/users/", json={"user_id": user_id, "arcan": 3}
+        )
+    client.put("/api/forecasts/users/9711/mark_sent")
+
+    response = client.get(
+        f"/api/scheduler/forecast_users/{month}",
+        params={"after_id": 9710, "limit": 2},
+    )
+    assert [user["user_id"] for user in response.json()] == [9712]
+
+
+def test_migrate_month_columns_moves_flags_to_deliveries():
+    from app.core.database import get_db_connection
+    from app.crud.db_forecast import forecast_month, migrate_month_columns
+
+    client.post("/api/forecasts/users/", json={"user_id": 9721, "arcan": 1})
+    with get_db_connection() as conn:
+        conn.execute(
+            "ALTER TABLE monthly_forecasts ADD COLUMN january_send BOOLEAN DEFAULT FALSE"
+        )
+        conn.execute(
+            "ALTER TABLE monthly_forecasts ADD COLUMN january_like BOOLEAN DEFAULT NULL"
+        )
+        conn.execute(
+            "UPDATE monthly_forecasts SET january_send = TRUE, january_like = TRUE WHERE user_id = 9721"
+        )
+        conn.commit()
+
+    migrate_month_columns()
+
+    with get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT sent, liked FROM forecast_deliveries WHERE user_id = ? AND month = ?",
+            (9721, forecast_month("january")),
+        ).fetchone()
+        columns = [
+            col[1]
+            for col in conn.execute("PRAGMA table_info(monthly_forecasts)")
+        ]
+    assert tuple(row) == (1, 1)
+    assert "january_send" not in columns
@@ -0,0 +1,27 @@
+import json
+import logging
+
+from app.core.config import JsonFormatter
+from app.main import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app)
+
+
+def test_request_record_carries_structured_timings(caplog):
+    with caplog.at_level(logging.INFO, logger="custom_logger"):
+        client.get("/api/statistics/all-count")
+
+    record = next(
+        r
+        for r in caplog.records
+        if getattr(r, "path", None) == "/api/statistics/all-count"
+    )
+    assert record.status == 200
+    assert record.db_calls == 1
+    assert record.duration_ms >= record.db_ms > 0
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["method"] == "GET"
+    assert entry["db_calls"] == 1
+    assert entry["level"] == "INFO"
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app.core.database import get_db_connection
+from app.crud import db_points
+from app.crud.db_invoice import allocate_invoice_id
+from app.crud.db_scheduler import BONUS_BURN_SERVICE
+from app.main import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app)
+
+
+def _user_with_balance(user_id: int, balance: int):
+    client.post("/api/loyalty/users/", json={"user_id": user_id})
+    client.put(
+        f"/api/loyalty/users/{user_id}/balance",
+        params={"points": balance, "no_transaction": True},
+    )
+
+
+def test_concurrent_deductions_never_overdraw():
+    _user_with_balance(9951, 100)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(
+            pool.map(lambda _: db_points.deduct_points(9951, 3), range(50))
+        )
+
+    assert sum(success for success, _ in results) == 33
+    assert client.get("/api/loyalty/users/9951/balance").json() == 1
+
+
+def test_hold_confirm_and_release():
+    _user_with_balance(9952, 100)
+
+    first = client.post(
+        "/api/loyalty/users/9952/holds", params={"points": 70}
+    ).json()
+    assert first["new_balance"] == 30
+    response = client.post(
+        "/api/loyalty/users/9952/holds", params={"points": 40}
+    )
+    assert response.status_code == 400
+
+    second = client.post(
+        "/api/loyalty/users/9952/holds", params={"points": 20}
+    ).json()
+    response = client.post(f"/api/loyalty/holds/{first['hold_id']}/confirm")
+    assert response.status_code == 200
+    released = client.post(f"/api/loyalty/holds/{second['hold_id']}/release")
+    assert released.json()["new_balance"] == 30
+
+    # Повторное подтверждение или возврат уже закрытого резерва — 409
+    response = client.post(f"/api/loyalty/holds/{first['hold_id']}/release")
+    assert response.status_code == 409
+    assert client.get("/api/loyalty/users/9952/balance").json() == 30
+
+
+def test_burn_expired_bonuses_fifo():
+    _user_with_balance(9953, 100)
+    now = datetime.now()
+    with get_db_connection() as conn:
+        conn.executemany(
+            """
+            INSERT INTO expiration_bonus_movement
+                (user_id, bonus, add_date, expire_date)
+            VALUES (9953, ?, ?, ?)
+            """,
+            [
+                (50, now - timedelta(days=10), now - timedelta(days=1)),
+                (30, now - timedelta(days=5), now + timedelta(days=5)),
+            ],
+        )
+        # Списание 20 приходится на обе партии, по FIFO — из первой
+        conn.execute(
+            """
+            INSERT INTO transactions
+                (id, user_id, amount, bonus, service, date)
+            VALUES (?, 9953, 0, -20, 'test', ?)
+            """,
+            (allocate_invoice_id(conn), now - timedelta(days=3)),
+        )
+        conn.commit()
+
+    before = client.get("/api/statistics/", params={"period": "all_time"})
+    summary = client.post("/api/scheduler/burn_expired_bonuses").json()
+    assert (summary["lots"], summary["users"], summary["burned"]) == (1, 1, 30)
+    assert client.get("/api/loyalty/users/9953/balance").json() == 70
+    with get_db_connection() as conn:
+        burns = conn.execute(
+            "SELECT bonus FROM transactions WHERE user_id = 9953 "
+            "AND service = ?",
+            (BONUS_BURN_SERVICE,),
+        ).fetchall()
+    assert [row["bonus"] for row in burns] == [-30]
+    # Сгорание — не покупка: статистика не меняется
+    after = client.get("/api/statistics/", params={"period": "all_time"})
+    assert after.json() == before.json()
+
+    summary = client.post("/api/scheduler/burn_expired_bonuses").json()
+    assert summary["lots"] == 0
+    assert client.get("/api/loyalty/users/9953/balance").json() == 70
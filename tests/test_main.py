@@ -1,5 +1,6 @@
 import random
 
+import pytest
 from app.main import app
 from fastapi.testclient import TestClient
 
@@ -152,3 +153,157 @@ def test_invalid_user_id():
 def test_invalid_period():
     response = client.get("/api/statistics/?period=invalid")
     assert response.status_code == 400
+
+
+def test_get_db_pool_stats():
+    client.get("/api/loyalty/users/123/balance")
+    client.get("/api/loyalty/users/123/balance")
+    response = client.get("/api/statistics/db-pool")
+    assert response.status_code == 200
+    pool = response.json()["pool"]
+    assert pool["reused"] > 0
+    assert pool["created"] <= pool["size"]
+
+
+def test_query_audit_hot_lookups_use_indexes():
+    from app.core.database import DATABASE_PATH
+    from app.utils.query_audit import audit
+
+    plans = {plan.sql: plan for plan in audit(DATABASE_PATH)}
+    for sql in (
+        "SELECT * FROM users WHERE user_id = ?",
+        "SELECT user_id FROM new_year_competition WHERE secret_link = ?",
+        "SELECT user_id FROM loyalty WHERE promo_code = ?",
+    ):
+        assert plans[sql].scans == []
+
+
+def _payment_notification(inv_id, out_sum, user_id, http=client):
+    import hashlib
+
+    from app.core.config import settings
+
+    signature = hashlib.md5(
+        f"{out_sum}:{inv_id}:{settings.ACTIVE_ROBOKASSA_PASSWORD2}"
+        f":Shp_id={user_id}".encode()
+    ).hexdigest()
+    return http.get(
+        "/payment-notification",
+        params={
+            "OutSum": out_sum,
+            "InvId": inv_id,
+            "Shp_id": user_id,
+            "SignatureValue": signature,
+        },
+    )
+
+
+def test_payment_notification_settles_product_invoice():
+    user_id = 9401
+    client.post("/api/loyalty/users/", json={"user_id": user_id})
+    inv_id = client.post(
+        "/api/cities/transactions",
+        json={
+            "user_id": user_id,
+            "amount": 300,
+            "type": "product",
+            "bonus": 30,
+        },
+    ).json()
+
+    response = _payment_notification(inv_id, 300, user_id)
+    assert response.json() == f"OK{inv_id}"
+    tasks = client.get("/api/payment-task-product").json()
+    assert {"id": inv_id, "user_id": user_id} in tasks
+    balance = client.get(f"/api/loyalty/users/{user_id}/balance").json()
+    assert balance == -30
+
+
+def test_payment_notification_retry_is_not_settled_twice():
+    from app.crud.db_payment import processed_invoices
+
+    user_id = 9402
+    client.post("/api/loyalty/users/", json={"user_id": user_id})
+    inv_id = client.post(
+        "/api/cities/transactions",
+        json={
+            "user_id": user_id,
+            "amount": 300,
+            "type": "product",
+            "bonus": 30,
+        },
+    ).json()
+
+    assert _payment_notification(inv_id, 300, user_id).json() == f"OK{inv_id}"
+    # Повтор из кэша и, после его сброса, из processed_invoices
+    assert _payment_notification(inv_id, 300, user_id).json() == f"OK{inv_id}"
+    processed_invoices.clear()
+    assert _payment_notification(inv_id, 300, user_id).json() == f"OK{inv_id}"
+
+    tasks = client.get("/api/payment-task-product").json()
+    assert tasks.count({"id": inv_id, "user_id": user_id}) == 1
+    balance = client.get(f"/api/loyalty/users/{user_id}/balance").json()
+    assert balance == -30
+
+
+def test_payment_notification_for_unknown_invoice_is_not_recorded():
+    from app.core.database import get_db_connection
+    from app.crud.db_payment import is_processed
+
+    inv_id = 987654
+    for _ in range(2):
+        response = _payment_notification(inv_id, 300, 9403)
+        assert response.json() == "UNKNOWN INVOICE"
+
+    assert not is_processed(inv_id)
+    with get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM processed_invoices WHERE inv_id = ?", (inv_id,)
+        ).fetchone()
+    assert row is None
+
+
+def test_payment_notification_fails_when_a_settlement_step_fails():
+    from app.core.database import get_db_connection
+    from app.crud import db_loyalty
+    from app.crud.db_payment import is_processed
+
+    user_id = 9404
+    client.post("/api/loyalty/users/", json={"user_id": user_id})
+    inv_id = client.post(
+        "/api/cities/transactions",
+        json={
+            "user_id": user_id,
+            "amount": 300,
+            "type": "product",
+            "bonus": 30,
+        },
+    ).json()
+
+    def broken_promo_code(*args, **kwargs):
+        raise RuntimeError("promo code generator is down")
+
+    failing_client = TestClient(app, raise_server_exceptions=False)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(db_loyalty, "get_promo_code", lambda *a, **kw: None)
+        patch.setattr(db_loyalty, "generate_promo_code", broken_promo_code)
+        response = _payment_notification(
+            inv_id, 300, user_id, failing_client
+        )
+    assert response.status_code == 500
+    assert not is_processed(inv_id)
+    with get_db_connection() as conn:
+        for table, column in (
+            ("processed_invoices", "inv_id"),
+            ("transactions", "id"),
+            ("task_product_transactions", "id"),
+        ):
+            row = conn.execute(
+                f"SELECT 1 FROM {table} WHERE {column} = ?", (inv_id,)
+            ).fetchone()
+            assert row is None, table
+
+    # Повтор Робокассы после исправления проводит счёт
+    response = _payment_notification(inv_id, 300, user_id)
+    assert response.json() == f"OK{inv_id}"
+    assert is_processed(inv_id)
@@ -0,0 +1,65 @@
+from app.core.database import get_db_connection
+from app.crud import db_jobs
+from app.main import app
+from app.scheduler import job_scheduler
+from fastapi.testclient import TestClient
+
+client = TestClient(app)
+
+
+def test_run_job_records_state_and_respects_lock():
+    response = client.post("/api/scheduler/jobs/release_holds/run")
+    assert response.json() == {"status": "ok"}
+
+    jobs = client.get("/api/scheduler/jobs").json()
+    assert jobs["leader"] is True
+    job = next(j for j in jobs["jobs"] if j["name"] == "release_holds")
+    assert job["runs"] == 1
+    assert job["last_status"] == "ok"
+
+    # Блокировка у другого воркера — этот задачу не выполняет
+    db_jobs.release_scheduler_lease(job_scheduler.owner)
+    assert db_jobs.acquire_scheduler_lease("other-worker", 60)
+    response = client.post("/api/scheduler/jobs/release_holds/run")
+    assert response.status_code == 409
+    db_jobs.release_scheduler_lease("other-worker")
+
+    response = client.post("/api/scheduler/jobs/unknown/run")
+    assert response.status_code == 404
+
+
+def test_failed_manual_run_is_recorded(monkeypatch):
+    async def failing_job():
+        # CRUD-функция откатывает своё соединение и падает
+        with get_db_connection() as conn:
+            conn.rollback()
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(job_scheduler.jobs, "failing", (failing_job, {}))
+    response = client.post("/api/scheduler/jobs/failing/run")
+    assert response.json() == {"status": "error"}
+
+    jobs = client.get("/api/scheduler/jobs").json()["jobs"]
+    job = next(j for j in jobs if j["name"] == "failing")
+    assert (job["runs"], job["last_error"]) == (1, "RuntimeError('boom')")
+    # Аренда, взятая при запуске, осталась у этого воркера
+    assert not db_jobs.acquire_scheduler_lease("other-worker", 60)
+
+
+def test_gift_users_pages_do_not_skip_duplicate_user_ids():
+    with get_db_connection() as conn:
+        conn.executemany(
+            "INSERT INTO gifts (user_id) VALUES (?)",
+            [(5,), (5,), (5,), (6,)],
+        )
+        conn.commit()
+
+    rows, params = [], {"limit": 2}
+    while True:
+        response = client.get("/api/scheduler/gift_users", params=params)
+        rows += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params = {"limit": 2, "cursor": cursor}
+    assert [row["user_id"] for row in rows] == [5, 5, 5, 6]
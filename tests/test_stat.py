@@ -0,0 +1,81 @@
+import pytest
+from app.core.database import unit_of_work
+from app.crud import db_city, db_stat
+from app.main import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app)
+
+
+def _services(stats):
+    return {name: (amount, count) for name, amount, count in stats["services"]}
+
+
+def test_statistics_rollups_follow_writes():
+    before = client.get("/api/statistics/", params={"period": "today"}).json()
+
+    client.post("/api/users/", json={"user_id": 9801, "chat_id": 9801})
+    db_city.record_city_transaction(9801, 300, True)
+
+    after = client.get("/api/statistics/", params={"period": "today"}).json()
+    assert after["new_users"] == before["new_users"] + 1
+    assert after["total_users"] == before["total_users"] + 1
+    assert after["bot_purchases"] == before["bot_purchases"] + 1
+    assert after["bot_amount"] == before["bot_amount"] + 300
+    amount, count = _services(before).get("Чаевые", (0, 0))
+    assert _services(after)["Чаевые"] == (amount + 30, count + 1)
+
+    # Пересчёт с нуля даёт те же счётчики, что накопили триггеры
+    db_stat.rebuild_statistics_rollups()
+    rebuilt = client.get("/api/statistics/", params={"period": "today"})
+    assert rebuilt.json() == after
+
+
+def test_stat_counters_are_buffered_and_flushed_on_read():
+    before = client.get("/api/statistics/all-count").json()["count"]
+    for counter_id in (9001, 9001, 9002):
+        client.post(f"/api/statistics/incriment-counter/{counter_id}")
+    assert db_stat.stat_counters._events == 3
+
+    after = client.get("/api/statistics/all-count").json()["count"]
+    assert after == before + 3
+    assert db_stat.stat_counters._events == 0
+
+
+def test_stat_counters_flush_survives_request_rollback():
+    with pytest.raises(RuntimeError):
+        with unit_of_work():
+            db_stat.incriment_stat_counter(9003)
+            db_stat.flush_stat_counters()
+            raise RuntimeError
+
+    assert db_stat.stat_counters._events == 0
+    assert client.get("/api/statistics/all-count").json()["count"] == 1
+
+
+def test_metrics_expose_db_latency_histograms():
+    client.get("/api/statistics/all-count")
+
+    metrics = client.get("/metrics", params={"format": "json"}).json()
+    assert metrics["db_operations"]["get_all_count"]["count"] >= 1
+    assert metrics["db_operations"]["get_all_count"]["errors"] == 0
+
+    text = client.get("/metrics").text
+    assert (
+        'db_operation_seconds_bucket{operation="get_all_count",le="0.0001"}'
+        in text
+    )
+    assert 'db_operation_seconds_count{operation="get_all_count"}' in text
+
+    # Сэмплы каждого семейства идут подряд под его # TYPE
+    families = [
+        line.split()[2] if line.startswith("#") else line.split("{")[0]
+        for line in text.splitlines()
+    ]
+    histogram = families.index("db_operation_seconds")
+    errors = families.index("db_operation_errors_total")
+    assert set(families[histogram + 1 : errors]) == {
+        "db_operation_seconds_bucket",
+        "db_operation_seconds_sum",
+        "db_operation_seconds_count",
+    }
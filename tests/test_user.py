@@ -0,0 +1,126 @@
+import json
+
+import pytest
+from app.core.cache import MISSING
+from app.core.database import get_db_connection, unit_of_work
+from app.crud import db_user
+from app.crud.db_cache import sync_cache_invalidations
+from app.crud.db_user import user_profiles
+from app.main import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app)
+
+
+def test_export_users_streams_ndjson_with_keyset():
+    for user_id in (9501, 9502, 9503):
+        client.post(
+            "/api/users/", json={"user_id": user_id, "chat_id": user_id}
+        )
+
+    response = client.get(
+        "/api/users/export", params={"after_id": 9500, "limit": 2}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["user_id"] for row in rows] == [9501, 9502]
+
+    response = client.get(
+        "/api/users/export",
+        params={"format": "csv", "after_id": 9502, "chunk_size": 1},
+    )
+    lines = response.text.splitlines()
+    assert lines[0] == "user_id,chat_id,username"
+    assert lines[1].startswith("9503,9503,")
+
+
+def test_profile_cache_is_invalidated_on_write():
+    client.post("/api/users/", json={"user_id": 9601, "chat_id": 9601})
+
+    response = client.get("/api/users/9601/profile")
+    assert response.status_code == 200
+    assert response.json()["arcan"] is None
+
+    client.put("/api/users/9601/arcan", json={"arcan": 7})
+    assert client.get("/api/users/9601/profile").json()["arcan"] == 7
+    assert client.get("/api/users/9601/arcan").json() == {"arcan": 7}
+
+    assert client.get("/api/users/9602/profile").status_code == 404
+
+
+def test_profile_cache_follows_writes_from_other_workers():
+    client.post("/api/users/", json={"user_id": 9611, "chat_id": 9611})
+    sync_cache_invalidations()
+    assert client.get("/api/users/9611/profile").json()["arcan"] is None
+
+    # Запись другого воркера: строка и журнал сбросов, без кэша процесса
+    with get_db_connection() as conn:
+        conn.execute("UPDATE users SET arcan = 5 WHERE user_id = 9611")
+        conn.execute(
+            "INSERT INTO cache_invalidations (cache, key) VALUES (?, ?)",
+            ("user_profiles", "9611"),
+        )
+        conn.commit()
+    assert client.get("/api/users/9611/profile").json()["arcan"] is None
+
+    assert sync_cache_invalidations() == 1
+    assert client.get("/api/users/9611/profile").json()["arcan"] == 5
+
+
+def test_rolled_back_unit_does_not_leak_into_profile_cache():
+    client.post("/api/users/", json={"user_id": 9621, "chat_id": 9621})
+    assert client.get("/api/users/9621/profile").json()["arcan"] is None
+
+    with pytest.raises(RuntimeError):
+        with unit_of_work():
+            db_user.set_arcan(9621, 3)
+            # Своя незафиксированная запись видна, но не кэшируется
+            assert db_user.get_user_profile(9621)["arcan"] == 3
+            raise RuntimeError
+
+    assert user_profiles.get(9621) is MISSING
+    assert client.get("/api/users/9621/profile").json()["arcan"] is None
+
+
+def test_snapshot_joins_subsystems_and_selects_fields():
+    client.post("/api/users/", json={"user_id": 9701, "chat_id": 9701})
+    client.post("/api/cities/users", json={"user_id": 9701})
+
+    snapshot = client.get("/api/users/9701/snapshot").json()
+    assert snapshot["user"]["chat_id"] == 9701
+    assert snapshot["loyalty"]["balance"] == 0
+    assert snapshot["city"]["have_free_try"] == 2
+    assert snapshot["cover"] is None
+
+    response = client.get(
+        "/api/users/9701/snapshot",
+        params={"fields": "loyalty.promo_code,city.have_free_try"},
+    )
+    assert set(response.json()) == {"user_id", "loyalty", "city"}
+    assert list(response.json()["loyalty"]) == ["promo_code"]
+
+    response = client.get(
+        "/api/users/9701/snapshot", params={"fields": "loyalty.nope"}
+    )
+    assert response.status_code == 400
+    assert client.get("/api/users/9702/snapshot").status_code == 404
+
+
+def _pool_checkouts():
+    return client.get("/api/statistics/db-pool").json()["pool"]["checkouts"]
+
+
+def test_request_uses_one_connection():
+    before = _pool_checkouts()
+    response = client.post(
+        "/api/users/", json={"user_id": 9611, "chat_id": 9611}
+    )
+    assert response.status_code == 200
+    assert _pool_checkouts() == before + 1
+
+    # async-эндпоинт: несколько вызовов run_db в одном запросе
+    before = _pool_checkouts()
+    client.post("/api/cities/users", json={"user_id": 9611})
+    assert _pool_checkouts() == before + 1
+    assert client.get("/api/users/9611/snapshot").json()["city"] is not None